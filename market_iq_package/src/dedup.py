@@ -0,0 +1,193 @@
+"""
+Near-duplicate detection for the Financial Knowledge Base.
+This module estimates the Jaccard similarity of texts with MinHash signatures and finds candidate pairs with
+locality-sensitive hashing, so repeated boilerplate is detected without comparing every pair of sections.
+"""
+
+import re
+import zlib
+import numpy as np
+
+# Largest 31-bit prime; keeps (a * x + b) within uint64 for 31-bit shingle hashes
+_PRIME = (1 << 31) - 1
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles.
+    
+    The fraction of equal positions in two signatures is an unbiased estimate of the
+    Jaccard similarity of the texts' shingle sets.
+    """
+    
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        """
+        Draw the hash permutations.
+        
+        Args:
+            num_perm (int): Signature length
+            shingle_size (int): Words per shingle
+            seed (int): Seed of the permutations; signatures are only comparable
+                between hashers with the same seed and num_perm
+        """
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+    
+    def shingles(self, text):
+        """
+        Return the set of word shingles of a text.
+        
+        Args:
+            text (str): Text to shingle
+            
+        Returns:
+            set: Space-joined runs of shingle_size lowercase words; texts shorter than
+                that form a single shingle
+        """
+        words = _WORD_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        return {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a text.
+        
+        Args:
+            text (str): Text to sign
+            
+        Returns:
+            numpy.ndarray: uint32 signature of length num_perm
+        """
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) & _PRIME for shingle in self.shingles(text)),
+                             dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def estimate_similarity(signature, other):
+    """
+    Estimate the Jaccard similarity of two texts from their signatures.
+    
+    Args:
+        signature (numpy.ndarray): MinHash signature
+        other (numpy.ndarray): MinHash signature from the same hasher
+        
+    Returns:
+        float: Fraction of equal signature positions
+    """
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hash index over MinHash signatures.
+    
+    Signatures are cut into bands; two texts become candidates when any band matches
+    exactly. With b bands of r rows, a pair of similarity s collides with probability
+    1 - (1 - s^r)^b, a steep curve around (1/b)^(1/r).
+    """
+    
+    def __init__(self, num_perm=128, bands=16):
+        """
+        Initialize an empty index.
+        
+        Args:
+            num_perm (int): Signature length
+            bands (int): Number of bands; must divide num_perm
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+    
+    def __len__(self):
+        return len(self._signatures)
+    
+    def _band_keys(self, signature, scope):
+        """Yield the bucket key of each band of a signature."""
+        for band in range(self.bands):
+            yield scope, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def add(self, key, signature, scope=None):
+        """
+        Add a signature to the index.
+        
+        Args:
+            key (hashable): Identifier returned by queries
+            signature (numpy.ndarray): MinHash signature
+            scope (hashable, optional): Only signatures with the same scope are compared
+        """
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature, scope)):
+            buckets.setdefault(band_key, []).append(key)
+    
+    def query(self, signature, threshold, scope=None):
+        """
+        Find the most similar indexed signature above a threshold.
+        
+        Args:
+            signature (numpy.ndarray): MinHash signature
+            threshold (float): Minimum estimated Jaccard similarity
+            scope (hashable, optional): Scope to search in
+            
+        Returns:
+            tuple: (key, similarity) of the best match, or None
+        """
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature, scope)):
+            candidates.update(buckets.get(band_key, ()))
+        
+        best = None
+        for key in candidates:
+            similarity = estimate_similarity(signature, self._signatures[key])
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+
+class NearDuplicateDetector:
+    """
+    Streaming near-duplicate detector: the first occurrence of a text is canonical and
+    later texts within the threshold are reported as duplicates of it.
+    """
+    
+    def __init__(self, threshold=0.8, num_perm=128, bands=16, shingle_size=5):
+        """
+        Initialize the detector.
+        
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity of shingle sets for
+                a text to count as a duplicate
+            num_perm (int): MinHash signature length
+            bands (int): LSH bands; the default 16 bands of 8 rows make pairs above
+                ~0.7 similarity likely candidates
+            shingle_size (int): Words per shingle
+        """
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.index = LSHIndex(num_perm=num_perm, bands=bands)
+    
+    def check(self, key, text, scope=None):
+        """
+        Check a text against the canonical texts seen so far.
+        
+        Args:
+            key (hashable): Identifier of the text
+            text (str): Text to check
+            scope (hashable, optional): Only texts with the same scope are compared
+            
+        Returns:
+            tuple: (canonical key, similarity) if the text is a near duplicate, otherwise
+                None after registering the text as canonical
+        """
+        signature = self.hasher.signature(text)
+        match = self.index.query(signature, self.threshold, scope)
+        if match is None:
+            self.index.add(key, signature, scope)
+        return match
@@ -21,6 +21,24 @@ kb_interface = KnowledgeBaseInterface(db_path)
 # Initialize NLP search integration
 nlp_integration = get_nlp_integration(db_path)
 
+# Optionally attach vector search. With MARKET_IQ_PRELOAD set (e.g. under gunicorn with
+# preload_app), the encoder and embeddings are loaded once here, before workers are forked,
+# and each worker warms the encoder up on its first search. Otherwise the encoder warms up
+# in the background right away.
+vector_kb = None
+# 'scan' streams embeddings from SQLite per query instead of keeping them in memory
+vector_index = os.environ.get('MARKET_IQ_VECTOR_INDEX', 'flat')
+if os.environ.get('MARKET_IQ_VECTOR_SEARCH', '').lower() in ('1', 'true', 'yes'):
+    from src.vector_kb import VectorKnowledgeBase
+    
+    vector_kb = VectorKnowledgeBase(db_path,
+                                    vector_store=os.environ.get('MARKET_IQ_VECTOR_STORE') or None,
+                                    encoder=os.environ.get('MARKET_IQ_ENCODER', 'transformer'))
+    if os.environ.get('MARKET_IQ_PRELOAD', '').lower() in ('1', 'true', 'yes'):
+        vector_kb.preload()
+    else:
+        vector_kb.warm_up()
+
 @app.route('/')
 def index():
     """Render the modern home page."""
@@ -140,6 +158,79 @@ def api_search():
         app.logger.error(f"Error in api_search: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/search/semantic', methods=['POST'])
+def api_semantic_search():
+    """
+    API endpoint for hybrid semantic and keyword search over document sections.
+    Serves keyword-only results until the encoder has warmed up.
+    """
+    if vector_kb is None:
+        return jsonify({'error': 'Vector search is not enabled'}), 503
+    
+    try:
+        data = request.get_json()
+        query = data.get('query', '')
+        
+        if not query:
+            return jsonify({'error': 'Query is required'}), 400
+        
+        search_args = dict(ticker=data.get('ticker'),
+                           doc_types=data.get('doc_types'),
+                           top_k=int(data.get('top_k', 10)))
+        
+        if vector_kb.is_ready:
+            results = vector_kb.hybrid_search(query, index=vector_index, **search_args)
+            mode = 'hybrid'
+        else:
+            vector_kb.warm_up()
+            results = vector_kb.keyword_search(query, **search_args)
+            mode = 'keyword'
+        
+        return jsonify({'query': query, 'mode': mode, 'results': results})
+        
+    except Exception as e:
+        app.logger.error(f"Error in api_semantic_search: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/batch', methods=['POST'])
+def api_search_batch():
+    """
+    API endpoint for running many semantic search queries in one pass, e.g. a screen
+    made of the suggested prompts for several companies.
+    """
+    if vector_kb is None:
+        return jsonify({'error': 'Vector search is not enabled'}), 503
+    
+    try:
+        data = request.get_json()
+        queries = data.get('queries', [])
+        
+        if not queries or not all(isinstance(query, str) and query for query in queries):
+            return jsonify({'error': 'A list of non-empty queries is required'}), 400
+        
+        results = vector_kb.semantic_search_many(queries,
+                                                 top_k=int(data.get('top_k', 5)),
+                                                 ticker=data.get('ticker'),
+                                                 doc_types=data.get('doc_types'),
+                                                 index=vector_index)
+        return jsonify({
+            'results': [{'query': query, 'results': query_results}
+                        for query, query_results in zip(queries, results)]
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Error in api_search_batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/status', methods=['GET'])
+def api_search_status():
+    """API endpoint reporting whether vector search is enabled, its encoder is ready and which embedding generation it serves."""
+    return jsonify({
+        'vector_search': vector_kb is not None,
+        'ready': vector_kb is not None and vector_kb.is_ready,
+        'generations': vector_kb.generation_status() if vector_kb is not None else []
+    })
+
 @app.route('/api/metrics', methods=['GET'])
 def api_metrics():
     """API endpoint for financial metrics."""
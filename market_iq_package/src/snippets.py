@@ -0,0 +1,248 @@
+"""
+Snippet and highlight engine for the Financial Knowledge Base.
+This module finds every query term in a text in one Aho-Corasick pass and picks the window densest in query terms.
+"""
+
+import re
+from collections import deque
+from functools import lru_cache
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton matching a set of terms case-insensitively in one pass.
+    
+    Matches must start at a word boundary, so 'tax' matches 'taxes' but not 'syntax'.
+    """
+    
+    def __init__(self, terms):
+        """
+        Build the automaton.
+        
+        Args:
+            terms (iterable): Terms to match
+        """
+        self.terms = [term.lower() for term in terms if term]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        
+        for index, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+        
+        # Breadth-first pass: each state's failure link is the longest proper suffix
+        # of its path that is also a path in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+    
+    def find(self, text):
+        """
+        Find all term occurrences in a text.
+        
+        Args:
+            text (str): Text to scan
+            
+        Returns:
+            list: (start, end, term index) of each match, ordered by end offset
+        """
+        matches = []
+        state = 0
+        goto, fail, output, terms = self._goto, self._fail, self._output, self.terms
+        for position, char in enumerate(text):
+            # Offsets refer to the original text, so lowercase one character at a time
+            for lowered in char.lower():
+                while state and lowered not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(lowered, 0)
+            for index in output[state]:
+                start = position + 1 - len(terms[index])
+                if start >= 0 and (start == 0 or not text[start - 1].isalnum()):
+                    matches.append((start, position + 1, index))
+        return matches
+
+
+def query_terms(query):
+    """
+    Extract the terms to highlight for a query: its words, plus the whole phrase.
+    
+    Args:
+        query (str): Search query
+        
+    Returns:
+        list: Unique lowercase terms, the phrase first when the query has several words
+    """
+    words = list(dict.fromkeys(word for word in _WORD_PATTERN.findall(query.lower()) if len(word) > 1))
+    if len(words) > 1:
+        phrase = ' '.join(_WORD_PATTERN.findall(query.lower()))
+        return [phrase] + words
+    return words
+
+
+@lru_cache(maxsize=256)
+def matcher_for_query(query):
+    """Return the (cached) TermMatcher for a query's terms."""
+    return TermMatcher(query_terms(query))
+
+
+def _merge(intervals):
+    """Merge overlapping (start, end) intervals sorted by start."""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def build_snippet(text, matcher, max_length=200):
+    """
+    Cut the window of a text that is densest in query terms.
+    
+    Windows are scored by the number of distinct terms they contain, then by the total
+    number of matches; a phrase match counts as all of its words. The chosen window is
+    centered on its matches and trimmed to word boundaries.
+    
+    Args:
+        text (str): Text to cut the snippet from, typically a section
+        matcher (TermMatcher): Matcher for the query terms
+        max_length (int): Maximum snippet length, excluding ellipses
+        
+    Returns:
+        dict: 'text' of the snippet and 'highlights', the [start, end] offsets of the
+            matched terms within it
+    """
+    matches = sorted(matcher.find(text))
+    weights = [len(term.split()) for term in matcher.terms]
+    
+    best = None
+    if matches:
+        # Slide a window over the matches, keeping per-term counts of the window
+        counts = {}
+        left = 0
+        for right, (_, end, index) in enumerate(matches):
+            counts[index] = counts.get(index, 0) + 1
+            while end - matches[left][0] > max_length:
+                left_index = matches[left][2]
+                counts[left_index] -= 1
+                if not counts[left_index]:
+                    del counts[left_index]
+                left += 1
+            score = (sum(weights[index] for index in counts), right - left + 1)
+            if best is None or score > best[0]:
+                best = (score, left, right)
+    
+    if best is None:
+        first, last = 0, 0
+        window_matches = []
+    else:
+        _, left, right = best
+        window_matches = matches[left:right + 1]
+        first = window_matches[0][0]
+        last = max(end for _, end, _ in window_matches)
+    
+    # Center the matched region in the window, then trim to word boundaries
+    padding = max(max_length - (last - first), 0) // 2
+    start = max(0, first - padding)
+    end = min(len(text), start + max_length)
+    start = max(0, min(start, end - max_length))
+    if start > 0:
+        space = text.find(' ', start, first)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(' ', last, end)
+        if space != -1:
+            end = space
+    
+    prefix = '...' if start > 0 else ''
+    snippet = prefix + text[start:end].strip() + ('...' if end < len(text) else '')
+    shift = len(prefix) - start - (len(text[start:end]) - len(text[start:end].lstrip()))
+    highlights = _merge((match_start + shift, match_end + shift)
+                        for match_start, match_end, _ in window_matches
+                        if match_start >= start and match_end <= end)
+    return {'text': snippet, 'highlights': highlights}
+
+
+def generate_snippet(text, query, max_length=200):
+    """
+    Cut the best snippet of a text for a query.
+    
+    Args:
+        text (str): Text to cut the snippet from
+        query (str): Search query
+        max_length (int): Maximum snippet length, excluding ellipses
+        
+    Returns:
+        dict: 'text' of the snippet and the [start, end] 'highlights' within it
+    """
+    return build_snippet(text or '', matcher_for_query(query), max_length)
+
+
+def parse_marked(text, tags):
+    """
+    Turn a snippet with highlight markers (e.g. from SQLite's snippet()) into plain
+    text and highlight offsets.
+    
+    Args:
+        text (str): Marked-up snippet
+        tags (tuple): Opening and closing markers used in the text
+        
+    Returns:
+        dict: 'text' of the snippet and the [start, end] 'highlights' within it
+    """
+    plain = []
+    highlights = []
+    length = 0
+    for position, piece in enumerate(text.split(tags[0])):
+        if position:
+            marked, _, rest = piece.partition(tags[1])
+            highlights.append([length, length + len(marked)])
+            plain.append(marked)
+            length += len(marked)
+            piece = rest
+        plain.append(piece)
+        length += len(piece)
+    return {'text': ''.join(plain), 'highlights': _merge(highlights)}
+
+
+def highlight(snippet, tags=('<mark>', '</mark>')):
+    """
+    Wrap the highlighted ranges of a snippet in markers.
+    
+    Args:
+        snippet (dict): Snippet as returned by build_snippet
+        tags (tuple): Opening and closing markers
+        
+    Returns:
+        str: Marked-up snippet text
+    """
+    text = snippet['text']
+    pieces = []
+    position = 0
+    for start, end in snippet['highlights']:
+        pieces.extend([text[position:start], tags[0], text[start:end], tags[1]])
+        position = end
+    pieces.append(text[position:])
+    return ''.join(pieces)
@@ -0,0 +1,162 @@
+"""
+Text processing utilities for the Financial Knowledge Base.
+This module splits filings into encoder-sized sections in a single streaming pass.
+"""
+
+import re
+
+# Section budget when the encoder reports no token limit
+DEFAULT_SECTION_TOKENS = 256
+
+_APPROXIMATE_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def approximate_token_spans(text):
+    """
+    Split text into word and punctuation tokens, as a stand-in for a model tokenizer.
+    
+    Args:
+        text (str): Text to tokenize
+        
+    Returns:
+        list: (start, end) character offsets of each token
+    """
+    return [match.span() for match in _APPROXIMATE_TOKEN_PATTERN.finditer(text)]
+
+
+def iter_paragraphs(content):
+    """
+    Yield the non-empty paragraphs of a text, separated by blank lines.
+    
+    Args:
+        content (str or iterable): Text, or an iterable of text chunks (e.g. a file
+            read in blocks), so a large body never has to be held in memory at once
+        
+    Yields:
+        str: Stripped paragraph text
+    """
+    chunks = [content] if isinstance(content, str) else content
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find('\n\n', start)
+            if end == -1:
+                break
+            paragraph = buffer[start:end].strip()
+            if paragraph:
+                yield paragraph
+            start = end + 2
+        buffer = buffer[start:]
+    
+    paragraph = buffer.strip()
+    if paragraph:
+        yield paragraph
+
+
+def _is_heading(paragraph):
+    """Whether a paragraph looks like a section heading."""
+    return paragraph.isupper() or (len(paragraph) < 100 and paragraph.endswith(':'))
+
+
+def _tail(parts, count):
+    """
+    Take the last tokens of a sequence of tokenized parts.
+    
+    Args:
+        parts (list): (text, spans) parts in order
+        count (int): Number of tokens to take
+        
+    Returns:
+        list: (text, spans) parts holding at most count tokens, offsets rebased
+    """
+    tail = []
+    for text, spans in reversed(parts):
+        if count <= 0:
+            break
+        if count < len(spans):
+            start = spans[len(spans) - count][0]
+            tail.append((text[start:], [(s - start, e - start) for s, e in spans[len(spans) - count:]]))
+            break
+        tail.append((text, spans))
+        count -= len(spans)
+    return tail[::-1]
+
+
+def _continued(title):
+    """Title of a section continuing the given one."""
+    return title if title.endswith(' (continued)') else f'{title} (continued)'
+
+
+def split_sections(content, title, token_spans=approximate_token_spans, max_tokens=DEFAULT_SECTION_TOKENS,
+                   overlap_tokens=32):
+    """
+    Split a document into sections that fit the encoder's token budget.
+    
+    Headings start new sections. Paragraphs are packed into a section until the next
+    one would exceed max_tokens; the continuation then starts with the last
+    overlap_tokens tokens of the previous section, so text near a boundary is embedded
+    with context. A paragraph longer than the budget is cut at token boundaries.
+    Every paragraph is tokenized once and sections are joined once, so the split runs
+    in linear time, and only the section being built is held in memory.
+    
+    Args:
+        content (str or iterable): Document text, or an iterable of text chunks
+        title (str): Document title, used for the first section
+        token_spans (callable): Tokenizer returning the (start, end) character offsets
+            of each token of a text
+        max_tokens (int): Maximum tokens per section
+        overlap_tokens (int): Tokens repeated at the start of a continued section
+        
+    Yields:
+        dict: Section with 'title' and 'content'
+    """
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    
+    section_title = title
+    parts = []      # (text, spans) of the current section
+    size = 0        # tokens in the current section
+    carried = 0     # leading parts repeated from the previous section
+    
+    for paragraph in iter_paragraphs(content):
+        if _is_heading(paragraph):
+            if len(parts) > carried:
+                yield {'title': section_title, 'content': '\n\n'.join(text for text, _ in parts)}
+            section_title = paragraph
+            parts, size, carried = [], 0, 0
+            continue
+        
+        spans = token_spans(paragraph)
+        
+        if len(spans) > max_tokens:
+            # Flush the current section, then cut the paragraph into overlapping windows
+            if len(parts) > carried:
+                yield {'title': section_title, 'content': '\n\n'.join(text for text, _ in parts)}
+                section_title = _continued(section_title)
+            step = max_tokens - overlap_tokens
+            start = 0
+            while True:
+                window = spans[start:start + max_tokens]
+                yield {'title': section_title, 'content': paragraph[window[0][0]:window[-1][1]]}
+                section_title = _continued(section_title)
+                if start + max_tokens >= len(spans):
+                    break
+                start += step
+            parts = _tail([(paragraph, spans)], overlap_tokens)
+            size, carried = sum(len(part_spans) for _, part_spans in parts), len(parts)
+            continue
+        
+        if size + len(spans) > max_tokens:
+            if len(parts) > carried:
+                yield {'title': section_title, 'content': '\n\n'.join(text for text, _ in parts)}
+                section_title = _continued(section_title)
+            # Keep the overlap, trimmed so that it still fits with this paragraph
+            parts = _tail(parts, min(overlap_tokens, max_tokens - len(spans)))
+            size, carried = sum(len(part_spans) for _, part_spans in parts), len(parts)
+        
+        parts.append((paragraph, spans))
+        size += len(spans)
+    
+    if len(parts) > carried:
+        yield {'title': section_title, 'content': '\n\n'.join(text for text, _ in parts)}
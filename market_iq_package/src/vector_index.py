@@ -0,0 +1,1700 @@
+"""
+Vector index structures for the Financial Knowledge Base.
+This module keeps embeddings resident in memory so semantic search can be scored with vectorized NumPy operations.
+"""
+
+import copy
+import heapq
+import json
+import itertools
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalize a vector or every row of a matrix.
+    
+    Args:
+        vectors (array-like): Vector or matrix of row vectors
+        
+    Returns:
+        numpy.ndarray: Normalized float32 copy of the input
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores, top_k):
+    """
+    Select the positions of the highest scores without sorting the whole array.
+    
+    Args:
+        scores (numpy.ndarray): One-dimensional score array
+        top_k (int): Number of positions to return
+        
+    Returns:
+        numpy.ndarray: Positions of the top_k scores, best first
+    """
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    if top_k < scores.size:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_indices_batch(scores, top_k):
+    """
+    Select the positions of the highest scores in every row of a score matrix.
+    
+    Args:
+        scores (numpy.ndarray): Two-dimensional score array, one row per query
+        top_k (int): Number of positions to return per row
+        
+    Returns:
+        numpy.ndarray: (rows, min(top_k, columns)) positions, best first in each row
+    """
+    count = min(max(top_k, 0), scores.shape[1])
+    if count == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    
+    if count < scores.shape[1]:
+        candidates = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def merge_top_k(results, top_k):
+    """
+    Merge ranked partial results into the overall best matches with a heap.
+    
+    Args:
+        results (list): (labels, scores) array pairs, each sorted best first
+        top_k (int): Number of results to return
+        
+    Returns:
+        tuple: (labels, scores) arrays of the best matches, best first
+    """
+    streams = [zip(scores.tolist(), labels.tolist()) for labels, scores in results]
+    best = list(itertools.islice(heapq.merge(*streams, key=lambda item: -item[0]), max(top_k, 0)))
+    return (np.array([label for _, label in best], dtype=np.int64),
+            np.array([score for score, _ in best], dtype=np.float32))
+
+
+class RunningTopK:
+    """
+    Best matches seen so far over a stream of scored blocks, in O(top_k) memory.
+    
+    Each block is cut to its own top_k with argpartition, and only those candidates
+    go through a min-heap of the overall best.
+    """
+    
+    def __init__(self, top_k):
+        """
+        Initialize an empty selection.
+        
+        Args:
+            top_k (int): Number of matches to keep
+        """
+        self.top_k = top_k
+        self._heap = []     # (score, sequence, label); the sequence keeps earlier rows ahead on ties
+        self._seen = 0
+    
+    def push(self, labels, scores):
+        """
+        Offer a block of scored rows.
+        
+        Args:
+            labels (numpy.ndarray): Label of each row
+            scores (numpy.ndarray): Score of each row
+        """
+        best = top_k_indices(scores, self.top_k)
+        for position, label, score in zip(best.tolist(), labels[best].tolist(), scores[best].tolist()):
+            item = (score, -(self._seen + position), label)
+            if len(self._heap) < self.top_k:
+                heapq.heappush(self._heap, item)
+            elif item > self._heap[0]:
+                heapq.heapreplace(self._heap, item)
+        self._seen += len(scores)
+    
+    def labels(self):
+        """Labels of the matches kept so far, in no particular order."""
+        return [label for _, _, label in self._heap]
+    
+    def result(self):
+        """
+        Return the selection.
+        
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        best = sorted(self._heap, reverse=True)
+        return (np.array([label for _, _, label in best], dtype=np.int64),
+                np.array([score for score, _, _ in best], dtype=np.float32))
+
+
+class FlatIndex:
+    """
+    Exact cosine-similarity index over a contiguous, pre-normalized float32 matrix.
+    
+    Each row carries an integer label (the embedding row id in SQLite). Vectors and
+    labels are swapped in as a single tuple so readers never see them out of step.
+    
+    An index wrapped around a read-only memory map keeps rows added later in a
+    separate in-memory tail, so appending never copies the mapped matrix.
+    """
+    
+    def __init__(self, dim):
+        """
+        Initialize an empty index.
+        
+        Args:
+            dim (int): Embedding dimension
+        """
+        self.dim = dim
+        # (matrix, labels, tail): labels cover the matrix rows followed by the tail rows
+        self._data = (np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64),
+                      np.empty((0, dim), dtype=np.float32))
+    
+    def __len__(self):
+        return len(self._data[1])
+    
+    @classmethod
+    def wrap(cls, labels, vectors):
+        """
+        Build an index over an existing normalized matrix without copying it.
+        
+        The matrix may be a read-only memory map; add() then appends to a tail array
+        and leaves the map in place.
+        
+        Args:
+            labels (numpy.ndarray): int64 label of each row
+            vectors (numpy.ndarray): Normalized float32 matrix
+            
+        Returns:
+            FlatIndex: Index sharing the given arrays
+        """
+        index = cls(vectors.shape[1])
+        index._data = (vectors, labels, np.empty((0, index.dim), dtype=np.float32))
+        return index
+    
+    @property
+    def vectors(self):
+        """numpy.ndarray: Normalized embedding matrix, one row per label; a tail is copied onto it."""
+        return self.reconstruct()
+    
+    @property
+    def labels(self):
+        """numpy.ndarray: Label of each matrix row."""
+        return self._data[1]
+    
+    def reconstruct(self, rows=None):
+        """
+        Return stored vectors.
+        
+        Args:
+            rows (array-like, optional): Row positions; all rows when omitted
+            
+        Returns:
+            numpy.ndarray: Normalized float32 vectors
+        """
+        vectors, _, tail = self._data
+        if not len(tail):
+            return vectors if rows is None else vectors[rows]
+        if rows is None:
+            return np.vstack([vectors, tail])
+        
+        rows = np.asarray(rows)
+        in_tail = rows >= len(vectors)
+        result = np.empty((len(rows), self.dim), dtype=np.float32)
+        result[~in_tail] = vectors[rows[~in_tail]]
+        result[in_tail] = tail[rows[in_tail] - len(vectors)]
+        return result
+    
+    def _score(self, queries):
+        """Score queries (a vector or a matrix of row vectors) against every row, tail included."""
+        vectors, _, tail = self._data
+        scores = vectors @ queries.T
+        if len(tail):
+            scores = np.concatenate([scores, tail @ queries.T], axis=0)
+        return scores.T
+    
+    def add(self, labels, vectors):
+        """
+        Append vectors to the index.
+        
+        Args:
+            labels (array-like): Integer label for each vector
+            vectors (array-like): Matrix of vectors, one row per label
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int64)
+        
+        current_vectors, current_labels, tail = self._data
+        if isinstance(current_vectors, np.memmap):
+            self._data = (current_vectors, np.concatenate([current_labels, labels]), np.vstack([tail, vectors]))
+        else:
+            self._data = (
+                np.ascontiguousarray(np.vstack([current_vectors, vectors])),
+                np.concatenate([current_labels, labels]),
+                tail
+            )
+    
+    def view(self, start, end):
+        """
+        Return an index over a contiguous range of rows, sharing this index's matrix.
+        
+        Tail rows in the range are copied into the view.
+        
+        Args:
+            start (int): First row
+            end (int): Row after the last one
+            
+        Returns:
+            FlatIndex: Index over rows start to end
+        """
+        vectors, labels = self._data[:2]
+        if end <= len(vectors):
+            return FlatIndex.wrap(labels[start:end], vectors[start:end])
+        return FlatIndex.wrap(labels[start:end], self.reconstruct(np.arange(start, end)))
+    
+    def search(self, query, top_k, rows=None):
+        """
+        Score every row against the query with a single matrix-vector product.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            rows (numpy.ndarray, optional): Restrict the search to these row positions
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        labels = self._data[1]
+        query = normalize_rows(query)
+        
+        if rows is None:
+            scores = self._score(query)
+            best = top_k_indices(scores, top_k)
+            return labels[best], scores[best]
+        
+        # Gather selective subsets; for broad ones a full product is cheaper than the copy
+        if len(rows) * 2 < len(labels):
+            scores = self.reconstruct(rows) @ query
+        else:
+            scores = self._score(query)[rows]
+        best = top_k_indices(scores, top_k)
+        return labels[rows[best]], scores[best]
+    
+    def search_batch(self, queries, top_k, rows=None):
+        """
+        Score many queries at once with a single matrix-matrix product.
+        
+        Args:
+            queries (array-like): Query embeddings, one row per query
+            top_k (int): Number of results to return per query
+            rows (numpy.ndarray, optional): Restrict the search to these row positions
+            
+        Returns:
+            tuple: (labels, scores) arrays of shape (queries, top_k), best first per query
+        """
+        labels = self._data[1]
+        queries = normalize_rows(queries).reshape(-1, self.dim)
+        
+        if rows is None:
+            scores = self._score(queries)
+            best = top_k_indices_batch(scores, top_k)
+            return labels[best], np.take_along_axis(scores, best, axis=1)
+        
+        if len(rows) * 2 < len(labels):
+            scores = queries @ self.reconstruct(rows).T
+        else:
+            scores = self._score(queries)[:, rows]
+        best = top_k_indices_batch(scores, top_k)
+        return labels[rows[best]], np.take_along_axis(scores, best, axis=1)
+
+
+class ScalarQuantizer:
+    """
+    Compresses vectors dimension by dimension, either to float16 or to 8-bit codes
+    with a per-dimension scale and offset learned from the training data.
+    """
+    
+    CODECS = ('int8', 'float16')
+    
+    def __init__(self, dim, codec='int8'):
+        """
+        Initialize an untrained quantizer.
+        
+        Args:
+            dim (int): Embedding dimension
+            codec (str): 'int8' or 'float16'
+        """
+        if codec not in self.CODECS:
+            raise ValueError(f"Unknown scalar codec '{codec}'")
+        
+        self.dim = dim
+        self.codec = codec
+        self.scale = None
+        self.offset = None
+        self.high = None
+    
+    @property
+    def is_trained(self):
+        return self.codec == 'float16' or self.scale is not None
+    
+    @property
+    def code_dtype(self):
+        return np.uint8 if self.codec == 'int8' else np.float16
+    
+    def train(self, vectors):
+        """
+        Learn the per-dimension range of the data (int8 only).
+        
+        Args:
+            vectors (numpy.ndarray): Training vectors
+        """
+        if self.codec == 'int8':
+            low = vectors.min(axis=0)
+            high = vectors.max(axis=0)
+            scale = (high - low) / 255.0
+            scale[scale == 0] = 1.0
+            self.offset = low.astype(np.float32)
+            self.scale = scale.astype(np.float32)
+            self.high = high.astype(np.float32)
+    
+    def covers(self, vectors):
+        """
+        Check whether vectors fall inside the trained range (always true for float16).
+        
+        Args:
+            vectors (numpy.ndarray): Vectors to check
+            
+        Returns:
+            bool: True when encoding them clips no dimension
+        """
+        if self.codec == 'float16' or not len(vectors):
+            return True
+        return bool((vectors.min(axis=0) >= self.offset).all()
+                    and (vectors.max(axis=0) <= self.high).all())
+    
+    def widened(self, vectors):
+        """
+        Return a new int8 quantizer whose range spans both the trained range and vectors.
+        
+        Args:
+            vectors (numpy.ndarray): Vectors the new range must include
+            
+        Returns:
+            ScalarQuantizer: Trained quantizer; this one is left unchanged
+        """
+        quantizer = ScalarQuantizer(self.dim, self.codec)
+        quantizer.train(np.vstack([vectors, self.offset, self.high]))
+        return quantizer
+    
+    def encode(self, vectors):
+        """
+        Compress float32 vectors.
+        
+        Args:
+            vectors (numpy.ndarray): Vectors to compress
+            
+        Returns:
+            numpy.ndarray: uint8 or float16 codes with the same shape
+        """
+        if self.codec == 'float16':
+            return vectors.astype(np.float16)
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, 255).astype(np.uint8)
+    
+    def decode(self, codes):
+        """
+        Reconstruct approximate float32 vectors from codes.
+        
+        Args:
+            codes (numpy.ndarray): Codes produced by encode()
+            
+        Returns:
+            numpy.ndarray: Approximate vectors
+        """
+        if self.codec == 'float16':
+            return codes.astype(np.float32)
+        return codes.astype(np.float32) * self.scale + self.offset
+    
+    def score(self, codes, query):
+        """
+        Inner products between queries and encoded vectors, computed without
+        materializing the decoded matrix: (c * scale + offset) . q = c . (scale * q) + offset . q
+        
+        Args:
+            codes (numpy.ndarray): Encoded vectors
+            query (numpy.ndarray): Float32 query vector, or a matrix with one query per row
+            
+        Returns:
+            numpy.ndarray: Approximate scores, one per code row (one column per query
+                for a query matrix)
+        """
+        if self.codec == 'float16':
+            return codes.astype(np.float32) @ query.T
+        return codes.astype(np.float32) @ (self.scale * query).T + self.offset @ query.T
+
+
+class ScalarQuantizedIndex:
+    """
+    Compact resident index that keeps int8 or float16 codes instead of float32 vectors.
+    
+    Scores are approximate; callers rescore the returned candidates against the
+    full-precision vectors kept in SQLite.
+    
+    The int8 range is learned from the data: until min_train_rows vectors have been
+    added they are kept at full precision and the quantizer is retrained on all of
+    them with every batch, and a later batch outside the trained range widens it and
+    re-encodes the existing codes, so a small first load does not clip later rows.
+    """
+    
+    def __init__(self, dim, codec='int8', block_size=65536, min_train_rows=4096):
+        """
+        Initialize an empty index.
+        
+        Args:
+            dim (int): Embedding dimension
+            codec (str): 'int8' or 'float16'
+            block_size (int): Rows decoded at a time while scoring, bounding scratch memory
+            min_train_rows (int): Vectors kept at full precision for retraining the int8 range
+        """
+        self.dim = dim
+        self.block_size = block_size
+        self.min_train_rows = min_train_rows
+        self.quantizer = ScalarQuantizer(dim, codec)
+        self._data = (np.empty((0, dim), dtype=self.quantizer.code_dtype), np.empty(0, dtype=np.int64))
+        # Full-precision vectors of every row while the index is below min_train_rows
+        self._sample = np.empty((0, dim), dtype=np.float32) if codec == 'int8' else None
+    
+    def __len__(self):
+        return len(self._data[1])
+    
+    @property
+    def labels(self):
+        """numpy.ndarray: Label of each code row."""
+        return self._data[1]
+    
+    @property
+    def codes(self):
+        """numpy.ndarray: Encoded vectors, one row per label."""
+        return self._data[0]
+    
+    def reconstruct(self, rows=None):
+        """
+        Decode stored vectors.
+        
+        Args:
+            rows (array-like, optional): Row positions; all rows when omitted
+            
+        Returns:
+            numpy.ndarray: Approximate float32 vectors
+        """
+        codes = self._data[0]
+        return self.quantizer.decode(codes if rows is None else codes[rows])
+    
+    def add(self, labels, vectors):
+        """
+        Encode and append vectors, retraining the quantizer when the index is still
+        small or the vectors fall outside its range.
+        
+        A retrained quantizer replaces the current one instead of being updated in
+        place, so copies and views of this index keep decoding their own codes.
+        
+        Args:
+            labels (array-like): Integer label for each vector
+            vectors (array-like): Matrix of vectors, one row per label
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int64)
+        current_codes, current_labels = self._data
+        
+        if self._sample is not None:
+            sample = np.vstack([self._sample, vectors])
+            self.quantizer = ScalarQuantizer(self.dim, self.quantizer.codec)
+            self.quantizer.train(sample)
+            codes = self.quantizer.encode(sample)
+            self._sample = sample if len(sample) < self.min_train_rows else None
+        elif not self.quantizer.covers(vectors):
+            quantizer = self.quantizer.widened(vectors)
+            codes = np.empty((len(current_codes) + len(vectors), self.dim), dtype=quantizer.code_dtype)
+            for start in range(0, len(current_codes), self.block_size):
+                block = current_codes[start:start + self.block_size]
+                codes[start:start + len(block)] = quantizer.encode(self.quantizer.decode(block))
+            codes[len(current_codes):] = quantizer.encode(vectors)
+            self.quantizer = quantizer
+        else:
+            codes = np.vstack([current_codes, self.quantizer.encode(vectors)])
+        
+        self._data = (np.ascontiguousarray(codes), np.concatenate([current_labels, labels]))
+    
+    def view(self, start, end):
+        """
+        Return an index over a contiguous range of rows, sharing this index's arrays
+        and quantizer.
+        
+        Args:
+            start (int): First row
+            end (int): Row after the last one
+            
+        Returns:
+            ScalarQuantizedIndex: Index over rows start to end
+        """
+        codes, labels = self._data
+        index = ScalarQuantizedIndex(self.dim, codec=self.quantizer.codec, block_size=self.block_size,
+                                     min_train_rows=self.min_train_rows)
+        index.quantizer = self.quantizer
+        index._data = (codes[start:end], labels[start:end])
+        index._sample = None
+        return index
+    
+    def search(self, query, top_k, rows=None):
+        """
+        Scan the codes block by block for the best approximate matches.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            rows (numpy.ndarray, optional): Restrict the search to these row positions
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        codes, labels = self._data
+        query = normalize_rows(query)
+        if rows is None:
+            rows = np.arange(len(labels))
+        
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            scores[start:start + len(block)] = self.quantizer.score(codes[block], query)
+        
+        best = top_k_indices(scores, top_k)
+        return labels[rows[best]], scores[best]
+    
+    def search_batch(self, queries, top_k, rows=None):
+        """
+        Scan the codes block by block, scoring all queries against each block at once.
+        
+        Args:
+            queries (array-like): Query embeddings, one row per query
+            top_k (int): Number of results to return per query
+            rows (numpy.ndarray, optional): Restrict the search to these row positions
+            
+        Returns:
+            tuple: (labels, scores) arrays of shape (queries, top_k), best first per query
+        """
+        codes, labels = self._data
+        queries = normalize_rows(queries).reshape(-1, self.dim)
+        if rows is None:
+            rows = np.arange(len(labels))
+        
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            scores[:, start:start + len(block)] = self.quantizer.score(codes[block], queries).T
+        
+        best = top_k_indices_batch(scores, top_k)
+        return labels[rows[best]], np.take_along_axis(scores, best, axis=1)
+
+
+class ShardedIndex:
+    """
+    Exact index over a matrix whose rows are grouped by a partition key (e.g. ticker
+    or filing year), split into shards searched in parallel.
+    
+    Keys are packed into shards of at most shard_size rows in row order, so small keys
+    share a shard and a key larger than that is split across several. Every shard is a
+    view of a contiguous range of the matrix: nothing is copied, a query scoped to one
+    key scans its shard without gathering rows, and a whole-corpus query runs one
+    matrix-vector product per shard on a thread pool (NumPy releases the GIL) and
+    merges the per-shard top-k with a heap. Rows appended to the matrix are packed
+    into shards of their own.
+    """
+    
+    def __init__(self, index, keys, shard_size=100000):
+        """
+        Partition an index.
+        
+        Args:
+            index (FlatIndex or ScalarQuantizedIndex): Index to partition; it is not modified
+            keys (numpy.ndarray): Integer partition key of each index row; rows with the
+                same key should be adjacent
+            shard_size (int): Maximum rows per shard
+        """
+        self.shard_size = shard_size
+        self.shards = []        # (index view, first row, end row) per shard
+        self._key_shards = {}   # key -> shard numbers holding it
+        self._add_rows(index, np.asarray(keys), 0)
+    
+    def __len__(self):
+        return self.shards[-1][2] if self.shards else 0
+    
+    def extended(self, index, keys):
+        """
+        Return shards over an index that has had rows appended, leaving these untouched.
+        
+        Existing shards become views of the same ranges of the new index, and the
+        appended rows are packed into new shards.
+        
+        Args:
+            index (FlatIndex or ScalarQuantizedIndex): The extended index
+            keys (numpy.ndarray): Partition key of each appended row
+            
+        Returns:
+            ShardedIndex: Shards over all rows of index
+        """
+        sharded_index = copy.copy(self)
+        sharded_index.shards = [(index.view(start, end), start, end) for _, start, end in self.shards]
+        sharded_index._key_shards = {key: list(shards) for key, shards in self._key_shards.items()}
+        sharded_index._add_rows(index, np.asarray(keys), len(self))
+        return sharded_index
+    
+    def _add_rows(self, index, keys, offset):
+        """Pack the rows from offset on, keyed by keys, into new shards."""
+        if not len(keys):
+            return
+        
+        # Runs of adjacent rows sharing a key
+        starts = [0] + (np.flatnonzero(keys[1:] != keys[:-1]) + 1).tolist()
+        bounds = starts + [len(keys)]
+        
+        shard_start = 0
+        pending_keys = []
+        for key, start, end in zip(keys[starts].tolist(), bounds[:-1], bounds[1:]):
+            for part_start in range(start, end, self.shard_size):
+                part_end = min(part_start + self.shard_size, end)
+                if pending_keys and part_end - shard_start > self.shard_size:
+                    self._add_shard(index, offset + shard_start, offset + part_start, pending_keys)
+                    pending_keys = []
+                if not pending_keys:
+                    shard_start = part_start
+                pending_keys.append(key)
+        self._add_shard(index, offset + shard_start, offset + len(keys), pending_keys)
+    
+    def _add_shard(self, index, start, end, keys):
+        """Add a shard viewing rows start to end, holding the given keys."""
+        for key in set(keys):
+            self._key_shards.setdefault(key, []).append(len(self.shards))
+        self.shards.append((index.view(start, end), start, end))
+    
+    def shards_for(self, keys):
+        """
+        Find the shards holding any of the given keys.
+        
+        Args:
+            keys (iterable): Partition keys
+            
+        Returns:
+            list: Sorted shard numbers
+        """
+        return sorted({shard for key in keys for shard in self._key_shards.get(key, ())})
+    
+    def _search_shard(self, shard, query, top_k, rows):
+        """Search one shard, restricted to the given rows."""
+        index, start, end = self.shards[shard]
+        if rows is not None:
+            local = rows[np.searchsorted(rows, start):np.searchsorted(rows, end)] - start
+            if not len(local):
+                return None
+            if len(local) < end - start:
+                return index.search(query, top_k, rows=local)
+        return index.search(query, top_k)
+    
+    def search(self, query, top_k, rows=None, shards=None, executor=None):
+        """
+        Search the shards and merge their results.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            rows (numpy.ndarray, optional): Restrict the search to these sorted row
+                positions of the partitioned index
+            shards (list, optional): Shard numbers to search; all when omitted
+            executor (concurrent.futures.Executor, optional): Pool to search shards on
+                in parallel; shards are searched in turn when omitted
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        shards = range(len(self.shards)) if shards is None else shards
+        query = normalize_rows(query)
+        
+        if executor is not None and len(shards) > 1:
+            results = list(executor.map(lambda shard: self._search_shard(shard, query, top_k, rows), shards))
+        else:
+            results = [self._search_shard(shard, query, top_k, rows) for shard in shards]
+        
+        results = [result for result in results if result is not None]
+        if len(results) == 1:
+            return results[0]
+        return merge_top_k(results, top_k)
+
+
+class CategoricalColumn:
+    """
+    Integer-coded categorical attribute of index rows (e.g. ticker or doc_type).
+    
+    The rows holding each value are partitioned lazily on first use, so a filter
+    only touches the rows that match it.
+    """
+    
+    def __init__(self, values=()):
+        """
+        Build a column from one value per row.
+        
+        Args:
+            values (iterable): Row values
+        """
+        self.vocabulary = []
+        self._codes_by_value = {}
+        self._partitions = None
+        self.codes = self._encode(values)
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    @classmethod
+    def from_codes(cls, codes, vocabulary):
+        """
+        Build a column from existing integer codes.
+        
+        Args:
+            codes (numpy.ndarray): int32 code of each row
+            vocabulary (list): Value of each code
+            
+        Returns:
+            CategoricalColumn: Column using the given codes
+        """
+        column = cls()
+        column.vocabulary = list(vocabulary)
+        column._codes_by_value = {value: code for code, value in enumerate(column.vocabulary)}
+        column.codes = codes
+        return column
+    
+    def _encode(self, values):
+        """Map values to integer codes, growing the vocabulary as needed."""
+        codes = []
+        for value in values:
+            code = self._codes_by_value.get(value)
+            if code is None:
+                code = len(self.vocabulary)
+                self._codes_by_value[value] = code
+                self.vocabulary.append(value)
+            codes.append(code)
+        return np.array(codes, dtype=np.int32)
+    
+    def extended(self, values):
+        """
+        Return a new column with rows appended, leaving this one untouched.
+        
+        Args:
+            values (iterable): Values of the appended rows
+            
+        Returns:
+            CategoricalColumn: Extended column
+        """
+        column = CategoricalColumn()
+        column.vocabulary = list(self.vocabulary)
+        column._codes_by_value = dict(self._codes_by_value)
+        column.codes = np.concatenate([self.codes, column._encode(values)])
+        return column
+    
+    def code(self, value):
+        """
+        Return the integer code of a value.
+        
+        Args:
+            value: Column value
+            
+        Returns:
+            int: Code of the value, or None if no row holds it
+        """
+        return self._codes_by_value.get(value)
+    
+    def rows(self, values):
+        """
+        Find the rows holding any of the given values.
+        
+        Args:
+            values (iterable): Values to match
+            
+        Returns:
+            numpy.ndarray: Sorted row positions
+        """
+        if self._partitions is None:
+            order = np.argsort(self.codes, kind='stable')
+            bounds = np.searchsorted(self.codes[order], np.arange(len(self.vocabulary) + 1))
+            self._partitions = [order[bounds[code]:bounds[code + 1]] for code in range(len(self.vocabulary))]
+        
+        parts = [self._partitions[self._codes_by_value[value]] for value in set(values) if value in self._codes_by_value]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+
+def save_index_arrays(path, meta, **arrays):
+    """
+    Write an index to disk as an uncompressed .npz archive.
+    
+    Args:
+        path (str): Destination file path
+        meta (dict): JSON-serializable index parameters, including its 'kind'
+        **arrays: Named NumPy arrays holding the index data
+    """
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_index(path):
+    """
+    Load an index previously written with its save() method.
+    
+    Args:
+        path (str): Path to the saved index
+        
+    Returns:
+        object: Index instance of the kind recorded in the file
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    
+    meta = json.loads(str(arrays.pop('meta')))
+    kind = meta.get('kind')
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index kind '{kind}' in {path}")
+    
+    return INDEX_TYPES[kind].from_arrays(meta, arrays)
+
+
+class HNSWIndex:
+    """
+    Hierarchical Navigable Small World graph for approximate cosine-similarity search.
+    
+    Nodes are inserted one at a time, so the index supports incremental inserts.
+    Removed labels are tombstoned: they still route searches but are never returned,
+    until compact() drops them and relinks their neighbors.
+    """
+    
+    kind = 'hnsw'
+    
+    def __init__(self, dim, M=16, ef_construction=200, ef_search=64, seed=42):
+        """
+        Initialize an empty graph.
+        
+        Args:
+            dim (int): Embedding dimension
+            M (int): Links per node on the upper layers (2*M on layer 0)
+            ef_construction (int): Candidate list size while inserting
+            ef_search (int): Candidate list size while searching
+            seed (int): Seed for the random level generator
+        """
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        
+        # Bookkeeping used by VectorKnowledgeBase to catch up with the database and to
+        # recognize files saved from another embedding generation
+        self.max_label = 0
+        self.last_change = 0
+        self.generation = None
+        self.model = None
+        
+        self._rng = np.random.default_rng(seed)
+        self._level_mult = 1 / np.log(max(M, 2))
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._labels = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._links = []
+        self._deleted = set()
+        self._entry_point = None
+        self._max_level = -1
+    
+    def __len__(self):
+        return self._size - len(self._deleted)
+    
+    @property
+    def labels(self):
+        """numpy.ndarray: Label of each graph node, including tombstoned ones."""
+        return self._labels[:self._size]
+    
+    @property
+    def tombstones(self):
+        """int: Number of removed nodes still held in the graph."""
+        return len(self._deleted)
+    
+    @property
+    def params(self):
+        """dict: Constructor parameters besides dim."""
+        return {'M': self.M, 'ef_construction': self.ef_construction, 'ef_search': self.ef_search, 'seed': self.seed}
+    
+    def copy(self):
+        """
+        Return a copy that can be updated while this graph keeps serving searches.
+        
+        Node vectors are shared until the copy grows, which reallocates its buffers.
+        """
+        index = copy.copy(self)
+        index._vectors = self._vectors[:self._size]
+        index._labels = self._labels[:self._size]
+        index._links = [[list(level_links) for level_links in node_links] for node_links in self._links]
+        index._deleted = set(self._deleted)
+        index._rng = copy.deepcopy(self._rng)
+        return index
+    
+    def _reserve(self, size):
+        """Grow the vector and label buffers geometrically to hold size nodes."""
+        if size <= len(self._labels):
+            return
+        
+        capacity = max(size, 2 * len(self._labels), 1024)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        labels = np.empty(capacity, dtype=np.int64)
+        labels[:self._size] = self._labels[:self._size]
+        self._vectors, self._labels = vectors, labels
+    
+    def _max_links(self, level):
+        return 2 * self.M if level == 0 else self.M
+    
+    def _search_layer(self, query, entry_points, ef, level):
+        """
+        Best-first search of one layer.
+        
+        Returns:
+            list: (similarity, node) pairs, best first, at most ef long
+        """
+        visited = set(entry_points)
+        similarities = (self._vectors[entry_points] @ query).tolist()
+        candidates = [(-similarity, node) for similarity, node in zip(similarities, entry_points)]
+        results = [(similarity, node) for similarity, node in zip(similarities, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+        
+        while candidates:
+            negative_similarity, node = heapq.heappop(candidates)
+            if -negative_similarity < results[0][0] and len(results) >= ef:
+                break
+            
+            neighbors = [neighbor for neighbor in self._links[node][level] if neighbor not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            
+            # Score all unvisited neighbors with one product
+            for neighbor, similarity in zip(neighbors, (self._vectors[neighbors] @ query).tolist()):
+                if len(results) < ef or similarity > results[0][0]:
+                    heapq.heappush(candidates, (-similarity, neighbor))
+                    heapq.heappush(results, (similarity, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        
+        return sorted(results, reverse=True)
+    
+    def _select_neighbors(self, candidates, count):
+        """
+        Pick diverse neighbors: a candidate is kept only if it is closer to the new
+        node than to any neighbor already kept. Pruned candidates fill leftover slots.
+        
+        Args:
+            candidates (list): (similarity, node) pairs, best first
+            count (int): Maximum number of neighbors
+            
+        Returns:
+            list: Selected node ids
+        """
+        selected = []
+        pruned = []
+        for similarity, node in candidates:
+            if len(selected) >= count:
+                break
+            if not selected or (self._vectors[selected] @ self._vectors[node]).max() < similarity:
+                selected.append(node)
+            else:
+                pruned.append(node)
+        
+        return selected + pruned[:count - len(selected)]
+    
+    def _insert(self, node):
+        """Link an already stored node into the graph."""
+        query = self._vectors[node]
+        level = int(-np.log(1.0 - self._rng.random()) * self._level_mult)
+        self._links.append([[] for _ in range(level + 1)])
+        
+        if self._entry_point is None:
+            self._entry_point = node
+            self._max_level = level
+            return
+        
+        # Greedy descent through the layers above the new node's level
+        entry_points = [self._entry_point]
+        for current_level in range(self._max_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, current_level)[0][1]]
+        
+        for current_level in range(min(level, self._max_level), -1, -1):
+            candidates = self._search_layer(query, entry_points, self.ef_construction, current_level)
+            neighbors = self._select_neighbors(candidates, self.M)
+            self._links[node][current_level] = neighbors
+            
+            max_links = self._max_links(current_level)
+            for neighbor in neighbors:
+                links = self._links[neighbor][current_level]
+                links.append(node)
+                if len(links) > max_links:
+                    similarities = (self._vectors[links] @ self._vectors[neighbor]).tolist()
+                    ranked = sorted(zip(similarities, links), reverse=True)
+                    self._links[neighbor][current_level] = self._select_neighbors(ranked, max_links)
+            
+            entry_points = [node for _, node in candidates]
+        
+        if level > self._max_level:
+            self._entry_point = node
+            self._max_level = level
+    
+    def add(self, labels, vectors):
+        """
+        Insert vectors into the graph.
+        
+        Args:
+            labels (array-like): Integer label for each vector
+            vectors (array-like): Matrix of vectors, one row per label
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        
+        start = self._size
+        self._reserve(start + len(labels))
+        self._vectors[start:start + len(labels)] = vectors
+        self._labels[start:start + len(labels)] = labels
+        self._size = start + len(labels)
+        
+        for node in range(start, self._size):
+            self._insert(node)
+        
+        self.max_label = max(self.max_label, int(labels.max()))
+    
+    def remove(self, labels):
+        """
+        Tombstone every node carrying one of the given labels.
+        
+        Args:
+            labels (array-like): Labels to remove
+        """
+        nodes = np.flatnonzero(np.isin(self.labels, np.asarray(labels, dtype=np.int64)))
+        self._deleted.update(nodes.tolist())
+    
+    def compact(self):
+        """
+        Drop the tombstoned nodes from the graph.
+        
+        A live node that linked to a removed one picks its links on that layer again,
+        from its remaining links and the removed node's live links, with the same
+        heuristic as an insert, so the graph stays connected around the gap. Nodes are
+        renumbered into new buffers; a graph this one was copied from is unaffected.
+        """
+        deleted = self._deleted
+        if not deleted:
+            return
+        
+        live = [node for node in range(self._size) if node not in deleted]
+        links = []
+        for node in live:
+            node_links = []
+            for level, level_links in enumerate(self._links[node]):
+                if any(neighbor in deleted for neighbor in level_links):
+                    candidates = set()
+                    for neighbor in level_links:
+                        if neighbor in deleted:
+                            candidates.update(second for second in self._links[neighbor][level]
+                                              if second not in deleted)
+                        else:
+                            candidates.add(neighbor)
+                    candidates.discard(node)
+                    candidates = list(candidates)
+                    similarities = (self._vectors[candidates] @ self._vectors[node]).tolist() if candidates else []
+                    level_links = self._select_neighbors(sorted(zip(similarities, candidates), reverse=True),
+                                                         self._max_links(level))
+                node_links.append(level_links)
+            links.append(node_links)
+        
+        positions = np.full(self._size, -1, dtype=np.int64)
+        positions[live] = np.arange(len(live))
+        positions = positions.tolist()
+        self._links = [[[positions[neighbor] for neighbor in level_links] for level_links in node_links]
+                       for node_links in links]
+        self._vectors = self._vectors[live]
+        self._labels = self._labels[live]
+        self._size = len(live)
+        self._deleted = set()
+        
+        if not live:
+            self._entry_point, self._max_level = None, -1
+        elif self._entry_point in deleted:
+            levels = [len(node_links) - 1 for node_links in self._links]
+            self._max_level = max(levels)
+            self._entry_point = levels.index(self._max_level)
+        else:
+            self._entry_point = positions[self._entry_point]
+    
+    def search(self, query, top_k, ef_search=None):
+        """
+        Approximate top-k search.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            ef_search (int, optional): Override the candidate list size for this query
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        if self._entry_point is None or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        query = normalize_rows(query)
+        # Over-fetch when tombstones may be filtered out of the candidate list
+        ef = max(ef_search or self.ef_search, 2 * top_k if self._deleted else top_k)
+        
+        entry_points = [self._entry_point]
+        for level in range(self._max_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, level)[0][1]]
+        
+        results = [
+            (similarity, node) for similarity, node in self._search_layer(query, entry_points, ef, 0)
+            if node not in self._deleted
+        ][:top_k]
+        
+        nodes = [node for _, node in results]
+        return self._labels[nodes], np.array([similarity for similarity, _ in results], dtype=np.float32)
+    
+    def save(self, path):
+        """
+        Save the graph to disk.
+        
+        Args:
+            path (str): Destination file path
+        """
+        link_counts = []
+        links = []
+        for node_links in self._links:
+            for level_links in node_links:
+                link_counts.append(len(level_links))
+                links.extend(level_links)
+        
+        meta = {
+            'kind': self.kind,
+            'dim': self.dim,
+            **self.params,
+            'entry_point': self._entry_point,
+            'max_level': self._max_level,
+            'max_label': self.max_label,
+            'last_change': self.last_change,
+            'generation': self.generation,
+            'model': self.model
+        }
+        save_index_arrays(
+            path, meta,
+            vectors=self._vectors[:self._size],
+            labels=self.labels,
+            levels=np.array([len(node_links) - 1 for node_links in self._links], dtype=np.int32),
+            link_counts=np.array(link_counts, dtype=np.int32),
+            links=np.array(links, dtype=np.int64),
+            deleted=np.array(sorted(self._deleted), dtype=np.int64)
+        )
+    
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        """Rebuild a graph from the arrays written by save()."""
+        index = cls(meta['dim'], M=meta['M'], ef_construction=meta['ef_construction'],
+                    ef_search=meta['ef_search'], seed=meta['seed'])
+        index._vectors = np.ascontiguousarray(arrays['vectors'], dtype=np.float32)
+        index._labels = arrays['labels'].astype(np.int64)
+        index._size = len(index._labels)
+        index._entry_point = meta['entry_point']
+        index._max_level = meta['max_level']
+        index.max_label = meta['max_label']
+        index.last_change = meta['last_change']
+        index.generation = meta.get('generation')
+        index.model = meta.get('model')
+        index._deleted = set(arrays['deleted'].tolist())
+        
+        # Unflatten the per-node, per-level adjacency lists
+        counts = arrays['link_counts'].tolist()
+        links = arrays['links'].tolist()
+        position = 0
+        entry = 0
+        for level in arrays['levels'].tolist():
+            node_links = []
+            for _ in range(level + 1):
+                node_links.append(links[position:position + counts[entry]])
+                position += counts[entry]
+                entry += 1
+            index._links.append(node_links)
+        
+        return index
+
+
+def assign_to_centroids(vectors, centroids, spherical=True):
+    """
+    Find the closest centroid for each vector.
+    
+    Args:
+        vectors (numpy.ndarray): Vectors to assign
+        centroids (numpy.ndarray): Centroid matrix
+        spherical (bool): Compare by cosine similarity instead of Euclidean distance
+        
+    Returns:
+        numpy.ndarray: Centroid position for each vector
+    """
+    scores = vectors @ centroids.T
+    if not spherical:
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        scores -= 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    return np.argmax(scores, axis=1)
+
+
+def train_kmeans(vectors, k, iterations=20, seed=42, spherical=True):
+    """
+    Lloyd's k-means. Spherical mode re-normalizes centroids so assignment is by
+    cosine similarity.
+    
+    Args:
+        vectors (numpy.ndarray): Training vectors (normalized for spherical mode)
+        k (int): Number of centroids
+        iterations (int): Number of Lloyd iterations
+        seed (int): Seed for the initial centroid sample
+        spherical (bool): Use cosine similarity instead of Euclidean distance
+        
+    Returns:
+        numpy.ndarray: k x dim centroid matrix
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids, spherical=spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+        
+        # Re-seed empty clusters with random training vectors
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+            counts[empty] = 1
+        
+        centroids = normalize_rows(sums) if spherical else (sums / counts[:, None]).astype(np.float32)
+    
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are partitioned into k-means lists and a query scans
+    only the nprobe lists whose centroids are closest to it.
+    """
+    
+    kind = 'ivf'
+    
+    def __init__(self, dim, nlist=None, nprobe=8, iterations=20, max_train_size=100000, seed=42):
+        """
+        Initialize an untrained index.
+        
+        Args:
+            dim (int): Embedding dimension
+            nlist (int, optional): Number of lists; defaults to sqrt(n) of the training set
+            nprobe (int): Number of lists scanned per query
+            iterations (int): k-means iterations
+            max_train_size (int): Maximum number of vectors sampled for training
+            seed (int): Seed for sampling and centroid initialization
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.max_train_size = max_train_size
+        self.seed = seed
+        
+        # Bookkeeping used by VectorKnowledgeBase to catch up with the database and to
+        # recognize files saved from another embedding generation
+        self.max_label = 0
+        self.last_change = 0
+        self.generation = None
+        self.model = None
+        
+        self.centroids = None
+        # One (vectors, labels) pair per list, replaced as a whole so a concurrent
+        # search never sees the two out of step
+        self._lists = []
+    
+    def __len__(self):
+        return sum(len(labels) for _, labels in self._lists)
+    
+    @property
+    def labels(self):
+        """numpy.ndarray: Labels of all indexed vectors, in list order."""
+        if not self._lists:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([labels for _, labels in self._lists])
+    
+    @property
+    def params(self):
+        """dict: Constructor parameters besides dim."""
+        return {'nlist': self.nlist, 'nprobe': self.nprobe, 'iterations': self.iterations,
+                'max_train_size': self.max_train_size, 'seed': self.seed}
+    
+    def copy(self):
+        """Return a copy that can be updated while this index keeps serving searches."""
+        index = copy.copy(self)
+        index._lists = list(self._lists)
+        return index
+    
+    def train(self, vectors):
+        """
+        Train the list centroids.
+        
+        Args:
+            vectors (array-like): Training vectors
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        if len(vectors) > self.max_train_size:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[rng.choice(len(vectors), self.max_train_size, replace=False)]
+        
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        self.centroids = train_kmeans(vectors, nlist, iterations=self.iterations, seed=self.seed)
+        self.nlist = len(self.centroids)
+        self._lists = [(np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+                       for _ in range(self.nlist)]
+    
+    def add(self, labels, vectors):
+        """
+        Assign vectors to their nearest list, training first if needed.
+        
+        Args:
+            labels (array-like): Integer label for each vector
+            vectors (array-like): Matrix of vectors, one row per label
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        
+        if self.centroids is None:
+            self.train(vectors)
+        
+        assignments = assign_to_centroids(vectors, self.centroids)
+        for list_id in np.unique(assignments).tolist():
+            mask = assignments == list_id
+            list_vectors, list_labels = self._lists[list_id]
+            self._lists[list_id] = (np.vstack([list_vectors, vectors[mask]]),
+                                    np.concatenate([list_labels, labels[mask]]))
+        
+        self.max_label = max(self.max_label, int(labels.max()))
+    
+    def remove(self, labels):
+        """
+        Delete every vector carrying one of the given labels.
+        
+        Args:
+            labels (array-like): Labels to remove
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        for list_id, (list_vectors, list_labels) in enumerate(self._lists):
+            keep = ~np.isin(list_labels, labels)
+            if not keep.all():
+                self._lists[list_id] = (list_vectors[keep], list_labels[keep])
+    
+    def search(self, query, top_k, nprobe=None):
+        """
+        Scan the closest lists for the best matches.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            nprobe (int, optional): Override the number of lists scanned for this query
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        if self.centroids is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        query = normalize_rows(query)
+        probes = top_k_indices(self.centroids @ query, nprobe or self.nprobe).tolist()
+        
+        # Score each probed list where it is stored instead of stacking them into a copy
+        best = RunningTopK(top_k)
+        for list_id in probes:
+            vectors, labels = self._lists[list_id]
+            best.push(labels, vectors @ query)
+        return best.result()
+    
+    def save(self, path):
+        """
+        Save the centroids and lists to disk.
+        
+        Args:
+            path (str): Destination file path
+        """
+        meta = {
+            'kind': self.kind,
+            'dim': self.dim,
+            **self.params,
+            'max_label': self.max_label,
+            'last_change': self.last_change,
+            'generation': self.generation,
+            'model': self.model
+        }
+        arrays = {}
+        if self.centroids is not None:
+            arrays['centroids'] = self.centroids
+            arrays['list_sizes'] = np.array([len(labels) for _, labels in self._lists], dtype=np.int64)
+            arrays['vectors'] = np.vstack([vectors for vectors, _ in self._lists])
+            arrays['labels'] = self.labels
+        save_index_arrays(path, meta, **arrays)
+    
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        """Rebuild an index from the arrays written by save()."""
+        index = cls(meta['dim'], nlist=meta['nlist'], nprobe=meta['nprobe'], iterations=meta['iterations'],
+                    max_train_size=meta['max_train_size'], seed=meta['seed'])
+        index.max_label = meta['max_label']
+        index.last_change = meta['last_change']
+        index.generation = meta.get('generation')
+        index.model = meta.get('model')
+        
+        if 'centroids' in arrays:
+            index.centroids = arrays['centroids'].astype(np.float32)
+            offsets = np.cumsum(arrays['list_sizes'])[:-1]
+            index._lists = list(zip(np.split(arrays['vectors'].astype(np.float32), offsets),
+                                    np.split(arrays['labels'].astype(np.int64), offsets)))
+        
+        return index
+
+
+class PQIndex:
+    """
+    Product-quantization index. Each vector is split into m sub-vectors and every
+    sub-vector is stored as the 8-bit id of its closest centroid in that subspace's
+    codebook, so a vector costs m bytes.
+    
+    Queries use asymmetric distance computation: the query stays in float32 and is
+    scored through an m x 256 lookup table of sub-vector inner products.
+    
+    The codes trade ranking quality for memory: on their own they rank poorly (recall@10
+    of about 0.15 on 384-dim embeddings with m=32), so PQ hits are meant to be
+    over-fetched and rescored exactly, which VectorKnowledgeBase does by default.
+    """
+    
+    kind = 'pq'
+    
+    def __init__(self, dim, m=32, iterations=20, max_train_size=65536, block_size=65536, seed=42):
+        """
+        Initialize an untrained index.
+        
+        Args:
+            dim (int): Embedding dimension, which must be divisible by m
+            m (int): Number of sub-vectors (bytes per encoded vector)
+            iterations (int): k-means iterations per sub-codebook
+            max_train_size (int): Maximum number of vectors sampled for training
+            block_size (int): Rows scored at a time, bounding scratch memory
+            seed (int): Seed for sampling and centroid initialization
+        """
+        if dim % m:
+            raise ValueError(f"Dimension {dim} is not divisible into {m} sub-vectors")
+        
+        self.dim = dim
+        self.m = m
+        self.sub_dim = dim // m
+        self.iterations = iterations
+        self.max_train_size = max_train_size
+        self.block_size = block_size
+        self.seed = seed
+        
+        # Bookkeeping used by VectorKnowledgeBase to catch up with the database and to
+        # recognize files saved from another embedding generation
+        self.max_label = 0
+        self.last_change = 0
+        self.generation = None
+        self.model = None
+        
+        self.codebooks = None
+        # (codes, labels), replaced as a whole so a concurrent search never sees the
+        # two out of step
+        self._data = (np.empty((0, m), dtype=np.uint8), np.empty(0, dtype=np.int64))
+    
+    def __len__(self):
+        return len(self._data[1])
+    
+    @property
+    def labels(self):
+        """numpy.ndarray: Label of each encoded vector."""
+        return self._data[1]
+    
+    @property
+    def params(self):
+        """dict: Constructor parameters besides dim."""
+        return {'m': self.m, 'iterations': self.iterations, 'max_train_size': self.max_train_size,
+                'block_size': self.block_size, 'seed': self.seed}
+    
+    def copy(self):
+        """Return a copy that can be updated while this index keeps serving searches."""
+        return copy.copy(self)
+    
+    def train(self, vectors):
+        """
+        Train one 256-entry codebook per subspace.
+        
+        Args:
+            vectors (array-like): Training vectors
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        if len(vectors) > self.max_train_size:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[rng.choice(len(vectors), self.max_train_size, replace=False)]
+        
+        codebooks = np.zeros((self.m, 256, self.sub_dim), dtype=np.float32)
+        for sub in range(self.m):
+            sub_vectors = vectors[:, sub * self.sub_dim:(sub + 1) * self.sub_dim]
+            centroids = train_kmeans(sub_vectors, 256, iterations=self.iterations, seed=self.seed + sub,
+                                     spherical=False)
+            codebooks[sub, :len(centroids)] = centroids
+        self.codebooks = codebooks
+    
+    def encode(self, vectors):
+        """
+        Compress normalized vectors to m-byte codes.
+        
+        Args:
+            vectors (numpy.ndarray): Normalized vectors
+            
+        Returns:
+            numpy.ndarray: n x m uint8 codes
+        """
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for sub in range(self.m):
+            sub_vectors = vectors[:, sub * self.sub_dim:(sub + 1) * self.sub_dim]
+            codes[:, sub] = assign_to_centroids(sub_vectors, self.codebooks[sub], spherical=False)
+        return codes
+    
+    def add(self, labels, vectors):
+        """
+        Encode and append vectors, training the codebooks on the first batch.
+        
+        Args:
+            labels (array-like): Integer label for each vector
+            vectors (array-like): Matrix of vectors, one row per label
+        """
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        
+        if self.codebooks is None:
+            self.train(vectors)
+        
+        codes, current_labels = self._data
+        self._data = (np.vstack([codes, self.encode(vectors)]), np.concatenate([current_labels, labels]))
+        self.max_label = max(self.max_label, int(labels.max()))
+    
+    def remove(self, labels):
+        """
+        Delete every vector carrying one of the given labels.
+        
+        Args:
+            labels (array-like): Labels to remove
+        """
+        codes, current_labels = self._data
+        keep = ~np.isin(current_labels, np.asarray(labels, dtype=np.int64))
+        self._data = (codes[keep], current_labels[keep])
+    
+    def search(self, query, top_k):
+        """
+        Score every code through the query's lookup table.
+        
+        Args:
+            query (array-like): Query embedding
+            top_k (int): Number of results to return
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best approximate matches, best first
+        """
+        if self.codebooks is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        query = normalize_rows(query).reshape(self.m, self.sub_dim)
+        
+        # lookup[sub, code] = <query sub-vector, codebook centroid>
+        lookup = np.einsum('mkd,md->mk', self.codebooks, query)
+        flat_lookup = lookup.ravel()
+        offsets = np.arange(self.m) * 256
+        
+        codes, labels = self._data
+        scores = np.empty(len(labels), dtype=np.float32)
+        for start in range(0, len(labels), self.block_size):
+            block = codes[start:start + self.block_size].astype(np.intp) + offsets
+            scores[start:start + self.block_size] = flat_lookup[block].sum(axis=1)
+        
+        best = top_k_indices(scores, top_k)
+        return labels[best], scores[best]
+    
+    def save(self, path):
+        """
+        Save the codebooks and codes to disk.
+        
+        Args:
+            path (str): Destination file path
+        """
+        meta = {
+            'kind': self.kind,
+            'dim': self.dim,
+            **self.params,
+            'max_label': self.max_label,
+            'last_change': self.last_change,
+            'generation': self.generation,
+            'model': self.model
+        }
+        codes, labels = self._data
+        arrays = {'codes': codes, 'labels': labels}
+        if self.codebooks is not None:
+            arrays['codebooks'] = self.codebooks
+        save_index_arrays(path, meta, **arrays)
+    
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        """Rebuild an index from the arrays written by save()."""
+        index = cls(meta['dim'], m=meta['m'], iterations=meta['iterations'], max_train_size=meta['max_train_size'],
+                    block_size=meta['block_size'], seed=meta['seed'])
+        index.max_label = meta['max_label']
+        index.last_change = meta['last_change']
+        index.generation = meta.get('generation')
+        index.model = meta.get('model')
+        index.codebooks = arrays.get('codebooks')
+        index._data = (arrays['codes'].astype(np.uint8), arrays['labels'].astype(np.int64))
+        return index
+
+
+# Approximate index kinds that VectorKnowledgeBase can build and load by name
+INDEX_TYPES = {
+    'hnsw': HNSWIndex,
+    'ivf': IVFIndex,
+    'pq': PQIndex
+}
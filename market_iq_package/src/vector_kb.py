@@ -4,33 +4,354 @@ This module implements document vectorization and LLM-powered retrieval for enha
 """
 
 import os
+import re
+import gc
+import copy
+import hashlib
+import socket
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import sqlite3
 import json
+import time
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from src.vector_index import (
+    FlatIndex, ScalarQuantizedIndex, ShardedIndex, RunningTopK, CategoricalColumn, INDEX_TYPES, load_index,
+    merge_top_k, normalize_rows
+)
+from src.vector_store import VectorStore, write_vector_store
+from src.encoders import DEFAULT_MODEL, create_encoder
+from src.text_processing import DEFAULT_SECTION_TOKENS, split_sections
+from src.snippets import generate_snippet, highlight as mark_highlights, parse_marked
+from src.dedup import NearDuplicateDetector
+
+# Embedding tables whose updates and deletes are tracked in embedding_state
+EMBEDDING_TABLES = ('document_embeddings', 'company_embeddings', 'metric_embeddings')
+
+# Embedding tables that unified search can score, by result type
+SEARCH_COLLECTIONS = {
+    'document': 'document_embeddings',
+    'company': 'company_embeddings',
+    'metric': 'metric_embeddings',
+}
+
+# Fields returned with company and metric search results
+COLLECTION_COLUMNS = {
+    'company_embeddings': ('ticker', 'info_type', 'content'),
+    'metric_embeddings': ('ticker', 'metric_name', 'period', 'value'),
+}
+
+# Text each embedding table's vectors are computed from, as built by the vectorize methods
+_EMBEDDING_TEXT_TEMPLATES = {
+    'document_embeddings': '{section_content}',
+    'company_embeddings': '{content}',
+    'metric_embeddings': '{ticker} {metric_name} for {period}: {value}',
+}
+
+# Embeddings read from SQLite per block while an approximate index is built or caught up
+INDEX_BUILD_BLOCK_SIZE = 65536
+
+# Share of an HNSW graph's nodes that may be tombstones before a refresh compacts it.
+# Updated rows are re-inserted as new nodes, so without compaction the graph keeps
+# every version of a frequently changed row
+TOMBSTONE_COMPACT_RATIO = 0.2
+
+# Similarity reported for hybrid results that only the keyword leg found, which have no
+# vector score; callers format it as a number
+KEYWORD_ONLY_SIMILARITY = 0.5
+
+# Markers around matched terms in FTS5 snippets, parsed into highlight offsets
+_FTS_MARKERS = ('\x02', '\x03')
+
+def _contains_sorted(sorted_labels, labels):
+    """Mask of the labels that occur in an ascending label array."""
+    if not len(sorted_labels):
+        return np.zeros(len(labels), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_labels, labels), len(sorted_labels) - 1)
+    return sorted_labels[positions] == labels
+
+
+# Databases whose vector tables this process has already created or migrated
+_initialized_databases = set()
+_initialized_databases_lock = threading.Lock()
+
+# External-content FTS5 indexes: name -> (content table, indexed columns)
+FULLTEXT_TABLES = {
+    'documents_fts': ('documents', ('title', 'content')),
+    'document_sections_fts': ('document_sections', ('section_title', 'section_content')),
+}
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings with an optional time-to-live.
+    """
+    
+    def __init__(self, max_size=1024, ttl=3600):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            max_size (int): Maximum number of cached queries
+            ttl (float, optional): Seconds an entry stays valid; None keeps entries until evicted
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(query):
+        """
+        Build the cache key for a query: case-folded with collapsed whitespace.
+        The default all-MiniLM-L6-v2 tokenizer is uncased, so this does not change
+        the embedding.
+        """
+        return ' '.join(query.lower().split())
+    
+    def get(self, query):
+        """
+        Look up a cached embedding.
+        
+        Args:
+            query (str): Search query
+            
+        Returns:
+            numpy.ndarray: Cached embedding, or None on a miss
+        """
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.time() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, query, embedding):
+        """
+        Store an embedding, evicting the least recently used entry when full.
+        
+        Args:
+            query (str): Search query
+            embedding (numpy.ndarray): Query embedding
+            
+        Returns:
+            numpy.ndarray: Read-only float32 copy of the embedding as stored
+        """
+        key = self.normalize(query)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        
+        with self._lock:
+            self._entries[key] = (time.time(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        
+        return embedding
+    
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        """
+        Get cache counters.
+        
+        Returns:
+            dict: Size, capacity, hits, misses and hit rate
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
 
 class VectorKnowledgeBase:
     """
     Vector-based knowledge base for financial documents using embeddings and LLM integration.
     """
     
-    def __init__(self, db_path):
+    def __init__(self, db_path, storage='float32', rescore_factor=4, initialize_db=True,
+                 query_cache_size=1024, query_cache_ttl=3600, vector_store=None,
+                 model_name=DEFAULT_MODEL, encoder='transformer', section_tokens=None, section_overlap=32,
+                 shard_by=None, shard_size=100000, shard_workers=None, search_workers=None,
+                 generation_check_interval=5.0, change_log_retention=86400.0):
         """
         Initialize the vector knowledge base with the SQLite database.
         
         Args:
             db_path (str): Path to the SQLite database file
+            storage (str): Precision of the resident document matrix: 'float32', or
+                'float16' / 'int8' to keep compact codes and rescore candidates exactly
+            rescore_factor (int): With compact storage, candidates per requested result
+                that are rescored against the full-precision vectors
+            initialize_db (bool): Create or migrate the vector tables; vectorization
+                worker processes skip this
+            query_cache_size (int): Maximum number of cached query embeddings
+            query_cache_ttl (float, optional): Seconds a cached query embedding stays valid
+            vector_store (str, optional): Memory-mapped vector store file to start the
+                resident document index from instead of decoding SQLite BLOBs
+            model_name (str): Sentence transformer model, loaded on first use or by warm_up()
+            encoder (str or object): Embedding backend: 'transformer', 'transformer-int8',
+                'hashing' or 'tfidf-svd:path' (see src.encoders.create_encoder), or an
+                encoder instance. If the database was embedded by another encoder, that
+                one keeps serving searches until reembed() migrates to this one
+            section_tokens (int, optional): Token budget of a document section; defaults
+                to what the encoder reads
+            section_overlap (int): Tokens repeated at the start of a continued section
+            shard_by (str, optional): Partition exact document scans into shards by
+                'ticker' or filing 'year', searched in parallel. The resident matrix is
+                kept in shard-key order and every shard is a view of it, so a vector
+                store is read into memory in that order rather than mapped
+            shard_size (int): Maximum sections per shard
+            shard_workers (int, optional): Threads searching shards; defaults to the CPU count
+            search_workers (int, optional): Threads running the keyword legs of concurrent
+                hybrid searches; defaults to ThreadPoolExecutor's min(32, CPU count + 4).
+                Size it to the number of request threads that may search at once
+            generation_check_interval (float): Seconds between searches' checks for an
+                embedding generation activated by another process; 0 checks on every query
+            change_log_retention (float): Seconds an approximate index in any process may
+                go without catching up before the change-log rows it still needs are
+                pruned; it is rebuilt if it falls that far behind
         """
+        if storage not in ('float32', 'float16', 'int8'):
+            raise ValueError(f"Unknown storage mode '{storage}'")
+        if shard_by not in (None, 'ticker', 'year'):
+            raise ValueError(f"Unknown shard key '{shard_by}'")
+        
         self.db_path = db_path
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        self.vector_store = vector_store
         
-        # Initialize the sentence transformer model for embeddings
+        # The embedding model is loaded on first use
         # Using a smaller model for demonstration, would use a more powerful one in production
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model_name = model_name
+        self._encoder_config = encoder
+        self.encoder = create_encoder(encoder, model_name=model_name)
+        
+        # The configured encoder; searches use the encoder of the database's active
+        # embedding generation until reembed() has migrated it to this one
+        self._target_encoder_config = encoder
+        self.target_encoder = self.encoder
+        self.generation = None
+        self.generation_check_interval = generation_check_interval
+        self._generation_checked_at = 0.0
+        self.section_tokens = section_tokens
+        self.section_overlap = section_overlap
+        self._model_lock = threading.Lock()
+        self._model_ready = threading.Event()
+        self._warm_up_thread = None
+        
+        # Query embeddings shared by all search methods
+        self.query_cache = QueryEmbeddingCache(max_size=query_cache_size, ttl=query_cache_ttl)
+        
+        # Resident document embedding matrix and its per-row attributes, loaded on first search
+        self._doc_index = None
+        self._doc_rows = None
+        self._doc_index_state = None
+        self._index_lock = threading.Lock()
+        
+        # Shards of the resident document index: (index they view, ShardedIndex)
+        self.shard_by = shard_by
+        self.shard_size = shard_size
+        self.shard_workers = shard_workers
+        self._sharded_index = None
+        self._shard_pool = None
+        
+        # Resident company and metric embedding matrices: table -> (index, tickers, state)
+        self._collection_indexes = {}
+        
+        # Approximate indexes over document_embeddings, keyed by kind. Each is replaced
+        # as a whole by an updated copy, never modified in place while it is searched
+        self.indexes = {}
+        self._refresh_lock = threading.Lock()
+        self._refresh_threads = {}
+        self.change_log_retention = change_log_retention
+        
+        # Filter columns of the document embeddings, without their vectors, for the
+        # approximate indexes: (table state, columns)
+        self._doc_attributes = None
+        
+        # Rows each approximate index has not caught up with, read once per index and
+        # table state: kind -> (index, columns, (changed ids, FlatIndex of pending rows))
+        self._pending_rows = {}
+        
+        # Whether the FTS5 keyword indexes exist; detected on first use. They are created
+        # by create_fulltext_index(), a migration step run outside the servers
+        self.fts_enabled = None
+        
+        # Threads that run the keyword legs of hybrid searches, started on first use
+        self.search_workers = search_workers
+        self._search_pool = None
+        
+        # Create vector database tables if they don't exist, once per database and process
+        if initialize_db:
+            with _initialized_databases_lock:
+                key = os.path.abspath(db_path)
+                if key not in _initialized_databases:
+                    self._initialize_vector_db()
+                    _initialized_databases.add(key)
+                    if not self._check_fulltext_index():
+                        print(f"Full-text indexes are missing from {db_path}; keyword search uses LIKE until "
+                              "create_fulltext_index() is run")
+            self._sync_generation()
+    
+    @property
+    def model(self):
+        """object: The configured encoder; its encode() loads the model on first use."""
+        return self.encoder
+    
+    @property
+    def is_ready(self):
+        """bool: Whether the encoder is loaded and warmed up, so semantic search will not stall."""
+        return self._model_ready.is_set()
+    
+    def warm_up(self, background=True):
+        """
+        Load the encoder and run a dummy encode so the first query does not pay for it.
         
-        # Create vector database tables if they don't exist
-        self._initialize_vector_db()
+        Safe to call repeatedly; only the first call starts the warm-up.
+        
+        Args:
+            background (bool): Warm up on a daemon thread and return immediately
+            
+        Returns:
+            threading.Thread: The warm-up thread, or None when warming up in the foreground
+        """
+        def run():
+            try:
+                self.encoder.encode('warm up')
+                self._model_ready.set()
+            except Exception as e:
+                print(f"Encoder warm-up failed: {e}")
+        
+        if not background:
+            run()
+            return None
+        
+        with self._model_lock:
+            if self._warm_up_thread is None:
+                self._warm_up_thread = threading.Thread(target=run, name='encoder-warm-up', daemon=True)
+                self._warm_up_thread.start()
+        return self._warm_up_thread
     
     def _initialize_vector_db(self):
         """Initialize the vector database tables if they don't exist."""
@@ -75,432 +396,2984 @@ class VectorKnowledgeBase:
         )
         ''')
         
+        # Sections that near-duplicate an embedded section of the same company (repeated
+        # boilerplate) are stored as references to it instead of as embeddings
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_section_refs (
+            doc_id TEXT NOT NULL,
+            section_id TEXT NOT NULL,
+            section_title TEXT,
+            canonical_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (doc_id, section_id)
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_section_refs_canonical ON document_section_refs(canonical_id)')
+        
+        # Lets deduplicating vectorization stream documents company by company, newest
+        # filing first, without a sort
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents'")
+        if cursor.fetchone():
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_ticker_date ON documents(ticker, filing_date)')
+        
+        # Content hashes let re-vectorization skip unchanged rows
+        for table in EMBEDDING_TABLES:
+            self._ensure_column(cursor, table, 'content_hash', 'TEXT')
+        
+        # Count updates and deletes per embedding table so resident indexes know when
+        # appending new rows is not enough and they must reload
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_state (
+            table_name TEXT PRIMARY KEY,
+            mutations INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        
+        # Log the row ids behind those mutations so approximate indexes can catch up
+        # without a rebuild
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL
+        )
+        ''')
+        
+        # How far each approximate index, in whichever process holds it, has read the
+        # change log; rows are pruned only once every live consumer has read them
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS index_consumers (
+            consumer TEXT PRIMARY KEY,
+            last_change INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''')
+        
+        self._create_embedding_table_objects(cursor)
+        
+        # Each generation of the embedding tables is made by one encoder; the active one
+        # is searched while a new one is built in shadow tables by reembed()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_generations (
+            generation INTEGER PRIMARY KEY AUTOINCREMENT,
+            encoder TEXT,
+            model TEXT NOT NULL,
+            dim INTEGER,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            activated_at TIMESTAMP
+        )
+        ''')
+        
+        # Embeddings stored before generations were recorded are attributed to the
+        # configured encoder
+        cursor.execute("SELECT 1 FROM embedding_generations WHERE status = 'active'")
+        if cursor.fetchone() is None:
+            cursor.execute('SELECT length(embedding) / 4 FROM document_embeddings LIMIT 1')
+            row = cursor.fetchone()
+            cursor.execute('''
+                INSERT INTO embedding_generations (encoder, model, dim, status, activated_at)
+                VALUES (?, ?, ?, 'active', CURRENT_TIMESTAMP)
+            ''', (_encoder_spec(self._encoder_config, self.model_name), self.encoder.name, row[0] if row else None))
+        
+        conn.commit()
+        conn.close()
+    
+    def _create_embedding_table_objects(self, cursor):
+        """
+        Create the indexes and change-tracking triggers of the embedding tables.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+        """
         # Create index for faster retrieval
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_doc_embeddings ON document_embeddings(doc_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_company_embeddings ON company_embeddings(ticker)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_embeddings ON metric_embeddings(ticker, metric_name)')
         
-        conn.commit()
-        conn.close()
+        for table in EMBEDDING_TABLES:
+            cursor.execute('INSERT OR IGNORE INTO embedding_state (table_name) VALUES (?)', (table,))
+            for event in ('UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE embedding_state SET mutations = mutations + 1 WHERE table_name = '{table}';
+                END
+                ''')
+                cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_log AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO embedding_changes (table_name, row_id) VALUES ('{table}', OLD.id);
+                END
+                ''')
     
-    def vectorize_documents(self, limit=None):
+    def _get_active_generation(self, cursor):
         """
-        Vectorize all documents in the knowledge base.
+        Read the active embedding generation.
         
         Args:
-            limit (int, optional): Limit the number of documents to process
+            cursor (sqlite3.Cursor): Open database cursor
+            
+        Returns:
+            tuple: (generation, encoder spec, model, dim)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor.execute("SELECT generation, encoder, model, dim FROM embedding_generations WHERE status = 'active'")
+        return cursor.fetchone()
+    
+    def _generation_changed(self, cursor):
+        """Whether another embedding generation was activated since this instance last switched."""
+        return self.generation is not None and self._get_active_generation(cursor)[0] != self.generation
+    
+    def _sync_generation(self, force=False):
+        """
+        Switch to the active embedding generation if another one was activated since the
+        last check, here or by another process.
         
-        # Get documents to vectorize
-        if limit:
-            cursor.execute('SELECT id, ticker, doc_type, title, content FROM documents LIMIT ?', (limit,))
-        else:
-            cursor.execute('SELECT id, ticker, doc_type, title, content FROM documents')
+        Queries must be encoded by the model that made the searched vectors, so the
+        encoder, the query cache and every resident index are replaced together.
         
-        documents = cursor.fetchall()
+        Args:
+            force (bool): Read the active generation even if it was checked less than
+                generation_check_interval seconds ago
+        """
+        now = time.time()
+        if (not force and self.generation is not None
+                and now - self._generation_checked_at < self.generation_check_interval):
+            return
         
-        # Process each document
-        for doc_id, ticker, doc_type, title, content in documents:
-            # Split document into sections
-            sections = self._split_document_into_sections(content, title)
+        conn = sqlite3.connect(self.db_path)
+        active = self._get_active_generation(conn.cursor())
+        conn.close()
+        self._generation_checked_at = now
+        if active is None or active[0] == self.generation:
+            return
+        
+        with self._index_lock:
+            if active[0] == self.generation:
+                return
+            generation, spec, model, _ = active
             
-            # Vectorize each section
-            for section_id, section_data in enumerate(sections):
-                section_title = section_data.get('title', f'Section {section_id}')
-                section_content = section_data.get('content', '')
-                
-                # Skip empty sections
-                if not section_content.strip():
-                    continue
-                
-                # Generate embedding for the section
-                embedding = self.model.encode(section_content)
-                
-                # Store embedding in the database
-                cursor.execute(
-                    'INSERT INTO document_embeddings (doc_id, section_id, section_title, section_content, embedding) VALUES (?, ?, ?, ?, ?)',
-                    (doc_id, str(section_id), section_title, section_content, embedding.tobytes())
-                )
+            if self.encoder.name == model:
+                encoder = self.encoder
+            elif self.target_encoder.name == model:
+                encoder = self.target_encoder
+            elif spec:
+                encoder = create_encoder(spec, model_name=self.model_name)
+            else:
+                raise ValueError(f"Embeddings in {self.db_path} were made by {model}, which cannot be rebuilt from "
+                                 "its configuration; pass that encoder instance")
+            
+            if self.generation is not None:
+                print(f"Switching to embedding generation {generation} ({model})")
+            if encoder is not self.encoder:
+                self.encoder = encoder
+                self._encoder_config = spec or encoder
+                self._model_ready = threading.Event()
+                self._warm_up_thread = None
+                self.query_cache.clear()
+                self._doc_index = None
+                self._doc_rows = None
+                self._doc_index_state = None
+                self._doc_attributes = None
+                self._sharded_index = None
+                self._collection_indexes = {}
+                self.indexes = {}
+            self.generation = generation
+        
+        if self.target_encoder.name != model:
+            print(f"Embeddings use {model}; call reembed() to migrate to {self.target_encoder.name}")
+    
+    def reembed(self, encoder=None, batch_size=64, rows_per_second=None, background=True):
+        """
+        Re-embed every stored row with another encoder, then switch to it atomically.
         
-        conn.commit()
-        conn.close()
+        The new generation is built in shadow copies of the embedding tables while
+        searches keep reading the active generation with its own encoder. Rows written
+        or changed during the build are caught up, and the final catch-up and the swap
+        of the tables run in one write transaction, so readers see either generation
+        whole. Row ids are kept, so near-duplicate references stay valid. An interrupted
+        build resumes where it stopped.
         
-        print(f"Vectorized {len(documents)} documents")
+        Args:
+            encoder (str or object, optional): Encoder of the new generation (see
+                src.encoders.create_encoder), which becomes this instance's configured
+                encoder; defaults to the one this instance was configured with
+            batch_size (int): Number of rows encoded per model call
+            rows_per_second (float, optional): Throttle, so re-embedding does not starve
+                the search workers of CPU
+            background (bool): Run on a daemon thread and return immediately
+            
+        Returns:
+            threading.Thread: The re-embedding thread, or None when run in the foreground
+        """
+        if encoder is not None:
+            self._target_encoder_config = encoder
+            self.target_encoder = create_encoder(encoder, model_name=self.model_name)
+        target = self.target_encoder
+        spec = _encoder_spec(self._target_encoder_config, self.model_name)
+        
+        def run():
+            try:
+                self._build_generation(target, spec, batch_size, rows_per_second)
+            except Exception as e:
+                print(f"Re-embedding with {target.name} failed: {e}")
+                if not background:
+                    raise
+        
+        if not background:
+            run()
+            return None
+        
+        thread = threading.Thread(target=run, name='reembed', daemon=True)
+        thread.start()
+        return thread
     
-    def vectorize_company_info(self):
-        """Vectorize company information for all companies in the knowledge base."""
-        conn = sqlite3.connect(self.db_path)
+    def _build_generation(self, target, spec, batch_size, rows_per_second):
+        """
+        Build and activate a generation of the embedding tables for an encoder.
+        
+        Args:
+            target (object): Encoder of the new generation
+            spec (str, optional): Configuration string that recreates the encoder
+            batch_size (int): Number of rows encoded per model call
+            rows_per_second (float, optional): Maximum re-embedding rate
+        """
+        conn = sqlite3.connect(self.db_path, timeout=60)
         cursor = conn.cursor()
         
-        # Get all companies
-        cursor.execute('SELECT ticker, name, description, industry, sector FROM companies')
-        companies = cursor.fetchall()
+        active = self._get_active_generation(cursor)
+        if active[2] == target.name:
+            print(f"Embeddings already use {target.name}")
+            conn.close()
+            return
+        
+        # Resume a build for the same encoder; abandon builds for any other
+        cursor.execute("SELECT generation, model FROM embedding_generations WHERE status = 'building'")
+        generation = None
+        for building, model in cursor.fetchall():
+            if model == target.name:
+                generation = building
+            else:
+                for table in EMBEDDING_TABLES:
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}__g{building}')
+                cursor.execute("UPDATE embedding_generations SET status = 'abandoned' WHERE generation = ?", (building,))
+        if generation is None:
+            cursor.execute("INSERT INTO embedding_generations (encoder, model, status) VALUES (?, ?, 'building')",
+                           (spec, target.name))
+            generation = cursor.lastrowid
+        conn.commit()
         
-        # Process each company
-        for ticker, name, description, industry, sector in companies:
-            # Vectorize company overview
-            overview = f"{name} ({ticker}) is a company in the {industry} industry within the {sector} sector. {description}"
-            overview_embedding = self.model.encode(overview)
-            
-            cursor.execute(
-                'INSERT INTO company_embeddings (ticker, info_type, content, embedding) VALUES (?, ?, ?, ?)',
-                (ticker, 'overview', overview, overview_embedding.tobytes())
-            )
-            
-            # Get and vectorize company metrics
-            cursor.execute('SELECT metric_name, period, value FROM metrics WHERE ticker = ?', (ticker,))
-            metrics = cursor.fetchall()
+        start = time.time()
+        written = 0
+        for table in EMBEDDING_TABLES:
+            shadow = self._create_shadow_table(cursor, table, generation)
+            conn.commit()
             
-            for metric_name, period, value in metrics:
-                metric_content = f"{ticker} {metric_name} for {period}: {value}"
-                metric_embedding = self.model.encode(metric_content)
+            after_id = 0
+            while True:
+                rows = self._copy_pending_rows(cursor, table, shadow, target, batch_size, after_id=after_id,
+                                               limit=batch_size)
+                if not rows:
+                    break
+                conn.commit()
+                after_id = rows[-1]
+                written += len(rows)
+                self._report_progress(f'Re-embedding with {target.name}', written, start)
                 
-                cursor.execute(
-                    'INSERT INTO metric_embeddings (ticker, metric_name, period, value, embedding) VALUES (?, ?, ?, ?, ?)',
-                    (ticker, metric_name, period, value, metric_embedding.tobytes())
-                )
-        
-        conn.commit()
-        conn.close()
-        
-        print(f"Vectorized information for {len(companies)} companies")
+                if rows_per_second:
+                    delay = written / rows_per_second - (time.time() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+        
+        # Catch up with writes made during the build and swap the tables, holding the
+        # write lock so no writer can slip in between
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for table in EMBEDDING_TABLES:
+                shadow = f'{table}__g{generation}'
+                written += len(self._copy_pending_rows(cursor, table, shadow, target, batch_size))
+                cursor.execute(f'DELETE FROM {shadow} WHERE id NOT IN (SELECT id FROM {table})')
+                
+                # Dropping a table deletes its sqlite_sequence entry, and the shadow's only
+                # reaches its largest copied id. Carry the high-water mark over so ids of
+                # deleted rows, which saved indexes and caches may still hold, are never reused
+                cursor.execute('SELECT MAX(seq) FROM sqlite_sequence WHERE name IN (?, ?)', (table, shadow))
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f'DROP TABLE {table}')
+                cursor.execute(f'ALTER TABLE {shadow} RENAME TO {table}')
+                if sequence is not None:
+                    cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence))
+            self._create_embedding_table_objects(cursor)
+            
+            # Resident indexes reload on a mutation count change
+            cursor.execute('UPDATE embedding_state SET mutations = mutations + 1')
+            cursor.execute("UPDATE embedding_generations SET status = 'retired' WHERE status = 'active'")
+            cursor.execute('''
+                UPDATE embedding_generations SET status = 'active', dim = ?, activated_at = CURRENT_TIMESTAMP
+                WHERE generation = ?
+            ''', (target.dim, generation))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        print(f"Activated embedding generation {generation} ({target.name}): {written} rows re-embedded "
+              f"in {time.time() - start:.1f}s")
+        self._sync_generation(force=True)
     
-    def _split_document_into_sections(self, content, title):
+    def _create_shadow_table(self, cursor, table, generation):
         """
-        Split a document into logical sections for vectorization.
+        Create the copy of an embedding table that a new generation is built in.
         
         Args:
-            content (str): Document content
-            title (str): Document title
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): Embedding table name
+            generation (int): Generation being built
             
         Returns:
-            list: List of section dictionaries with title and content
+            str: Name of the shadow table
         """
-        # Simple splitting by paragraphs for demonstration
-        # In a production system, would use more sophisticated methods
-        paragraphs = content.split('\n\n')
-        
-        # Group paragraphs into sections (max ~512 tokens per section)
-        sections = []
-        current_section = {'title': title, 'content': ''}
-        
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-                
-            # If paragraph starts with a potential heading, start a new section
-            if paragraph.isupper() or (len(paragraph) < 100 and paragraph.endswith(':')):
-                if current_section['content']:
-                    sections.append(current_section)
-                current_section = {'title': paragraph, 'content': ''}
-            else:
-                if len(current_section['content']) + len(paragraph) > 2000:  # Approximate token limit
-                    sections.append(current_section)
-                    current_section = {'title': current_section['title'] + ' (continued)', 'content': paragraph}
-                else:
-                    if current_section['content']:
-                        current_section['content'] += '\n\n'
-                    current_section['content'] += paragraph
-        
-        # Add the last section if it has content
-        if current_section['content']:
-            sections.append(current_section)
-        
-        return sections
+        shadow = f'{table}__g{generation}'
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        sql = cursor.fetchone()[0]
+        cursor.execute(re.sub(rf'^CREATE TABLE\s+"?{table}"?', f'CREATE TABLE IF NOT EXISTS {shadow}', sql))
+        return shadow
     
-    def semantic_search(self, query, top_k=5):
+    def _copy_pending_rows(self, cursor, table, shadow, target, batch_size, after_id=0, limit=-1):
         """
-        Perform semantic search using vector embeddings.
+        Re-embed the rows of an embedding table that are missing or outdated in its shadow.
         
         Args:
-            query (str): Search query
-            top_k (int): Number of top results to return
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): Embedding table name
+            shadow (str): Shadow table of the generation being built
+            target (object): Encoder of the new generation
+            batch_size (int): Encoder batch size
+            after_id (int): Only rows with a larger id are copied
+            limit (int): Maximum number of rows copied; -1 for all
             
         Returns:
-            list: Top matching document sections
+            list: Ids of the copied rows, ascending
         """
-        # Generate embedding for the query
-        query_embedding = self.model.encode(query)
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [row[1] for row in cursor.fetchall() if row[1] != 'embedding']
+        cursor.execute(f'''
+            SELECT {', '.join(f'a.{column}' for column in columns)}
+            FROM {table} a
+            LEFT JOIN {shadow} s ON s.id = a.id
+            WHERE a.id > ? AND (s.id IS NULL OR s.content_hash IS NOT a.content_hash)
+            ORDER BY a.id
+            LIMIT ?
+        ''', (after_id, limit))
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        
+        texts = [_embedding_text(table, dict(zip(columns, row))) for row in rows]
+        embeddings = target.encode(texts, batch_size=batch_size)
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {shadow} ({', '.join(columns)}, embedding) "
+            f"VALUES ({', '.join(['?'] * (len(columns) + 1))})",
+            [tuple(row) + (np.asarray(embedding, dtype=np.float32).tobytes(),) for row, embedding in zip(rows, embeddings)]
+        )
+        return [row[columns.index('id')] for row in rows]
+    
+    def generation_status(self):
+        """
+        Describe the embedding generations of the database.
         
+        Returns:
+            list: Generation dictionaries (generation, encoder, model, dim, status,
+                created_at, activated_at), newest first
+        """
         conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        
-        # Get all document embeddings
-        cursor.execute('SELECT id, doc_id, section_title, section_content, embedding FROM document_embeddings')
-        results = cursor.fetchall()
-        
-        # Calculate similarity scores
-        similarities = []
-        for id, doc_id, section_title, section_content, embedding_bytes in results:
-            embedding = np.frombuffer(embedding_bytes, dtype=np.float32)
-            similarity = cosine_similarity([query_embedding], [embedding])[0][0]
-            similarities.append((id, doc_id, section_title, section_content, similarity))
-        
-        # Sort by similarity score
-        similarities.sort(key=lambda x: x[4], reverse=True)
-        
-        # Get document details for top results
-        top_results = []
-        for id, doc_id, section_title, section_content, similarity in similarities[:top_k]:
-            cursor.execute('SELECT ticker, doc_type, title, filing_date FROM documents WHERE id = ?', (doc_id,))
-            doc_info = cursor.fetchone()
-            
-            if doc_info:
-                ticker, doc_type, title, filing_date = doc_info
-                top_results.append({
-                    'id': id,
-                    'doc_id': doc_id,
-                    'ticker': ticker,
-                    'doc_type': doc_type,
-                    'doc_title': title,
-                    'filing_date': filing_date,
-                    'section_title': section_title,
-                    'section_content': section_content,
-                    'similarity': float(similarity)
-                })
-        
+        cursor.execute('SELECT * FROM embedding_generations ORDER BY generation DESC')
+        generations = [dict(row) for row in cursor.fetchall()]
         conn.close()
-        return top_results
+        return generations
     
-    def company_semantic_search(self, query, ticker=None, top_k=5):
+    def create_fulltext_index(self, rebuild=False):
         """
-        Perform semantic search on company information.
+        Create the FTS5 keyword indexes over documents and document sections.
+        
+        This is a migration, run once per database before the servers start (see
+        DEPLOYMENT_GUIDE.md). Populating a new index reads every document, and
+        constructing a knowledge base only checks whether the indexes exist, so server
+        workers neither pay for it nor race each other for the write lock. Workers
+        started before the migration keep using LIKE until restarted.
         
         Args:
-            query (str): Search query
-            ticker (str, optional): Limit search to specific company
-            top_k (int): Number of top results to return
+            rebuild (bool): Also repopulate indexes that already exist
             
         Returns:
-            list: Top matching company information
+            bool: True if the indexes are available, False if SQLite lacks FTS5
         """
-        # Generate embedding for the query
-        query_embedding = self.model.encode(query)
-        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        start = time.time()
+        self.fts_enabled = self._initialize_fulltext_index(cursor, rebuild=rebuild)
+        conn.commit()
+        conn.close()
         
-        # Get company embeddings
-        if ticker:
-            cursor.execute('SELECT id, ticker, info_type, content, embedding FROM company_embeddings WHERE ticker = ?', (ticker,))
-        else:
-            cursor.execute('SELECT id, ticker, info_type, content, embedding FROM company_embeddings')
+        if self.fts_enabled:
+            print(f"Full-text indexes ready in {time.time() - start:.1f}s")
+        return self.fts_enabled
+    
+    def _initialize_fulltext_index(self, cursor, rebuild=False):
+        """
+        Create the FTS5 keyword indexes and their sync triggers.
         
-        results = cursor.fetchall()
+        The indexes use external content, so the text is not stored twice, and are
+        kept in sync by triggers on the content tables. A newly created index is
+        populated from the existing rows.
         
-        # Calculate similarity scores
-        similarities = []
-        for id, ticker, info_type, content, embedding_bytes in results:
-            embedding = np.frombuffer(embedding_bytes, dtype=np.float32)
-            similarity = cosine_similarity([query_embedding], [embedding])[0][0]
-            similarities.append((id, ticker, info_type, content, similarity))
+        Args:
+            cursor (sqlite3.Cursor): Database cursor
+            rebuild (bool): Also repopulate indexes that already exist
+            
+        Returns:
+            bool: True if the indexes are available, False if SQLite lacks FTS5
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
+        existing = {row[0] for row in cursor.fetchall()}
         
-        # Sort by similarity score
-        similarities.sort(key=lambda x: x[4], reverse=True)
+        for name, (table, columns) in FULLTEXT_TABLES.items():
+            if table not in existing:
+                continue
+            
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f'new.{column}' for column in columns)
+            old_values = ', '.join(f'old.{column}' for column in columns)
+            try:
+                cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+                    {column_list}, content='{table}', content_rowid='id', tokenize='porter unicode61'
+                )
+                ''')
+            except sqlite3.OperationalError as e:
+                print(f"FTS5 unavailable, keyword search falls back to LIKE: {e}")
+                return False
+            
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {name} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+            ''')
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {name} ({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+            ''')
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO {name} ({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {name} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+            ''')
+            
+            if rebuild or name not in existing:
+                cursor.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
         
-        # Format top results
-        top_results = []
-        for id, ticker, info_type, content, similarity in similarities[:top_k]:
-            top_results.append({
-                'id': id,
-                'ticker': ticker,
-                'info_type': info_type,
-                'content': content,
-                'similarity': float(similarity)
-            })
+        return True
+    
+    def _encode_batch(self, texts, batch_size):
+        """
+        Encode a batch of texts with one model call.
         
-        conn.close()
-        return top_results
+        Args:
+            texts (list): Texts to encode
+            batch_size (int): Encoder batch size
+            
+        Returns:
+            list: float32 embedding bytes, one per text
+        """
+        embeddings = self.encoder.encode(texts, batch_size=batch_size)
+        return [np.asarray(embedding, dtype=np.float32).tobytes() for embedding in embeddings]
     
-    def metric_semantic_search(self, query, ticker=None, top_k=5):
+    def _encode_query(self, query):
         """
-        Perform semantic search on financial metrics.
+        Embed a search query, reusing the cached embedding for repeated queries.
         
         Args:
             query (str): Search query
-            ticker (str, optional): Limit search to specific company
-            top_k (int): Number of top results to return
             
         Returns:
-            list: Top matching financial metrics
+            numpy.ndarray: Read-only query embedding
         """
-        # Generate embedding for the query
-        query_embedding = self.model.encode(query)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get metric embeddings
-        if ticker:
-            cursor.execute('SELECT id, ticker, metric_name, period, value, embedding FROM metric_embeddings WHERE ticker = ?', (ticker,))
-        else:
-            cursor.execute('SELECT id, ticker, metric_name, period, value, embedding FROM metric_embeddings')
-        
-        results = cursor.fetchall()
-        
-        # Calculate similarity scores
-        similarities = []
-        for id, ticker, metric_name, period, value, embedding_bytes in results:
-            embedding = np.frombuffer(embedding_bytes, dtype=np.float32)
-            similarity = cosine_similarity([query_embedding], [embedding])[0][0]
-            similarities.append((id, ticker, metric_name, period, value, similarity))
-        
-        # Sort by similarity score
-        similarities.sort(key=lambda x: x[5], reverse=True)
-        
-        # Format top results
-        top_results = []
-        for id, ticker, metric_name, period, value, similarity in similarities[:top_k]:
-            top_results.append({
-                'id': id,
-                'ticker': ticker,
-                'metric_name': metric_name,
-                'period': period,
-                'value': value,
-                'similarity': float(similarity)
-            })
-        
-        conn.close()
-        return top_results
+        self._sync_generation()
+        embedding = self.query_cache.get(query)
+        if embedding is None:
+            embedding = self.query_cache.put(query, self.encoder.encode(query))
+        return embedding
     
-    def hybrid_search(self, query, ticker=None, doc_types=None, top_k=10):
+    def _encode_queries(self, queries):
         """
-        Perform hybrid search combining semantic and keyword search.
+        Embed many search queries, encoding all uncached ones in a single model call.
         
         Args:
-            query (str): Search query
-            ticker (str, optional): Limit search to specific company
-            doc_types (list, optional): Limit search to specific document types
-            top_k (int): Number of top results to return
+            queries (list): Search queries
             
         Returns:
-            list: Top matching results
+            numpy.ndarray: Query embedding matrix, one row per query
         """
-        # Get semantic search results
-        semantic_results = self.semantic_search(query, top_k=top_k*2)
+        self._sync_generation()
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = [position for position, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self.encoder.encode([queries[position] for position in missing])
+            for position, embedding in zip(missing, encoded):
+                embeddings[position] = self.query_cache.put(queries[position], embedding)
+        return np.vstack(embeddings)
+    
+    def _report_progress(self, label, count, start):
+        """Print the number of items embedded so far and the throughput."""
+        elapsed = max(time.time() - start, 1e-9)
+        print(f"{label}: {count} embedded ({count / elapsed:.1f}/sec)")
+    
+    def _content_hash(self, values):
+        """
+        Hash the stored text fields of an embedding row.
         
-        # Filter by ticker and doc_type if specified
-        if ticker or doc_types:
-            filtered_results = []
-            for result in semantic_results:
-                if ticker and result['ticker'] != ticker:
-                    continue
-                if doc_types and result['doc_type'] not in doc_types:
+        The encoder is not part of the hash: each embedding generation records its
+        encoder, and reembed() compares hashes across generations to find changed rows.
+        """
+        return hashlib.sha256('\x1f'.join(str(value) for value in values).encode('utf-8')).hexdigest()
+    
+    def _load_embedding_keys(self, cursor, table, key_columns):
+        """
+        Load the key -> (row id, content hash) map of an embedding table.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): Embedding table name
+            key_columns (tuple): Columns identifying a row
+            
+        Returns:
+            tuple: (key map, ids of duplicate rows for an already seen key)
+        """
+        cursor.execute(f"SELECT id, {', '.join(key_columns)}, content_hash FROM {table} ORDER BY id")
+        existing = {}
+        duplicate_ids = []
+        for row in cursor.fetchall():
+            key = tuple(str(value) for value in row[1:-1])
+            if key in existing:
+                duplicate_ids.append(row[0])
+            else:
+                existing[key] = (row[0], row[-1])
+        
+        return existing, duplicate_ids
+    
+    def _sync_embeddings(self, conn, table, key_columns, value_columns, items, batch_size, commit_every, label,
+                         prune_all=True, existing=None, scopes=None):
+        """
+        Bring an embedding table in line with a stream of items, embedding only what changed.
+        
+        Each item is identified by its key columns and carries a content hash of its
+        value columns. Rows with an unchanged hash are skipped, rows with a changed hash
+        are re-embedded and updated in place, and new keys are inserted. Existing rows
+        whose key was not produced are deleted: all of them when prune_all is set,
+        otherwise only those sharing a first key column value with a produced item or
+        listed in scopes.
+        Duplicate rows for the same key left by older versions are removed.
+        
+        Args:
+            conn (sqlite3.Connection): Open database connection
+            table (str): Embedding table name
+            key_columns (tuple): Columns identifying a row
+            value_columns (tuple): Stored text columns covered by the content hash
+            items (iterable): (key values, column values, text to embed) tuples, optionally
+                extended with (content hash, embedding bytes) computed elsewhere; an item
+                whose embedding is None and values are None reports an unchanged row
+            batch_size (int): Number of texts encoded per model call
+            commit_every (int): Number of rows written per transaction
+            label (str): Name used in progress output
+            prune_all (bool): Delete every row whose key was not produced
+            existing (tuple, optional): Result of _load_embedding_keys, if already loaded
+            scopes (container, optional): First key column values (as strings) that were
+                processed even if no item was produced for them, checked after the items
+                are consumed
+            
+        Returns:
+            dict: Counts of inserted, updated, unchanged and deleted rows
+        """
+        cursor = conn.cursor()
+        generation = self.generation
+        
+        # Load the current key -> (row id, content hash) map
+        if existing is None:
+            existing = self._load_embedding_keys(cursor, table, key_columns)
+        existing, stale_ids = existing[0], list(existing[1])
+        
+        columns = key_columns + value_columns + ('content_hash', 'embedding')
+        insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        update_sql = (f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns[len(key_columns):])} "
+                      "WHERE id = ?")
+        
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        start = time.time()
+        pending = []
+        seen_scopes = set()
+        written = 0
+        committed = 0
+        
+        def flush():
+            # Encode only the items that do not carry a precomputed embedding
+            missing = [position for position, item in enumerate(pending) if item[4] is None]
+            encoded = self._encode_batch([pending[position][3] for position in missing], batch_size) if missing else []
+            embeddings = [item[4] for item in pending]
+            for position, embedding in zip(missing, encoded):
+                embeddings[position] = embedding
+            
+            inserts = []
+            updates = []
+            for (row_id, key, params, _, _), embedding in zip(pending, embeddings):
+                if row_id is None:
+                    inserts.append(key + params + (embedding,))
+                else:
+                    updates.append(params + (embedding, row_id))
+            cursor.executemany(insert_sql, inserts)
+            cursor.executemany(update_sql, updates)
+            
+            # The writes hold the write lock, so a generation swap cannot commit after this check
+            active = self._get_active_generation(cursor)
+            if generation is not None and active[0] != generation:
+                conn.rollback()
+                raise RuntimeError(f"Embedding generation {active[0]} ({active[2]}) was activated during "
+                                   f"vectorization; run it again to embed with the new encoder")
+            stats['inserted'] += len(inserts)
+            stats['updated'] += len(updates)
+            return len(pending)
+        
+        for item in items:
+            key, values, text = item[:3]
+            content_hash, embedding = item[3:] if len(item) > 3 else (self._content_hash(values), None)
+            key = tuple(str(value) for value in key)
+            seen_scopes.add(key[0])
+            row_id, existing_hash = existing.pop(key, (None, None))
+            
+            if existing_hash == content_hash or values is None:
+                stats['unchanged'] += 1
+                continue
+            
+            pending.append((row_id, key, tuple(values) + (content_hash,), text, embedding))
+            if len(pending) >= batch_size:
+                written += flush()
+                pending = []
+                
+                if written - committed >= commit_every:
+                    conn.commit()
+                    committed = written
+                    self._report_progress(label, written, start)
+        
+        if pending:
+            written += flush()
+        
+        # Remove rows whose key no longer exists in the source data
+        for key, (row_id, _) in existing.items():
+            if prune_all or key[0] in seen_scopes or (scopes is not None and key[0] in scopes):
+                stale_ids.append(row_id)
+        
+        for offset in range(0, len(stale_ids), 500):
+            chunk = stale_ids[offset:offset + 500]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['?'] * len(chunk))})", chunk)
+        stats['deleted'] = len(stale_ids)
+        
+        # Record the dimension of a generation created before anything was embedded
+        if generation is not None:
+            cursor.execute(f'''
+                UPDATE embedding_generations SET dim = (SELECT length(embedding) / 4 FROM {table} LIMIT 1)
+                WHERE generation = ? AND dim IS NULL
+            ''', (generation,))
+        
+        # The updates and deletes above were logged; drop what no approximate index needs
+        self._prune_changes(cursor)
+        conn.commit()
+        
+        elapsed = max(time.time() - start, 1e-9)
+        print(f"{label}: {stats['inserted']} inserted, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+              f"{stats['deleted']} deleted ({written / elapsed:.1f} embedded/sec)")
+        return stats
+    
+    def _iter_document_sections(self, documents):
+        """
+        Split documents into the items consumed by _sync_embeddings.
+        
+        Args:
+            documents (iterable): (id, ticker, doc_type, title, content) rows
+            
+        Yields:
+            tuple: ((doc_id, section_id), (section_title, section_content), section_content)
+        """
+        for doc_id, ticker, doc_type, title, content in documents:
+            # Split document into sections lazily
+            sections = self._split_document_into_sections(content or '', title)
+            
+            for section_id, section_data in enumerate(sections):
+                section_title = section_data.get('title', f'Section {section_id}')
+                section_content = section_data.get('content', '')
+                
+                # Skip empty sections
+                if not section_content.strip():
                     continue
-                filtered_results.append(result)
-            semantic_results = filtered_results
+                
+                yield (doc_id, section_id), (section_title, section_content), section_content
+    
+    def _dedupe_sections(self, items, tickers, threshold, refs):
+        """
+        Drop near-duplicate sections from a stream of document section items.
+        
+        Sections are compared with the earlier sections of the same company in stream
+        order; the first occurrence stays canonical and is passed on to be embedded,
+        later near duplicates are collected as references to it. The stream must be
+        grouped by company, newest filing first, so search results show the latest
+        wording: the detector is started afresh for each company, so only one company's
+        signatures are held at a time.
+        
+        Args:
+            items (iterable): Items for _sync_embeddings whose text is the section content
+            tickers (dict): Ticker by doc_id (as a string) of the streamed documents
+            threshold (float): Minimum estimated Jaccard similarity of a duplicate
+            refs (list): Receives (key, section title, canonical key, similarity) of each
+                duplicate
+            
+        Yields:
+            tuple: Items of canonical sections
+        """
+        ticker = detector = None
+        for item in items:
+            key = tuple(str(value) for value in item[0])
+            if detector is None or tickers.get(key[0]) != ticker:
+                ticker = tickers.get(key[0])
+                detector = NearDuplicateDetector(threshold=threshold)
+            match = detector.check(key, item[2] or '')
+            if match is None:
+                yield item
+            else:
+                section_title = item[1][0] if item[1] is not None else None
+                refs.append((key, section_title, match[0], match[1]))
+    
+    def _store_section_refs(self, conn, refs, doc_ids=None):
+        """
+        Replace the stored near-duplicate references of the vectorized documents.
+        
+        Args:
+            conn (sqlite3.Connection): Open database connection
+            refs (list): Duplicates collected by _dedupe_sections
+            doc_ids (iterable, optional): Documents whose references are replaced; all
+                references are replaced when omitted
+        """
+        cursor = conn.cursor()
+        if doc_ids is None:
+            cursor.execute('DELETE FROM document_section_refs')
+        else:
+            doc_ids = list(doc_ids)
+            for offset in range(0, len(doc_ids), 500):
+                chunk = doc_ids[offset:offset + 500]
+                cursor.execute(f"DELETE FROM document_section_refs WHERE doc_id IN ({', '.join(['?'] * len(chunk))})",
+                               chunk)
+        
+        # Canonical sections were just written, so resolve their keys to row ids now
+        row_ids = {key: row_id for key, (row_id, _) in
+                   self._load_embedding_keys(cursor, 'document_embeddings', ('doc_id', 'section_id'))[0].items()}
+        cursor.executemany(
+            'INSERT OR REPLACE INTO document_section_refs '
+            '(doc_id, section_id, section_title, canonical_id, similarity) VALUES (?, ?, ?, ?, ?)',
+            [key + (section_title, row_ids[canonical], similarity)
+             for key, section_title, canonical, similarity in refs if canonical in row_ids]
+        )
+        conn.commit()
+    
+    def _promote_orphaned_refs(self, conn, threshold, batch_size, commit_every):
+        """
+        Re-home near-duplicate references whose canonical section no longer exists.
+        
+        A canonical row goes away when its section changes, is re-split away or becomes
+        a reference to a newer filing. Its references may belong to documents that were
+        not streamed (a run with a limit), so instead of being dropped the newest one is
+        promoted: its section is embedded, and the others are checked against it and
+        either point to it or are promoted in turn.
+        
+        Args:
+            conn (sqlite3.Connection): Open database connection
+            threshold (float, optional): Minimum estimated Jaccard similarity of a
+                reference; None promotes every orphaned reference
+            batch_size (int): Number of sections encoded per model call
+            commit_every (int): Number of sections written per transaction
+            
+        Returns:
+            int: Number of promoted sections
+        """
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT r.canonical_id, r.doc_id, r.section_id, d.title, d.content
+            FROM document_section_refs r
+            JOIN documents d ON d.id = r.doc_id
+            WHERE r.canonical_id NOT IN (SELECT id FROM document_embeddings)
+            ORDER BY r.canonical_id, d.filing_date DESC, d.id DESC
+        ''')
+        orphans = cursor.fetchall()
+        
+        promoted = []
+        repointed = {}
+        sections = {}
+        canonical_id = detector = None
+        for old_id, doc_id, section_id, title, content in orphans:
+            key = (str(doc_id), str(section_id))
+            if key[0] not in sections:
+                sections[key[0]] = list(self._split_document_into_sections(content or '', title))
+            position = int(section_id) if key[1].isdigit() else len(sections[key[0]])
+            if position >= len(sections[key[0]]):
+                continue
+            section_title = sections[key[0]][position].get('title', f'Section {section_id}')
+            section_content = sections[key[0]][position].get('content', '')
+            if not section_content.strip():
+                continue
+            
+            if old_id != canonical_id:
+                canonical_id = old_id
+                detector = NearDuplicateDetector(threshold=threshold) if threshold is not None else None
+            match = detector.check(key, section_content) if detector is not None else None
+            if match is None:
+                promoted.append((key, (section_title, section_content), section_content))
+            else:
+                repointed[key] = match
+        
+        if promoted:
+            # Nothing is pruned: the promoted keys are new and no other row is passed in
+            self._sync_embeddings(conn, 'document_embeddings', ('doc_id', 'section_id'),
+                                  ('section_title', 'section_content'), promoted, batch_size, commit_every,
+                                  'Promoted sections', prune_all=False, existing=({}, []))
+            cursor.executemany('DELETE FROM document_section_refs WHERE doc_id = ? AND section_id = ?',
+                               [item[0] for item in promoted])
+        
+        row_ids = {}
+        for key, (canonical, similarity) in repointed.items():
+            if canonical not in row_ids:
+                cursor.execute('SELECT id FROM document_embeddings WHERE doc_id = ? AND section_id = ?', canonical)
+                row_ids[canonical] = cursor.fetchone()[0]
+            cursor.execute('UPDATE document_section_refs SET canonical_id = ?, similarity = ? '
+                           'WHERE doc_id = ? AND section_id = ?', (row_ids[canonical], similarity) + key)
+        
+        # References whose own section or document is gone as well point nowhere; drop them
+        cursor.execute('''
+            DELETE FROM document_section_refs
+            WHERE canonical_id NOT IN (SELECT id FROM document_embeddings)
+        ''')
+        conn.commit()
+        return len(promoted)
+    
+    def _stream_documents(self, cursor, limit=None, fetch_size=32, by_ticker=False):
+        """
+        Stream documents from the database without materializing the whole table.
+        
+        Args:
+            cursor (sqlite3.Cursor): Cursor dedicated to this stream
+            limit (int, optional): Limit the number of documents, taking the first by id
+            fetch_size (int): Number of documents fetched per round trip
+            by_ticker (bool): Group the documents by ticker, newest filing first within each
+            
+        Yields:
+            list: Chunks of (id, ticker, doc_type, title, content) rows
+        """
+        order = 'ticker, filing_date DESC, id DESC' if by_ticker else 'id'
+        if limit:
+            cursor.execute(f'''
+                SELECT id, ticker, doc_type, title, content FROM documents
+                WHERE id IN (SELECT id FROM documents ORDER BY id LIMIT ?)
+                ORDER BY {order}
+            ''', (limit,))
+        else:
+            cursor.execute(f'SELECT id, ticker, doc_type, title, content FROM documents ORDER BY {order}')
+        
+        while True:
+            documents = cursor.fetchmany(fetch_size)
+            if not documents:
+                break
+            yield documents
+    
+    def _iter_parallel_sections(self, chunks, existing, workers, batch_size):
+        """
+        Split and encode document chunks in a process pool, yielding their sections in order.
+        
+        At most two chunks per worker are in flight, so memory stays bounded however
+        large the documents table is. Workers skip encoding sections whose content hash
+        matches the stored one.
+        
+        Args:
+            chunks (iterable): Lists of document rows from _stream_documents
+            existing (dict): Key map from _load_embedding_keys for document_embeddings
+            workers (int): Number of worker processes
+            batch_size (int): Encoder batch size inside each worker
+            
+        Yields:
+            tuple: Items for _sync_embeddings with precomputed hashes and embeddings
+        """
+        # Group stored hashes by document so each chunk only ships its own
+        hashes_by_doc = {}
+        for key, (_, content_hash) in existing.items():
+            hashes_by_doc.setdefault(key[0], {})[key] = content_hash
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_vectorize_worker,
+                                 initargs=(self.db_path, self._encoder_config, self.model_name,
+                                           self.section_tokens, self.section_overlap)) as executor:
+            in_flight = deque()
+            for documents in chunks:
+                known_hashes = {}
+                for document in documents:
+                    known_hashes.update(hashes_by_doc.get(str(document[0]), {}))
+                in_flight.append(executor.submit(_vectorize_document_chunk, documents, known_hashes, batch_size))
+                
+                if len(in_flight) >= 2 * workers:
+                    yield from in_flight.popleft().result()
+            
+            while in_flight:
+                yield from in_flight.popleft().result()
+    
+    def vectorize_documents(self, limit=None, batch_size=64, commit_every=1000, workers=None, fetch_size=32,
+                            dedupe_threshold=0.8):
+        """
+        Vectorize all documents in the knowledge base.
+        
+        Re-running is incremental: sections whose content hash is unchanged are skipped,
+        changed sections are re-embedded in place, and sections that disappeared from a
+        document are deleted. Without a limit, sections of deleted documents are removed
+        as well. Sections are gathered across documents into batches, each batch is
+        encoded with a single model call and written with executemany, and the
+        transaction is committed every commit_every sections.
+        
+        Documents are streamed with fetchmany. With workers > 1, splitting and encoding
+        run in a process pool while this process remains the single writer.
+        
+        Sections that near-duplicate an earlier section of the same company, such as
+        forward-looking statement disclaimers repeated in every filing, are detected
+        with MinHash/LSH and not embedded: they are recorded in document_section_refs
+        as references to the canonical section, and search results list them under
+        'duplicates'. Searches filtered by doc_types only see a repeated passage if its
+        canonical section has a matching type. Documents are then streamed company by
+        company, newest filing first, so the detector only holds one company's
+        signatures and the newest occurrence is the canonical one. References left
+        without their canonical section are re-homed rather than dropped. Worker processes
+        still encode duplicates before they are detected here, but they are not stored.
+        
+        Args:
+            limit (int, optional): Limit the number of documents to process
+            batch_size (int): Number of sections encoded per model call
+            commit_every (int): Number of sections written per transaction
+            workers (int, optional): Number of worker processes for splitting and encoding
+            fetch_size (int): Number of documents fetched per round trip (and per worker task)
+            dedupe_threshold (float, optional): Minimum estimated Jaccard similarity of
+                word shingles for a section to be stored as a reference; None embeds
+                every section
+            
+        Returns:
+            dict: Counts of inserted, updated, unchanged and deleted sections, of
+                near-duplicate sections stored as references and of references promoted
+                to embedded sections after losing their canonical one
+        """
+        self._sync_generation(force=True)
+        conn = sqlite3.connect(self.db_path)
+        key_columns = ('doc_id', 'section_id')
+        existing = self._load_embedding_keys(conn.cursor(), 'document_embeddings', key_columns)
+        
+        # Record each document's ticker as it streams past
+        tickers = {}
+        
+        def chunks():
+            for documents in self._stream_documents(conn.cursor(), limit, fetch_size,
+                                                    by_ticker=dedupe_threshold is not None):
+                tickers.update((str(document[0]), document[1]) for document in documents)
+                yield documents
+        
+        if workers and workers > 1:
+            items = self._iter_parallel_sections(chunks(), existing[0], workers, batch_size)
+        else:
+            items = self._iter_document_sections(document for documents in chunks() for document in documents)
+        
+        refs = []
+        if dedupe_threshold is not None:
+            items = self._dedupe_sections(items, tickers, dedupe_threshold, refs)
+        
+        # Every streamed document is pruned, including one whose sections all became references
+        stats = self._sync_embeddings(
+            conn, 'document_embeddings', key_columns, ('section_title', 'section_content'),
+            items, batch_size, commit_every, 'Document sections', prune_all=not limit, existing=existing,
+            scopes=tickers
+        )
+        self._store_section_refs(conn, refs, doc_ids=tickers if limit else None)
+        stats['duplicates'] = len(refs)
+        stats['promoted'] = self._promote_orphaned_refs(conn, dedupe_threshold, batch_size, commit_every)
+        conn.close()
+        
+        print(f"Vectorized {len(tickers)} documents ({len(refs)} near-duplicate sections stored as references)")
+        return stats
+    
+    def vectorize_company_info(self, batch_size=64, commit_every=1000):
+        """
+        Vectorize company information for all companies in the knowledge base.
+        
+        Like vectorize_documents, re-running only embeds overviews and metrics whose
+        text changed and removes rows for companies or metrics that no longer exist.
+        
+        Args:
+            batch_size (int): Number of texts encoded per model call
+            commit_every (int): Number of rows written per transaction
+            
+        Returns:
+            dict: Counts per table of inserted, updated, unchanged and deleted rows
+        """
+        self._sync_generation(force=True)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Get all companies
+        cursor.execute('SELECT ticker, name, description, industry, sector FROM companies')
+        companies = cursor.fetchall()
+        
+        # Build company overviews and metric strings
+        overview_items = []
+        metric_items = []
+        for ticker, name, description, industry, sector in companies:
+            overview = f"{name} ({ticker}) is a company in the {industry} industry within the {sector} sector. {description}"
+            overview_items.append(((ticker, 'overview'), (overview,), overview))
+            
+            cursor.execute('SELECT metric_name, period, value FROM metrics WHERE ticker = ?', (ticker,))
+            for metric_name, period, value in cursor.fetchall():
+                metric_content = f"{ticker} {metric_name} for {period}: {value}"
+                metric_items.append(((ticker, metric_name, period), (value,), metric_content))
+        
+        stats = {
+            'company_embeddings': self._sync_embeddings(
+                conn, 'company_embeddings', ('ticker', 'info_type'), ('content',), overview_items,
+                batch_size, commit_every, 'Company overviews'
+            ),
+            'metric_embeddings': self._sync_embeddings(
+                conn, 'metric_embeddings', ('ticker', 'metric_name', 'period'), ('value',), metric_items,
+                batch_size, commit_every, 'Company metrics'
+            )
+        }
+        conn.close()
+        
+        print(f"Vectorized information for {len(companies)} companies")
+        return stats
+    
+    def _split_document_into_sections(self, content, title):
+        """
+        Split a document into logical sections for vectorization.
+        
+        Sections are sized in the encoder's own tokens, so none is silently truncated
+        when embedded, and continued sections overlap by section_overlap tokens.
+        
+        Args:
+            content (str or iterable): Document content, or an iterable of text chunks
+            title (str): Document title
+            
+        Returns:
+            generator: Section dictionaries with title and content, produced lazily
+        """
+        max_tokens = self.section_tokens or self.encoder.max_tokens or DEFAULT_SECTION_TOKENS
+        return split_sections(content, title, token_spans=self.encoder.token_spans, max_tokens=max_tokens,
+                              overlap_tokens=self.section_overlap)
+    
+    def _ensure_column(self, cursor, table, column, declaration):
+        """
+        Add a column to an existing table if it is missing.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): Table name
+            column (str): Column name
+            declaration (str): Column type and constraints
+        """
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    
+    def _get_table_state(self, cursor, table):
+        """
+        Get the change markers for an embedding table.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): Embedding table name
+            
+        Returns:
+            tuple: (max row id, mutation count)
+        """
+        cursor.execute(
+            f'SELECT (SELECT MAX(id) FROM {table}), mutations FROM embedding_state WHERE table_name = ?',
+            (table,)
+        )
+        max_id, mutations = cursor.fetchone()
+        return max_id or 0, mutations
+    
+    def _load_document_rows(self, cursor, after_id=0, embeddings=True):
+        """
+        Load document embeddings with a row id greater than after_id.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            after_id (int): Only rows with a larger id are loaded
+            embeddings (bool): Read the vectors; when False only ids and attributes are
+                read and vectors is None
+            
+        Returns:
+            tuple: (ids, attributes, vectors) ordered by id, where attributes holds
+                doc_id, ticker and doc_type lists
+        """
+        cursor.execute(f'''
+            SELECT e.id, e.doc_id, d.ticker, d.doc_type, {'e.embedding' if embeddings else 'NULL'}
+            FROM document_embeddings e
+            LEFT JOIN documents d ON d.id = e.doc_id
+            WHERE e.id > ?
+            ORDER BY e.id
+        ''', (after_id,))
+        
+        ids = []
+        attributes = {'doc_id': [], 'ticker': [], 'doc_type': []}
+        blobs = []
+        for id, doc_id, ticker, doc_type, embedding_bytes in cursor:
+            ids.append(id)
+            attributes['doc_id'].append(int(doc_id))
+            attributes['ticker'].append(ticker)
+            attributes['doc_type'].append(doc_type)
+            blobs.append(embedding_bytes)
+        
+        if not embeddings:
+            return np.array(ids, dtype=np.int64), attributes, None
+        if not blobs:
+            return np.empty(0, dtype=np.int64), attributes, np.empty((0, 0), dtype=np.float32)
+        
+        vectors = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+        return np.array(ids, dtype=np.int64), attributes, vectors
+    
+    def _get_document_attributes(self, cursor):
+        """
+        Return the filter columns of the document embeddings, without their vectors.
+        
+        Approximate searches filter and map hits to documents with these instead of the
+        resident matrix, so an approximate index is the only copy of the vectors kept
+        in memory. Rows added since the last call are appended; an update or delete
+        reloads the columns, which reads no embedding BLOBs.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            
+        Returns:
+            dict: 'labels' (embedding row ids, ascending) and 'doc_id' arrays and
+                'ticker' / 'doc_type' CategoricalColumns, all parallel
+        """
+        max_id, mutations = self._get_table_state(cursor, 'document_embeddings')
+        
+        with self._index_lock:
+            cached = self._doc_attributes
+            if cached is not None and cached[0] == (max_id, mutations):
+                return cached[1]
+            
+            if cached is None or cached[0][1] != mutations or max_id < cached[0][0]:
+                ids, attributes, _ = self._load_document_rows(cursor, embeddings=False)
+                columns = {
+                    'labels': ids,
+                    'doc_id': np.array(attributes['doc_id'], dtype=np.int64),
+                    'ticker': CategoricalColumn(attributes['ticker']),
+                    'doc_type': CategoricalColumn(attributes['doc_type'])
+                }
+            else:
+                ids, attributes, _ = self._load_document_rows(cursor, after_id=cached[0][0], embeddings=False)
+                previous = cached[1]
+                columns = {
+                    'labels': np.concatenate([previous['labels'], ids]),
+                    'doc_id': np.concatenate([previous['doc_id'], np.array(attributes['doc_id'], dtype=np.int64)]),
+                    'ticker': previous['ticker'].extended(attributes['ticker']),
+                    'doc_type': previous['doc_type'].extended(attributes['doc_type'])
+                }
+            
+            # Rows written after the state was read are already loaded; do not append them twice
+            if len(ids):
+                max_id = max(max_id, int(ids[-1]))
+            self._doc_attributes = ((max_id, mutations), columns)
+            return columns
+    
+    def _iter_document_embeddings(self, cursor, after_id=0, block_size=INDEX_BUILD_BLOCK_SIZE):
+        """
+        Stream document embeddings from SQLite in blocks, in row id order.
+        
+        Args:
+            cursor (sqlite3.Cursor): Cursor dedicated to this stream
+            after_id (int): Only rows with a larger id are read
+            block_size (int): Rows per block
+            
+        Yields:
+            tuple: (ids, vectors) of each block
+        """
+        cursor.execute('SELECT id, embedding FROM document_embeddings WHERE id > ? ORDER BY id', (after_id,))
+        while True:
+            rows = cursor.fetchmany(block_size)
+            if not rows:
+                break
+            yield (np.array([row[0] for row in rows], dtype=np.int64),
+                   np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1))
+    
+    def _create_approximate_index(self, cursor, kind, params):
+        """
+        Build an approximate index of a kind from the document embeddings in SQLite.
+        
+        Indexes with a training step (IVF, PQ) are trained on a random sample of at most
+        max_train_size rows first; rows are then added block by block, so only the
+        index itself and one block are held in memory.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            kind (str): Index kind, one of INDEX_TYPES
+            params (dict): Index parameters
+            
+        Returns:
+            object: The built index
+        """
+        cursor.execute('SELECT length(embedding) / 4 FROM document_embeddings LIMIT 1')
+        row = cursor.fetchone()
+        index = INDEX_TYPES[kind](row[0] if row else 0, **params)
+        
+        if row and hasattr(index, 'train'):
+            cursor.execute('SELECT id FROM document_embeddings')
+            ids = np.array([id for id, in cursor.fetchall()], dtype=np.int64)
+            if len(ids) > index.max_train_size:
+                rng = np.random.default_rng(index.seed)
+                ids = np.sort(rng.choice(ids, index.max_train_size, replace=False))
+            index.train(self._fetch_embeddings(cursor, ids)[1])
+        
+        for ids, vectors in self._iter_document_embeddings(cursor):
+            index.add(ids, vectors)
+        return index
+    
+    def _new_document_index(self, dim):
+        """Create an empty resident document index for the configured storage mode."""
+        if self.storage == 'float32':
+            return FlatIndex(dim)
+        return ScalarQuantizedIndex(dim, codec=self.storage)
+    
+    def _get_document_index(self, cursor):
+        """
+        Return the resident document index, bringing it up to date with the database.
+        
+        New rows are appended to the loaded matrix; any update or delete since the last
+        load triggers a full reload. With sharding enabled, each load or append is
+        ordered by shard key and partitioned into shards.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            
+        Returns:
+            tuple: (index, rows) where index is a FlatIndex or ScalarQuantizedIndex and
+                rows maps 'doc_id' to an array and 'ticker' / 'doc_type' to
+                CategoricalColumns, all parallel to the index rows. When the rows are
+                in shard-key order, 'sorted_labels' and 'label_order' hold the labels
+                in ascending order and their row positions
+        """
+        max_id, mutations = self._get_table_state(cursor, 'document_embeddings')
+        
+        with self._index_lock:
+            if self._doc_index is None and self.vector_store:
+                self._attach_vector_store(cursor, max_id, mutations)
+            state = self._doc_index_state
+            
+            if self._doc_index is not None and state != (max_id, mutations) and self._generation_changed(cursor):
+                # The query was encoded for the resident generation; keep serving it
+                return self._doc_index, self._doc_rows
+            
+            if self._doc_index is None or state[1] != mutations or max_id < state[0]:
+                ids, attributes, vectors = self._load_document_rows(cursor)
+                if self.shard_by:
+                    ids, attributes, vectors, years = self._sort_by_shard_key(cursor, ids, attributes, vectors)
+                index = self._new_document_index(vectors.shape[1] if len(vectors) else 0)
+                if len(ids):
+                    index.add(ids, vectors)
+                self._doc_index = index
+                self._doc_rows = {
+                    'doc_id': np.array(attributes['doc_id'], dtype=np.int64),
+                    'ticker': CategoricalColumn(attributes['ticker']),
+                    'doc_type': CategoricalColumn(attributes['doc_type'])
+                }
+                if self.shard_by:
+                    self._shard_document_index(0, years)
+            elif max_id > state[0]:
+                ids, attributes, vectors = self._load_document_rows(cursor, after_id=state[0])
+                if self.shard_by:
+                    ids, attributes, vectors, years = self._sort_by_shard_key(cursor, ids, attributes, vectors)
+                start = len(self._doc_index)
+                label_order = self._doc_rows.get('label_order')
+                # Extend a copy so searches holding the previous index are unaffected
+                if self._doc_index.dim == 0:
+                    index = self._new_document_index(vectors.shape[1])
+                else:
+                    index = copy.copy(self._doc_index)
+                index.add(ids, vectors)
+                self._doc_index = index
+                self._doc_rows = {
+                    'doc_id': np.concatenate([self._doc_rows['doc_id'], np.array(attributes['doc_id'], dtype=np.int64)]),
+                    'ticker': self._doc_rows['ticker'].extended(attributes['ticker']),
+                    'doc_type': self._doc_rows['doc_type'].extended(attributes['doc_type'])
+                }
+                if self.shard_by:
+                    self._shard_document_index(start, years, label_order)
+            
+            self._doc_index_state = (max_id, mutations)
+            return self._doc_index, self._doc_rows
+    
+    def _sort_by_shard_key(self, cursor, ids, attributes, vectors):
+        """
+        Reorder loaded document rows so the rows of each shard key are adjacent.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ids (numpy.ndarray): Embedding row ids
+            attributes (dict): doc_id, ticker and doc_type lists
+            vectors (numpy.ndarray): Embedding matrix
+            
+        Returns:
+            tuple: (ids, attributes, vectors, years) in shard-key order, where years holds
+                the filing year of each row when sharding by year
+        """
+        order, years = self._shard_order(cursor, CategoricalColumn(attributes['ticker']).codes,
+                                         np.array(attributes['doc_id'], dtype=np.int64))
+        attributes = {name: [values[row] for row in order.tolist()] for name, values in attributes.items()}
+        return ids[order], attributes, vectors[order], years
+    
+    def _shard_order(self, cursor, ticker_codes, doc_ids):
+        """
+        Order document rows by shard key.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ticker_codes (numpy.ndarray): Integer ticker code of each row
+            doc_ids (numpy.ndarray): Document id of each row
+            
+        Returns:
+            tuple: (order, years) where order is a stable row permutation and years holds
+                the filing year of each row in that order (None when sharding by ticker)
+        """
+        if self.shard_by == 'ticker':
+            return np.argsort(ticker_codes, kind='stable'), None
+        
+        years = self._get_filing_years(cursor, doc_ids)
+        order = np.argsort(years, kind='stable')
+        return order, years[order]
+    
+    def _shard_document_index(self, start, years=None, label_order=None):
+        """
+        Partition the resident document rows from start on into shards.
+        
+        After a full load every row is partitioned; after an append the rows before
+        start keep their shards, which become views of the extended matrix.
+        
+        Args:
+            start (int): First row to partition
+            years (numpy.ndarray, optional): Filing year of each row from start on, when
+                sharding by year
+            label_order (numpy.ndarray, optional): 'label_order' of the rows before start
+        """
+        index, doc_rows = self._doc_index, self._doc_rows
+        keys = doc_rows['ticker'].codes[start:] if self.shard_by == 'ticker' else years
+        if start:
+            sharded_index = self._sharded_index[1].extended(index, keys)
+        else:
+            sharded_index = ShardedIndex(index, keys, shard_size=self.shard_size)
+        self._sharded_index = (index, sharded_index)
+        
+        # Labels are no longer ascending along the rows; keep a sorted copy to look them
+        # up in. Appended labels are larger than all earlier ones
+        labels = index.labels
+        order = start + np.argsort(labels[start:], kind='stable')
+        if start:
+            order = np.concatenate([label_order, order])
+        doc_rows['label_order'] = order
+        doc_rows['sorted_labels'] = labels[order]
+    
+    def _attach_vector_store(self, cursor, max_id, mutations):
+        """
+        Start the resident document index from the memory-mapped vector store.
+        
+        The store is used when no embedding has been updated or deleted since it was
+        exported; rows added since then are appended from SQLite afterwards, into an
+        in-memory tail that leaves the mapped matrix shared.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            max_id (int): Current max row id of document_embeddings
+            mutations (int): Current mutation count of document_embeddings
+        """
+        try:
+            store = VectorStore(self.vector_store)
+        except (OSError, ValueError) as e:
+            print(f"Vector store unavailable, loading embeddings from SQLite: {e}")
+            return
+        
+        store_max_id, store_mutations = store.source_state
+        if store_mutations != mutations or store_max_id > max_id:
+            print(f"Vector store {self.vector_store} is stale, loading embeddings from SQLite")
+            return
+        
+        ids, vectors, doc_ids = store.ids, store.vectors, store.doc_ids
+        ticker_codes, tickers = store.categories('ticker')
+        doc_type_codes, doc_types = store.categories('doc_type')
+        years = None
+        if self.shard_by:
+            # Taking the rows in shard-key order reads them out of the map into memory
+            order, years = self._shard_order(cursor, ticker_codes, doc_ids)
+            ids, vectors, doc_ids = ids[order], vectors[order], doc_ids[order]
+            ticker_codes, doc_type_codes = ticker_codes[order], doc_type_codes[order]
+        
+        if self.storage == 'float32':
+            index = FlatIndex.wrap(ids, vectors)
+        else:
+            index = self._new_document_index(store.dim)
+            if len(store):
+                index.add(ids, vectors)
+        
+        self._doc_index = index
+        self._doc_rows = {
+            'doc_id': doc_ids,
+            'ticker': CategoricalColumn.from_codes(ticker_codes, tickers),
+            'doc_type': CategoricalColumn.from_codes(doc_type_codes, doc_types)
+        }
+        self._doc_index_state = (store_max_id, store_mutations)
+        if self.shard_by:
+            self._shard_document_index(0, years)
+    
+    def export_vector_store(self, path):
+        """
+        Write the document embeddings to a memory-mapped vector store file.
+        
+        Args:
+            path (str): Destination file path
+            
+        Returns:
+            dict: The header of the written file
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Read the state and the rows in one transaction so they agree
+        cursor.execute('BEGIN')
+        source_state = self._get_table_state(cursor, 'document_embeddings')
+        ids, attributes, vectors = self._load_document_rows(cursor)
+        conn.rollback()
+        conn.close()
+        
+        header = write_vector_store(
+            path, ids, attributes['doc_id'], attributes['ticker'], attributes['doc_type'],
+            normalize_rows(vectors), source_state
+        )
+        print(f"Exported {header['count']} document embeddings to {path}")
+        return header
+    
+    def preload(self):
+        """
+        Load the encoder and the resident document index before worker processes are forked.
+        
+        Call this in the parent of a pre-forking server (e.g. gunicorn with preload_app).
+        Workers then share the model weights and the embedding matrix as copy-on-write
+        pages (a memory-mapped vector store is shared through the page cache either way)
+        instead of each loading a private copy. Everything allocated so far is frozen out
+        of the garbage collector, whose bookkeeping writes would otherwise copy those pages
+        into every worker. Nothing is encoded here: the encoder's thread pools must not be
+        started before the fork.
+        """
+        # Load the encoder weights without running them
+        self.encoder.load()
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        index, _ = self._get_document_index(cursor)
+        conn.close()
+        
+        # Threads and locks do not survive a fork; give each worker its own
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        
+        gc.collect()
+        gc.freeze()
+        print(f"Preloaded encoder and {len(index)} document embeddings for forked workers")
+    
+    def _reset_after_fork(self):
+        """Recreate locks and drop the search and warm-up threads in a forked child."""
+        self._index_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._model_ready = threading.Event()
+        self._warm_up_thread = None
+        self._search_pool = None
+        self._shard_pool = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_threads = {}
+        self._pending_rows = {}
+        self.query_cache._lock = threading.Lock()
+    
+    def _get_last_change(self, cursor):
+        """Return the sequence number of the latest logged embedding update or delete."""
+        # sqlite_sequence keeps the high-water mark after the log has been pruned
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'embedding_changes'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def _get_index_changes(self, cursor, index):
+        """
+        Find the document embeddings updated or deleted since an approximate index caught up.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            index: Approximate index over document_embeddings
+            
+        Returns:
+            numpy.ndarray: Changed row ids, or None when the change log has been pruned
+                past the index and it must be rebuilt
+        """
+        cursor.execute('SELECT MIN(seq) FROM embedding_changes')
+        oldest = cursor.fetchone()[0]
+        pruned = oldest - 1 if oldest else self._get_last_change(cursor)
+        if index.last_change < pruned:
+            return None
+        
+        cursor.execute(
+            'SELECT DISTINCT row_id FROM embedding_changes WHERE table_name = ? AND seq > ?',
+            ('document_embeddings', index.last_change)
+        )
+        return np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+    
+    def _record_consumer(self, cursor, kind, last_change):
+        """
+        Record in the database how far an approximate index of this process has read the
+        change log.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            kind (str): Index kind
+            last_change (int): Change-log sequence number the index has caught up to
+        """
+        # Worker processes of one server hold indexes of the same kind; each is its own consumer
+        consumer = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}:{kind}'
+        cursor.execute('INSERT OR REPLACE INTO index_consumers (consumer, last_change, updated_at) VALUES (?, ?, ?)',
+                       (consumer, last_change, time.time()))
+    
+    def _prune_changes(self, cursor):
+        """
+        Delete the change-log rows every live consumer has read.
+        
+        Consumers that have not caught up within change_log_retention are forgotten
+        first. With no consumer left, the whole log is pruned.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+        """
+        cursor.execute('DELETE FROM index_consumers WHERE updated_at < ?', (time.time() - self.change_log_retention,))
+        cursor.execute('SELECT MIN(last_change) FROM index_consumers')
+        oldest = cursor.fetchone()[0]
+        cursor.execute('DELETE FROM embedding_changes WHERE seq <= ?',
+                       (self._get_last_change(cursor) if oldest is None else oldest,))
+    
+    def _get_pending_rows(self, cursor, kind, index, attributes):
+        """
+        Load the rows an approximate index has not caught up with.
+        
+        The result is cached with the index and the filter columns, which are both
+        replaced whenever embeddings are added, updated or deleted, so the change log and
+        the pending vectors are only read again after such a change or a refresh.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            kind (str): Index kind
+            index: Approximate index over document_embeddings
+            attributes (dict): Filter columns from _get_document_attributes
+            
+        Returns:
+            tuple: (changed, pending) where changed holds the row ids updated or deleted
+                since the index caught up and pending is a FlatIndex over the current
+                vectors of the rows it lacks or holds stale, or None when the change log
+                has been pruned past the index
+        """
+        cached = self._pending_rows.get(kind)
+        if cached is not None and cached[0] is index and cached[1] is attributes:
+            return cached[2]
+        
+        changed = self._get_index_changes(cursor, index)
+        if changed is None:
+            pending = None
+        else:
+            labels = attributes['labels']
+            ids, vectors = self._fetch_embeddings(cursor, labels[(labels > index.max_label) | np.isin(labels, changed)])
+            pending = (changed, FlatIndex.wrap(ids, vectors) if len(ids) else FlatIndex(index.dim))
+        self._pending_rows[kind] = (index, attributes, pending)
+        return pending
+    
+    def refresh_index(self, kind, background=False):
+        """
+        Bring an approximate index up to date with the document embeddings.
+        
+        The update is applied to a copy of the index: rows updated or deleted since it
+        last caught up are removed and updated rows re-inserted, rows past its max label
+        are inserted, and the copy then replaces the index in one assignment. Searches
+        keep using the previous index meanwhile and score the rows it is missing exactly.
+        An index the pruned change log no longer reaches back to is rebuilt, and an HNSW
+        graph holding more than TOMBSTONE_COMPACT_RATIO removed nodes is compacted.
+        
+        Args:
+            kind (str): Index kind
+            background (bool): Refresh on a daemon thread and return immediately; only
+                one refresh per kind runs at a time
+            
+        Returns:
+            threading.Thread: The refresh thread, or None when refreshing in the foreground
+        """
+        if kind not in self.indexes:
+            raise ValueError(f"Index '{kind}' has not been built or loaded")
+        
+        if not background:
+            self._refresh_index(kind)
+            return None
+        
+        with self._index_lock:
+            thread = self._refresh_threads.get(kind)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._refresh_index, args=(kind,), name=f'{kind}-index-refresh',
+                                          daemon=True)
+                self._refresh_threads[kind] = thread
+                thread.start()
+        return thread
+    
+    def _refresh_index(self, kind):
+        """Apply the pending changes to a copy of an approximate index and swap it in."""
+        with self._refresh_lock:
+            index = self.indexes.get(kind)
+            if index is None:
+                return
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            try:
+                last_change = self._get_last_change(cursor)
+                max_id, _ = self._get_table_state(cursor, 'document_embeddings')
+                changed = self._get_index_changes(cursor, index)
+                
+                start = time.time()
+                if changed is None:
+                    updated = self._create_approximate_index(cursor, kind, index.params)
+                    print(f"Rebuilt {kind} index over {len(updated)} sections in {time.time() - start:.1f}s")
+                else:
+                    changed = changed[changed <= index.max_label]
+                    if not len(changed) and max_id <= index.max_label and last_change == index.last_change:
+                        return
+                    
+                    updated = index.copy()
+                    if len(changed):
+                        updated.remove(changed)
+                        # Deleted rows are no longer found and stay removed
+                        ids, vectors = self._fetch_embeddings(cursor, changed)
+                        if len(ids):
+                            updated.add(ids, vectors)
+                    added = 0
+                    for ids, vectors in self._iter_document_embeddings(cursor, after_id=index.max_label):
+                        updated.add(ids, vectors)
+                        added += len(ids)
+                    if getattr(updated, 'tombstones', 0) > TOMBSTONE_COMPACT_RATIO * len(updated):
+                        updated.compact()
+                    print(f"Caught up {kind} index with {len(changed)} changed and {added} new sections "
+                          f"in {time.time() - start:.1f}s")
+                updated.last_change = last_change
+                updated.generation, updated.model = index.generation, index.model
+                
+                with self._index_lock:
+                    # Drop the result if a build or an encoder switch replaced the index meanwhile
+                    if self.indexes.get(kind) is not index:
+                        return
+                    self.indexes[kind] = updated
+                
+                self._record_consumer(cursor, kind, last_change)
+                self._prune_changes(cursor)
+                conn.commit()
+            except Exception as e:
+                print(f"Refreshing the {kind} index failed: {e}")
+            finally:
+                conn.close()
+    
+    def build_index(self, kind='hnsw', path=None, background=False, **params):
+        """
+        Build an approximate index over all document embeddings.
+        
+        Searches keep using the previous index of this kind, if any, until the build
+        finishes and the new one is swapped in. Embeddings are streamed from SQLite, so
+        the resident document matrix is neither needed nor loaded.
+        
+        Args:
+            kind (str): Index kind, one of INDEX_TYPES
+            path (str, optional): Save the built index to this file
+            background (bool): Build on a daemon thread and return immediately
+            **params: Index parameters (M, ef_construction, ef_search for HNSW;
+                nlist, nprobe for IVF; m for PQ)
+            
+        Returns:
+            object: The built index, or the build thread when building in the background
+        """
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index kind '{kind}'")
+        
+        if background:
+            thread = threading.Thread(target=self.build_index, args=(kind, path), kwargs=params,
+                                      name=f'{kind}-index-build', daemon=True)
+            thread.start()
+            return thread
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        last_change = self._get_last_change(cursor)
+        # Hold the log from this point while building
+        self._record_consumer(cursor, kind, last_change)
+        conn.commit()
+        
+        start = time.time()
+        index = self._create_approximate_index(cursor, kind, params)
+        index.last_change = last_change
+        index.generation, index.model = self.generation, self.encoder.name
+        
+        self.indexes[kind] = index
+        print(f"Built {kind} index over {len(index)} sections in {time.time() - start:.1f}s")
+        
+        self._prune_changes(cursor)
+        conn.commit()
+        conn.close()
+        
+        if path:
+            index.save(path)
+        
+        return index
+    
+    def save_index(self, kind, path):
+        """
+        Save a built approximate index to disk.
+        
+        Args:
+            kind (str): Index kind
+            path (str): Destination file path
+        """
+        if kind not in self.indexes:
+            raise ValueError(f"Index '{kind}' has not been built or loaded")
+        
+        self.indexes[kind].save(path)
+    
+    def load_index(self, path):
+        """
+        Load a saved approximate index and make it available to semantic_search.
+        
+        Rows added, updated or deleted since the index was saved are caught up in the
+        background after the next search that uses it. The change log is pruned once
+        every index loaded in any process has consumed it, so an index file saved
+        before that is rebuilt instead.
+        
+        A file saved from another embedding generation, model or dimension indexes
+        vectors that queries are no longer encoded like; it is rebuilt from the active
+        embeddings with the same parameters and saved over.
+        
+        Args:
+            path (str): Path to the saved index
+            
+        Returns:
+            object: The loaded index
+        """
+        self._sync_generation(force=True)
+        index = load_index(path)
+        
+        conn = sqlite3.connect(self.db_path)
+        active = self._get_active_generation(conn.cursor())
+        conn.close()
+        # A generation records its dimension once something has been embedded
+        dim = active[3] if active and active[3] else index.dim
+        expected = (self.generation, self.encoder.name, dim)
+        saved = (index.generation, index.model, index.dim)
+        if saved != expected:
+            print(f"Index {path} was saved for generation {saved[0]} ({saved[1]}, dim {saved[2]}), but the "
+                  f"embeddings are generation {expected[0]} ({expected[1]}, dim {expected[2]}); rebuilding it")
+            return self.build_index(index.kind, path=path, **index.params)
+        
+        self.indexes[index.kind] = index
+        conn = sqlite3.connect(self.db_path)
+        self._record_consumer(conn.cursor(), index.kind, index.last_change)
+        conn.commit()
+        conn.close()
+        return index
+    
+    def _filter_rows(self, doc_rows, ticker=None, doc_types=None):
+        """
+        Resolve ticker / doc_type filters to resident index rows.
+        
+        Args:
+            doc_rows (dict): Row attributes from _get_document_index
+            ticker (str, optional): Company ticker
+            doc_types (list, optional): Document types
+            
+        Returns:
+            numpy.ndarray: Sorted matching row positions, or None when unfiltered
+        """
+        if not ticker and not doc_types:
+            return None
+        
+        rows = None
+        if ticker:
+            rows = doc_rows['ticker'].rows([ticker])
+        if doc_types:
+            type_rows = doc_rows['doc_type'].rows(doc_types)
+            rows = type_rows if rows is None else np.intersect1d(rows, type_rows, assume_unique=True)
+        return rows
+    
+    def _search_document_index(self, cursor, query_embedding, top_k, index='flat', rerank=None, ticker=None,
+                               doc_types=None, **search_params):
+        """
+        Rank document sections against a query embedding.
+        
+        Filters are pushed into the scan: the exact path scores only the matching rows.
+        An approximate index over-fetches and drops non-matching hits, falling back to
+        an exact scan of the matching rows when that leaves fewer than top_k. Approximate
+        searches do not load the resident matrix; the fallback scans it if it is loaded
+        and streams the rows from SQLite otherwise.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            query_embedding (numpy.ndarray): Query embedding
+            top_k (int): Number of results to return
+            index (str): 'flat' for an exact scan of the resident matrix, 'scan' for an
+                exact scan streamed from SQLite, or the kind of a built approximate index
+            rerank (int, optional): With an approximate index, fetch top_k * rerank
+                candidates and rescore them against the full-precision vectors read from
+                SQLite. Off by default: HNSW and IVF hits carry exact similarities, while
+                PQ hits are ranked by their compressed codes unless reranked
+            ticker (str, optional): Only rank sections of this company
+            doc_types (list, optional): Only rank sections of these document types
+            **search_params: Per-query index parameters (ef_search for HNSW, nprobe for IVF,
+                block_size for 'scan')
+            
+        Returns:
+            tuple: (ids, doc_ids, similarities) arrays, best first
+        """
+        if index == 'scan':
+            return self._stream_document_scan(cursor, np.atleast_2d(query_embedding), top_k, ticker=ticker,
+                                              doc_types=doc_types, **search_params)[0]
+        
+        if index in self.indexes:
+            result = self._search_approximate_index(cursor, index, query_embedding, top_k, rerank or 0, ticker,
+                                                    doc_types, search_params)
+            if result is not None:
+                return result
+            if self._doc_index is None:
+                return self._stream_document_scan(cursor, np.atleast_2d(query_embedding), top_k, ticker=ticker,
+                                                  doc_types=doc_types)[0]
+        elif index != 'flat':
+            raise ValueError(f"Index '{index}' has not been built or loaded")
+        
+        flat_index, doc_rows = self._get_document_index(cursor)
+        if len(flat_index) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        doc_ids = doc_rows['doc_id']
+        rows = self._filter_rows(doc_rows, ticker, doc_types)
+        
+        if self.storage != 'float32':
+            # Scan the compact codes, then rescore a small candidate set exactly
+            ids, _ = self._scan_document_index(flat_index, doc_rows, query_embedding, top_k * self.rescore_factor,
+                                               rows, ticker)
+            ids, similarities = self._rescore(cursor, query_embedding, ids, top_k)
+        else:
+            ids, similarities = self._scan_document_index(flat_index, doc_rows, query_embedding, top_k, rows,
+                                                          ticker)
+        
+        # Map labels back to matrix rows to pick up each section's document id
+        labels = doc_rows.get('sorted_labels', flat_index.labels)
+        rows = np.minimum(np.searchsorted(labels, ids), len(labels) - 1)
+        found = labels[rows] == ids
+        if 'label_order' in doc_rows:
+            rows = doc_rows['label_order'][rows]
+        return ids[found], doc_ids[rows[found]], similarities[found]
+    
+    def _search_approximate_index(self, cursor, kind, query_embedding, top_k, rerank, ticker, doc_types,
+                                  search_params):
+        """
+        Search an approximate index, covering for the rows it has not caught up with.
+        
+        Hits on rows changed since the index caught up are dropped, and those rows and
+        the ones added since are scored exactly and merged in, while a background
+        refresh catches the index up. Filters and document ids come from the filter
+        columns, so the resident matrix is not used.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            kind (str): Index kind
+            query_embedding (numpy.ndarray): Query embedding
+            top_k (int): Number of results to return
+            rerank (int): Rescore top_k * rerank candidates against the stored vectors; 0 disables
+            ticker (str, optional): Only rank sections of this company
+            doc_types (list, optional): Only rank sections of these document types
+            search_params (dict): Per-query index parameters
+            
+        Returns:
+            tuple: (ids, doc_ids, similarities) arrays, best first, or None when the
+                caller must scan exactly: the change log no longer reaches back to the
+                index, or too few hits matched the filters
+        """
+        index = self.indexes[kind]
+        attributes = self._get_document_attributes(cursor)
+        labels = attributes['labels']
+        if not len(labels):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        pending = self._get_pending_rows(cursor, kind, index, attributes)
+        if pending is None:
+            # Scan exactly until the rebuild is swapped in
+            self.refresh_index(kind, background=True)
+            return None
+        changed, pending_index = pending
+        if len(pending_index) or len(changed):
+            self.refresh_index(kind, background=True)
+        
+        rows = self._filter_rows(attributes, ticker, doc_types)
+        allowed = labels if rows is None else labels[rows]
+        candidates = top_k * max(rerank, 1) * (4 if rows is not None else 1)
+        
+        ids, similarities = index.search(query_embedding, candidates + min(len(changed), candidates), **search_params)
+        keep = _contains_sorted(allowed, ids)
+        if len(changed):
+            keep &= ~np.isin(ids, changed)
+        ids, similarities = ids[keep], similarities[keep]
+        
+        pending_rows = None if rows is None else np.flatnonzero(_contains_sorted(allowed, pending_index.labels))
+        if len(pending_index) and (pending_rows is None or len(pending_rows)):
+            ids, similarities = merge_top_k(
+                [(ids, similarities), pending_index.search(query_embedding, candidates, rows=pending_rows)],
+                candidates
+            )
+        
+        if rows is not None and len(ids) < min(top_k, len(rows)):
+            # Too few filtered hits survived
+            return None
+        if rerank:
+            ids, similarities = self._rescore(cursor, query_embedding, ids, top_k)
+        else:
+            ids, similarities = ids[:top_k], similarities[:top_k]
+        
+        positions = np.searchsorted(labels, ids)
+        return ids, attributes['doc_id'][positions], similarities
+    
+    def _stream_document_scan(self, cursor, query_embeddings, top_k, ticker=None, doc_types=None, block_size=4096):
+        """
+        Rank document sections by streaming their embeddings from SQLite in blocks.
+        
+        Nothing stays resident: each block of block_size embeddings is decoded, scored
+        against all queries with one matrix product and cut to a running top-k, so
+        memory is bounded by the block and top_k however large the table is. No section
+        text is read; callers hydrate only the winners.
+        
+        Args:
+            cursor (sqlite3.Cursor): Cursor dedicated to this scan
+            query_embeddings (numpy.ndarray): Query embeddings, one row per query
+            top_k (int): Number of results to return per query
+            ticker (str, optional): Only rank sections of this company
+            doc_types (list, optional): Only rank sections of these document types
+            block_size (int): Embeddings decoded and scored at a time
+            
+        Returns:
+            list: (ids, doc_ids, similarities) arrays per query, best first
+        """
+        queries = normalize_rows(query_embeddings)
+        
+        # The document id is read with the embedding, so a row deleted while the scan
+        # runs cannot leave a winner without one
+        sql = 'SELECT e.id, e.doc_id, e.embedding FROM document_embeddings e'
+        params = []
+        if ticker or doc_types:
+            conditions = []
+            if ticker:
+                conditions.append('d.ticker = ?')
+                params.append(ticker)
+            if doc_types:
+                conditions.append(f"d.doc_type IN ({', '.join(['?'] * len(doc_types))})")
+                params.extend(doc_types)
+            sql += ' JOIN documents d ON d.id = e.doc_id WHERE ' + ' AND '.join(conditions)
+        cursor.execute(sql + ' ORDER BY e.id', params)
+        
+        selections = [RunningTopK(top_k) for _ in range(len(queries))]
+        doc_ids = {}    # document id of every row still held by a selection
+        while True:
+            rows = cursor.fetchmany(block_size)
+            if not rows:
+                break
+            
+            labels = np.array([row[0] for row in rows], dtype=np.int64)
+            vectors = np.frombuffer(b''.join(row[2] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+            scores = normalize_rows(vectors) @ queries.T
+            for position, selection in enumerate(selections):
+                selection.push(labels, scores[:, position])
+            
+            block_doc_ids = {row[0]: int(row[1]) for row in rows}
+            doc_ids = {label: doc_ids[label] if label in doc_ids else block_doc_ids[label]
+                       for selection in selections for label in selection.labels()}
+        
+        return [(ids, np.array([doc_ids[id] for id in ids.tolist()], dtype=np.int64), similarities)
+                for ids, similarities in (selection.result() for selection in selections)]
+    
+    def _scan_document_index(self, flat_index, doc_rows, query_embedding, top_k, rows, ticker):
+        """
+        Scan the resident document index exactly, shard by shard when sharding is enabled.
+        
+        Args:
+            flat_index (FlatIndex or ScalarQuantizedIndex): Resident document index
+            doc_rows (dict): Row attributes from _get_document_index
+            query_embedding (numpy.ndarray): Query embedding
+            top_k (int): Number of results to return
+            rows (numpy.ndarray, optional): Matching row positions from _filter_rows
+            ticker (str, optional): Company the search is scoped to
+            
+        Returns:
+            tuple: (labels, scores) arrays of the best matches, best first
+        """
+        sharded = self._sharded_index
+        if not self.shard_by or sharded is None or sharded[0] is not flat_index:
+            return flat_index.search(query_embedding, top_k, rows=rows)
+        
+        sharded_index = sharded[1]
+        shards = None
+        if ticker and self.shard_by == 'ticker':
+            # A company's sections live in their own shard (or shards, if it is large)
+            code = doc_rows['ticker'].code(ticker)
+            shards = sharded_index.shards_for([code] if code is not None else [])
+        return sharded_index.search(query_embedding, top_k, rows=rows, shards=shards,
+                                    executor=self._get_shard_pool())
+    
+    def _get_filing_years(self, cursor, doc_ids):
+        """
+        Look up the filing year of each section's document.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            doc_ids (numpy.ndarray): Document id of each section
+            
+        Returns:
+            numpy.ndarray: Filing year of each section, 0 where unknown
+        """
+        cursor.execute('SELECT id, filing_date FROM documents')
+        years = {}
+        for doc_id, filing_date in cursor.fetchall():
+            year = str(filing_date or '')[:4]
+            years[doc_id] = int(year) if year.isdigit() else 0
+        
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        return np.array([years.get(doc_id, 0) for doc_id in unique_ids.tolist()], dtype=np.int64)[inverse]
+    
+    def _get_shard_pool(self):
+        """Start the shard search thread pool on first use."""
+        if self._shard_pool is None:
+            with self._index_lock:
+                if self._shard_pool is None:
+                    self._shard_pool = ThreadPoolExecutor(max_workers=self.shard_workers or os.cpu_count(),
+                                                          thread_name_prefix='shard-search')
+        return self._shard_pool
+    
+    def _rescore(self, cursor, query_embedding, ids, top_k):
+        """
+        Rank candidate sections by their full-precision embeddings.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            query_embedding (numpy.ndarray): Query embedding
+            ids (numpy.ndarray): Candidate embedding row ids
+            top_k (int): Number of results to keep
+            
+        Returns:
+            tuple: (ids, similarities) arrays, best first
+        """
+        candidate_ids, vectors = self._fetch_embeddings(cursor, ids)
+        if not len(candidate_ids):
+            return candidate_ids, np.empty(0, dtype=np.float32)
+        
+        similarities = vectors @ normalize_rows(query_embedding)
+        
+        best = np.argsort(-similarities, kind='stable')[:top_k]
+        return candidate_ids[best], similarities[best]
+    
+    def _fetch_embeddings(self, cursor, ids):
+        """
+        Load the full-precision embeddings of the given rows.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ids (numpy.ndarray): Embedding row ids
+            
+        Returns:
+            tuple: (ids, vectors) of the rows that still exist, vectors normalized
+        """
+        if not len(ids):
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        
+        rows = []
+        ids = ids.tolist()
+        for offset in range(0, len(ids), 500):
+            chunk = ids[offset:offset + 500]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor.execute(f'SELECT id, embedding FROM document_embeddings WHERE id IN ({placeholders})', chunk)
+            rows.extend(cursor.fetchall())
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        
+        found_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        vectors = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        return found_ids, normalize_rows(vectors)
+    
+    def _search_document_index_batch(self, cursor, query_embeddings, top_k, ticker=None, doc_types=None):
+        """
+        Rank document sections against many query embeddings with exact batched scans.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            query_embeddings (numpy.ndarray): Query embedding matrix, one row per query
+            top_k (int): Number of results to return per query
+            ticker (str, optional): Only rank sections of this company
+            doc_types (list, optional): Only rank sections of these document types
+            
+        Returns:
+            list: (ids, similarities) arrays per query, best first
+        """
+        flat_index, doc_rows = self._get_document_index(cursor)
+        if len(flat_index) == 0:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [empty] * len(query_embeddings)
+        
+        rows = self._filter_rows(doc_rows, ticker, doc_types)
+        
+        if self.storage == 'float32':
+            ids, similarities = flat_index.search_batch(query_embeddings, top_k, rows=rows)
+            return list(zip(ids, similarities))
+        
+        # Scan the compact codes for all queries, then rescore every candidate set against
+        # full-precision vectors loaded in one round trip
+        candidates, _ = flat_index.search_batch(query_embeddings, top_k * self.rescore_factor, rows=rows)
+        found_ids, vectors = self._fetch_embeddings(cursor, np.unique(candidates))
+        positions = {id: position for position, id in enumerate(found_ids.tolist())}
+        queries = normalize_rows(query_embeddings)
+        
+        results = []
+        for query, query_candidates in zip(queries, candidates):
+            kept = [positions[id] for id in query_candidates.tolist() if id in positions]
+            similarities = vectors[kept] @ query if kept else np.empty(0, dtype=np.float32)
+            best = np.argsort(-similarities, kind='stable')[:top_k]
+            results.append((found_ids[kept][best], similarities[best]))
+        return results
+    
+    def evaluate_recall(self, queries, top_k=10, index='hnsw', **search_params):
+        """
+        Measure an approximate index against the exact search path.
+        
+        Args:
+            queries (list): Query strings
+            top_k (int): Number of results compared per query
+            index (str): Kind of the approximate index to evaluate
+            **search_params: Per-query index parameters (ef_search for HNSW, nprobe for IVF,
+                rerank for any approximate index)
+            
+        Returns:
+            dict: Mean recall@top_k and mean per-query latency of both paths
+        """
+        query_embeddings = self._encode_queries(queries)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        recalls = []
+        exact_time = 0.0
+        approximate_time = 0.0
+        for query_embedding in query_embeddings:
+            start = time.time()
+            exact_ids, _, _ = self._search_document_index(cursor, query_embedding, top_k)
+            exact_time += time.time() - start
+            
+            start = time.time()
+            approximate_ids, _, _ = self._search_document_index(cursor, query_embedding, top_k, index=index,
+                                                                **search_params)
+            approximate_time += time.time() - start
+            
+            if len(exact_ids):
+                recalls.append(len(set(exact_ids.tolist()) & set(approximate_ids.tolist())) / len(exact_ids))
+        
+        conn.close()
+        
+        count = max(len(query_embeddings), 1)
+        return {
+            'index': index,
+            'queries': len(query_embeddings),
+            'top_k': top_k,
+            'recall': float(np.mean(recalls)) if recalls else 0.0,
+            'exact_ms': 1000 * exact_time / count,
+            'approximate_ms': 1000 * approximate_time / count
+        }
+    
+    def _fetch_sections(self, cursor, ids):
+        """
+        Load section text and document details for embedding rows in one query.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ids (numpy.ndarray): Embedding row ids
+            
+        Returns:
+            dict: Section row tuple by embedding row id
+        """
+        placeholders = ', '.join(['?'] * len(ids))
+        cursor.execute(f'''
+            SELECT e.id, d.id, d.ticker, d.doc_type, d.title, d.filing_date, e.section_title, e.section_content
+            FROM document_embeddings e
+            JOIN documents d ON d.id = e.doc_id
+            WHERE e.id IN ({placeholders})
+        ''', ids.tolist())
+        return {row[0]: row for row in cursor.fetchall()}
+    
+    def _fetch_section_refs(self, cursor, ids):
+        """
+        Load the near-duplicate references of embedding rows.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ids (numpy.ndarray): Embedding row ids
+            
+        Returns:
+            dict: List of duplicate occurrences (doc_id, ticker, doc_type, filing_date,
+                section_title, similarity) by canonical row id, newest filing first
+        """
+        placeholders = ', '.join(['?'] * len(ids))
+        cursor.execute(f'''
+            SELECT r.canonical_id, d.id, d.ticker, d.doc_type, d.filing_date, r.section_title, r.similarity
+            FROM document_section_refs r
+            JOIN documents d ON d.id = r.doc_id
+            WHERE r.canonical_id IN ({placeholders})
+            ORDER BY d.filing_date DESC
+        ''', ids.tolist())
+        
+        refs = {}
+        for canonical_id, doc_id, ticker, doc_type, filing_date, section_title, similarity in cursor.fetchall():
+            refs.setdefault(canonical_id, []).append({
+                'doc_id': doc_id,
+                'ticker': ticker,
+                'doc_type': doc_type,
+                'filing_date': filing_date,
+                'section_title': section_title,
+                'similarity': similarity
+            })
+        return refs
+    
+    def _hydrate_sections(self, cursor, ids, similarities, sections=None, query=None):
+        """
+        Load section text and document details for ranked sections in one query.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            ids (numpy.ndarray): Embedding row ids, best first
+            similarities (numpy.ndarray): Similarity of each section
+            sections (dict, optional): Rows already loaded with _fetch_sections
+            query (str, optional): Query to cut a 'snippet' with 'highlights' for from
+                each section
+            
+        Returns:
+            list: Result dictionaries in ranking order, each listing the other filings
+                that repeat the section under 'duplicates'; sections whose row or
+                document no longer exists are skipped
+        """
+        if not len(ids):
+            return []
+        
+        rows = self._fetch_sections(cursor, ids) if sections is None else sections
+        duplicates = self._fetch_section_refs(cursor, ids)
+        
+        top_results = []
+        for id, similarity in zip(ids.tolist(), similarities.tolist()):
+            if id not in rows:
+                continue
+            
+            _, doc_id, ticker, doc_type, title, filing_date, section_title, section_content = rows[id]
+            top_results.append({
+                'id': id,
+                'doc_id': doc_id,
+                'ticker': ticker,
+                'doc_type': doc_type,
+                'doc_title': title,
+                'filing_date': filing_date,
+                'section_title': section_title,
+                'section_content': section_content,
+                'similarity': float(similarity),
+                'duplicates': duplicates.get(id, [])
+            })
+            if query is not None:
+                snippet = generate_snippet(section_content, query)
+                top_results[-1]['snippet'] = snippet['text']
+                top_results[-1]['highlights'] = snippet['highlights']
+        
+        return top_results
+    
+    def semantic_search(self, query, top_k=5, index='flat', ticker=None, doc_types=None, **search_params):
+        """
+        Perform semantic search using vector embeddings.
+        
+        Scores the query against the resident embedding matrix, or a built approximate
+        index, and loads section text and document details for the top results with
+        a single query. For embeddings that do not fit in memory, index='scan' streams
+        them from SQLite in blocks instead.
+        
+        Args:
+            query (str): Search query
+            top_k (int): Number of top results to return
+            index (str): 'flat' for an exact scan, 'scan' for an exact scan streamed from
+                SQLite in bounded memory, or the kind of a built approximate index
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit search to specific document types
+            **search_params: Per-query index parameters (ef_search for HNSW, nprobe for IVF,
+                rerank for any approximate index, block_size for 'scan')
+            
+        Returns:
+            list: Top matching document sections
+        """
+        # Generate embedding for the query
+        query_embedding = self._encode_query(query)
         
-        # Perform keyword search
         conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
-        # Build the SQL query
-        sql = "SELECT id, ticker, doc_type, title, filing_date, content FROM documents WHERE content LIKE ?"
-        params = [f"%{query}%"]
+        # Rank sections against the query, then hydrate the winners in one round trip
+        ids, _, similarities = self._search_document_index(cursor, query_embedding, top_k, index=index,
+                                                           ticker=ticker, doc_types=doc_types, **search_params)
+        if len(ids) == 0:
+            conn.close()
+            return []
         
-        if ticker:
-            sql += " AND ticker = ?"
-            params.append(ticker)
+        top_results = self._hydrate_sections(cursor, ids, similarities, query=query)
         
-        if doc_types:
-            placeholders = ', '.join(['?'] * len(doc_types))
-            sql += f" AND doc_type IN ({placeholders})"
-            params.extend(doc_types)
+        conn.close()
+        return top_results
+    
+    def semantic_search_many(self, queries, top_k=5, ticker=None, doc_types=None, index='flat', **search_params):
+        """
+        Perform semantic search for many queries in one pass.
         
-        sql += " ORDER BY filing_date DESC LIMIT ?"
-        params.append(top_k*2)
+        Uncached queries are encoded in one model call, the exact path scores all of
+        them with one matrix-matrix product, and the winning sections of every query
+        are loaded with a single query.
         
-        # Execute the query
-        cursor.execute(sql, params)
-        keyword_results = [dict(row) for row in cursor.fetchall()]
-        
-        # Add snippets to keyword results
-        for result in keyword_results:
-            result['snippet'] = self._generate_snippet(result['content'], query)
-            result['similarity'] = 0.5  # Default similarity score for keyword results
-        
-        # Combine and deduplicate results
-        combined_results = semantic_results.copy()
-        doc_ids = {result['doc_id'] for result in combined_results}
-        
-        for result in keyword_results:
-            if result['id'] not in doc_ids:
-                doc_ids.add(result['id'])
-                # Format to match semantic results structure
-                combined_results.append({
-                    'id': None,
-                    'doc_id': result['id'],
-                    'ticker': result['ticker'],
-                    'doc_type': result['doc_type'],
-                    'doc_title': result['title'],
-                    'filing_date': result['filing_date'],
-                    'section_title': 'Keyword Match',
-                    'section_content': result['snippet'],
-                    'similarity': result['similarity']
-                })
-        
-        # Sort by similarity score
-        combined_results.sort(key=lambda x: x['similarity'], reverse=True)
+        Args:
+            queries (list): Search queries
+            top_k (int): Number of top results to return per query
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit search to specific document types
+            index (str): 'flat' for an exact scan, 'scan' for one streamed pass over
+                SQLite shared by all queries, or the kind of a built approximate index,
+                which is then searched query by query
+            **search_params: Per-query index parameters (ef_search for HNSW, nprobe for IVF,
+                rerank for any approximate index, block_size for 'scan')
+            
+        Returns:
+            list: One list of top matching document sections per query, in query order
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self._encode_queries(queries)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        if index == 'flat':
+            ranked = self._search_document_index_batch(cursor, query_embeddings, top_k,
+                                                       ticker=ticker, doc_types=doc_types)
+        elif index == 'scan':
+            ranked = [(ids, similarities) for ids, _, similarities in
+                      self._stream_document_scan(conn.cursor(), query_embeddings, top_k, ticker=ticker,
+                                                 doc_types=doc_types, **search_params)]
+        else:
+            ranked = []
+            for query_embedding in query_embeddings:
+                ids, _, similarities = self._search_document_index(cursor, query_embedding, top_k, index=index,
+                                                                   ticker=ticker, doc_types=doc_types,
+                                                                   **search_params)
+                ranked.append((ids, similarities))
+        
+        # Hydrate the union of all winners in one round trip
+        all_ids = np.unique(np.concatenate([ids for ids, _ in ranked]))
+        sections = self._fetch_sections(cursor, all_ids) if len(all_ids) else {}
+        results = [self._hydrate_sections(cursor, ids, similarities, sections=sections, query=query)
+                   for query, (ids, similarities) in zip(queries, ranked)]
+        
+        conn.close()
+        return results
+    
+    def _get_collection_index(self, cursor, table):
+        """
+        Return the resident index of a company or metric embedding table.
+        
+        These tables are small, so any change reloads the whole matrix.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): 'company_embeddings' or 'metric_embeddings'
+            
+        Returns:
+            tuple: (index, tickers) where tickers is a CategoricalColumn parallel to the index rows
+        """
+        state = self._get_table_state(cursor, table)
+        
+        with self._index_lock:
+            cached = self._collection_indexes.get(table)
+            if cached is not None and cached[2] != state and self._generation_changed(cursor):
+                # The query was encoded for the resident generation; keep serving it
+                return cached[0], cached[1]
+            if cached is None or cached[2] != state:
+                cursor.execute(f'SELECT id, ticker, embedding FROM {table} ORDER BY id')
+                rows = cursor.fetchall()
+                if rows:
+                    vectors = np.frombuffer(b''.join(row[2] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+                    index = FlatIndex(vectors.shape[1])
+                    index.add([row[0] for row in rows], vectors)
+                else:
+                    index = FlatIndex(0)
+                cached = (index, CategoricalColumn(row[1] for row in rows), state)
+                self._collection_indexes[table] = cached
+            return cached[0], cached[1]
+    
+    def _search_collection(self, cursor, table, query_embedding, top_k, ticker=None):
+        """
+        Rank the rows of a company or metric embedding table against a query embedding.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): 'company_embeddings' or 'metric_embeddings'
+            query_embedding (numpy.ndarray): Query embedding
+            top_k (int): Number of results to return
+            ticker (str, optional): Only rank rows of this company
+            
+        Returns:
+            tuple: (ids, similarities) arrays, best first
+        """
+        index, tickers = self._get_collection_index(cursor, table)
+        if len(index) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        rows = tickers.rows([ticker]) if ticker else None
+        return index.search(query_embedding, top_k, rows=rows)
+    
+    def _hydrate_collection(self, cursor, table, ids, similarities):
+        """
+        Load the stored fields of ranked company or metric rows in one query.
+        
+        Args:
+            cursor (sqlite3.Cursor): Open database cursor
+            table (str): 'company_embeddings' or 'metric_embeddings'
+            ids (numpy.ndarray): Embedding row ids, best first
+            similarities (numpy.ndarray): Similarity of each row
+            
+        Returns:
+            list: Result dictionaries in ranking order
+        """
+        if not len(ids):
+            return []
+        
+        columns = COLLECTION_COLUMNS[table]
+        placeholders = ', '.join(['?'] * len(ids))
+        cursor.execute(f'SELECT id, {", ".join(columns)} FROM {table} WHERE id IN ({placeholders})', ids.tolist())
+        rows = {row[0]: row[1:] for row in cursor.fetchall()}
+        
+        top_results = []
+        for id, similarity in zip(ids.tolist(), similarities.tolist()):
+            if id in rows:
+                top_results.append({'id': id, **dict(zip(columns, rows[id])), 'similarity': float(similarity)})
+        return top_results
+    
+    def company_semantic_search(self, query, ticker=None, top_k=5):
+        """
+        Perform semantic search on company information.
+        
+        Args:
+            query (str): Search query
+            ticker (str, optional): Limit search to specific company
+            top_k (int): Number of top results to return
+            
+        Returns:
+            list: Top matching company information
+        """
+        # Generate embedding for the query
+        query_embedding = self._encode_query(query)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        ids, similarities = self._search_collection(cursor, 'company_embeddings', query_embedding, top_k, ticker)
+        top_results = self._hydrate_collection(cursor, 'company_embeddings', ids, similarities)
+        
+        conn.close()
+        return top_results
+    
+    def metric_semantic_search(self, query, ticker=None, top_k=5):
+        """
+        Perform semantic search on financial metrics.
+        
+        Args:
+            query (str): Search query
+            ticker (str, optional): Limit search to specific company
+            top_k (int): Number of top results to return
+            
+        Returns:
+            list: Top matching financial metrics
+        """
+        # Generate embedding for the query
+        query_embedding = self._encode_query(query)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        ids, similarities = self._search_collection(cursor, 'metric_embeddings', query_embedding, top_k, ticker)
+        top_results = self._hydrate_collection(cursor, 'metric_embeddings', ids, similarities)
+        
+        conn.close()
+        return top_results
+    
+    def unified_search(self, query, top_k=10, ticker=None, doc_types=None, weights=None, quotas=None):
+        """
+        Search document sections, company information and financial metrics at once.
+        
+        The query is encoded once and scored against each collection's resident matrix
+        over a single connection. Similarities are multiplied by the collection weight
+        and the hits of all collections are merged into one ranking.
+        
+        Args:
+            query (str): Search query
+            top_k (int): Number of top results to return
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit document results to these document types
+            weights (dict, optional): Weight per collection ('document', 'company', 'metric'),
+                1.0 by default; a collection with weight 0 is skipped
+            quotas (dict, optional): Maximum number of results per collection
+            
+        Returns:
+            list: Top matching results ordered by weighted 'score', each with its 'type'
+                ('document', 'company' or 'metric') and that collection's fields
+        """
+        weights = weights or {}
+        quotas = quotas or {}
+        unknown = (set(weights) | set(quotas)) - set(SEARCH_COLLECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown search collections: {', '.join(sorted(unknown))}")
+        
+        # Generate embedding for the query
+        query_embedding = self._encode_query(query)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        combined_results = []
+        for collection, table in SEARCH_COLLECTIONS.items():
+            weight = weights.get(collection, 1.0)
+            limit = min(top_k, quotas.get(collection, top_k))
+            if weight <= 0 or limit <= 0:
+                continue
+            
+            if collection == 'document':
+                ids, _, similarities = self._search_document_index(cursor, query_embedding, limit, ticker=ticker,
+                                                                   doc_types=doc_types)
+                results = self._hydrate_sections(cursor, ids, similarities, query=query)
+            else:
+                ids, similarities = self._search_collection(cursor, table, query_embedding, limit, ticker)
+                results = self._hydrate_collection(cursor, table, ids, similarities)
+            
+            for result in results:
+                result['type'] = collection
+                result['score'] = weight * result['similarity']
+            combined_results.extend(results)
         
         conn.close()
+        
+        # Sort by weighted similarity
+        combined_results.sort(key=lambda x: x['score'], reverse=True)
         return combined_results[:top_k]
     
-    def _generate_snippet(self, content, query, max_length=200):
+    def hybrid_search(self, query, ticker=None, doc_types=None, top_k=10, index='flat', fusion='rrf',
+                      semantic_weight=1.0, keyword_weight=1.0, rrf_k=60, **search_params):
+        """
+        Perform hybrid search combining semantic and keyword search.
+        
+        The keyword leg queries the full-text index on a worker thread while the semantic
+        leg (query encoding and vector scan) runs on the calling thread, and the two
+        ranked lists are fused.
+        A keyword hit on a document that the semantic leg also returned is credited to
+        that document's best section; other keyword hits are added as their own results.
+        
+        Args:
+            query (str): Search query
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit search to specific document types
+            top_k (int): Number of top results to return
+            index (str): Vector index for the semantic leg: 'flat', 'scan' or a built
+                approximate index (see semantic_search)
+            fusion (str): 'rrf' for reciprocal-rank fusion, or 'score' to min-max normalize
+                each leg's scores and add them
+            semantic_weight (float): Weight of the semantic leg
+            keyword_weight (float): Weight of the keyword leg
+            rrf_k (int): Rank offset of reciprocal-rank fusion; larger values flatten the
+                advantage of the top ranks
+            **search_params: Per-query index parameters (ef_search for HNSW, nprobe for IVF,
+                rerank for any approximate index, block_size for 'scan')
+            
+        Returns:
+            list: Top matching results ordered by fused 'score', each with its
+                'semantic_rank' and 'keyword_rank' (None when the leg missed it).
+                Results only the keyword leg found carry a 'similarity' of
+                KEYWORD_ONLY_SIMILARITY, as before fusion, and the 'id' of the matched
+                section when keyword search ran over sections (None for whole filings)
+        """
+        if fusion not in ('rrf', 'score'):
+            raise ValueError(f"Unknown fusion method '{fusion}'")
+        
+        # Get semantic search results, with the filters applied inside the vector scan,
+        # on this thread while the keyword search runs on the pool
+        keyword_future = self._get_search_pool().submit(
+            self.keyword_search, query, ticker=ticker, doc_types=doc_types, top_k=top_k*2
+        )
+        semantic_results = self.semantic_search(query, top_k=top_k*2, index=index, ticker=ticker,
+                                                doc_types=doc_types, **search_params)
+        keyword_results = keyword_future.result()
+        
+        if fusion == 'rrf':
+            semantic_scores = [1.0 / (rrf_k + rank) for rank in range(1, len(semantic_results) + 1)]
+            keyword_scores = [1.0 / (rrf_k + rank) for rank in range(1, len(keyword_results) + 1)]
+        else:
+            semantic_scores = self._normalize_scores([result['similarity'] for result in semantic_results])
+            if keyword_results and keyword_results[0]['bm25'] is not None:
+                # bm25() is lower for better matches
+                keyword_scores = self._normalize_scores([-result['bm25'] for result in keyword_results])
+            else:
+                # The LIKE fallback has no relevance score, only an order
+                keyword_scores = self._normalize_scores(list(range(len(keyword_results), 0, -1)))
+        
+        # Combine the legs, keyed on each document's best semantic section
+        combined_results = []
+        best_section = {}
+        for rank, (result, score) in enumerate(zip(semantic_results, semantic_scores), 1):
+            result['semantic_rank'] = rank
+            result['keyword_rank'] = None
+            result['score'] = semantic_weight * score
+            best_section.setdefault(result['doc_id'], result)
+            combined_results.append(result)
+        
+        for rank, (result, score) in enumerate(zip(keyword_results, keyword_scores), 1):
+            match = best_section.get(result['doc_id'])
+            if match is None:
+                result['similarity'] = KEYWORD_ONLY_SIMILARITY
+                result['semantic_rank'] = None
+                result['keyword_rank'] = rank
+                result['score'] = keyword_weight * score
+                best_section[result['doc_id']] = result
+                combined_results.append(result)
+            elif match['keyword_rank'] is None:
+                match['keyword_rank'] = rank
+                match['score'] += keyword_weight * score
+        
+        # Sort by fused score
+        combined_results.sort(key=lambda x: x['score'], reverse=True)
+        
+        return combined_results[:top_k]
+    
+    def _get_search_pool(self):
+        """Start the hybrid search thread pool on first use."""
+        if self._search_pool is None:
+            with self._index_lock:
+                if self._search_pool is None:
+                    self._search_pool = ThreadPoolExecutor(max_workers=self.search_workers,
+                                                           thread_name_prefix='hybrid-search')
+        return self._search_pool
+    
+    def _normalize_scores(self, scores):
+        """
+        Min-max normalize a leg's scores to [0, 1].
+        
+        Args:
+            scores (list): Scores, higher is better
+            
+        Returns:
+            list: Normalized scores; all 1.0 when the scores are equal
+        """
+        if not scores:
+            return []
+        low, high = min(scores), max(scores)
+        if high - low <= 1e-12:
+            return [1.0] * len(scores)
+        return [(score - low) / (high - low) for score in scores]
+    
+    def _check_fulltext_index(self):
+        """Check whether the FTS5 keyword indexes exist, without creating them."""
+        conn = sqlite3.connect(self.db_path)
+        available = self._fulltext_available(conn.cursor())
+        conn.close()
+        return available
+    
+    def _fulltext_available(self, cursor):
+        """Check once whether the FTS5 keyword indexes exist."""
+        if self.fts_enabled is None:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                tuple(FULLTEXT_TABLES)
+            )
+            self.fts_enabled = cursor.fetchone()[0] == len(FULLTEXT_TABLES)
+        return self.fts_enabled
+    
+    def _build_match_expression(self, query):
+        """
+        Turn free text into an FTS5 MATCH expression.
+        
+        Each term is quoted so that FTS5 operators and punctuation in the query are
+        matched literally; terms are OR-ed and bm25() ranks rows matching more of them.
+        
+        Args:
+            query (str): Search query
+            
+        Returns:
+            str: MATCH expression, or None if the query has no searchable terms
+        """
+        terms = re.findall(r'\w+', query.lower())
+        if not terms:
+            return None
+        return ' OR '.join(f'"{term}"' for term in dict.fromkeys(terms))
+    
+    def keyword_search(self, query, ticker=None, doc_types=None, top_k=10, scope='documents',
+                       highlight=('<mark>', '</mark>')):
         """
-        Generate a relevant snippet from document content based on search query.
+        Perform BM25-ranked keyword search over the FTS5 indexes.
         
         Args:
-            content (str): Document content
             query (str): Search query
-            max_length (int): Maximum snippet length
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit search to specific document types
+            top_k (int): Number of top results to return
+            scope (str): 'documents' to match whole filings, 'sections' to match document sections
+            highlight (tuple): Opening and closing markers around matched terms in 'highlight'
             
         Returns:
-            str: Generated snippet
+            list: Matching results in the semantic search format, best first, with a plain
+                'section_content' snippet (also in 'snippet'), the [start, end] offsets of
+                matched terms in it as 'highlights', a marked-up 'highlight' and the
+                'bm25' score
         """
-        # Find the position of the query in the content
-        query_lower = query.lower()
-        content_lower = content.lower()
+        if scope not in ('documents', 'sections'):
+            raise ValueError(f"Unknown keyword search scope '{scope}'")
         
-        pos = content_lower.find(query_lower)
-        if pos == -1:
-            # If exact query not found, look for individual words
-            query_words = query_lower.split()
-            for word in query_words:
-                if len(word) > 3:  # Only consider significant words
-                    pos = content_lower.find(word)
-                    if pos != -1:
-                        break
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
         
-        # If still not found, return the beginning of the content
-        if pos == -1:
-            return content[:max_length] + "..."
+        try:
+            if not self._fulltext_available(cursor):
+                return self._like_search(cursor, query, ticker, doc_types, top_k, highlight)
+            
+            match = self._build_match_expression(query)
+            if match is None:
+                return []
+            
+            # Titles weigh more than body text; snippet() reads the match positions from
+            # the index instead of scanning the content
+            if scope == 'documents':
+                sql = '''
+                SELECT NULL AS id, d.id AS doc_id, d.ticker, d.doc_type, d.title AS doc_title,
+                       d.filing_date, 'Keyword Match' AS section_title,
+                       snippet(documents_fts, 1, ?, ?, '...', 40) AS marked,
+                       bm25(documents_fts, 2.0, 1.0) AS bm25
+                FROM documents_fts
+                JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                '''
+            else:
+                sql = '''
+                SELECT s.id, d.id AS doc_id, d.ticker, d.doc_type, d.title AS doc_title,
+                       d.filing_date, s.section_title,
+                       snippet(document_sections_fts, 1, ?, ?, '...', 40) AS marked,
+                       bm25(document_sections_fts, 2.0, 1.0) AS bm25
+                FROM document_sections_fts
+                JOIN document_sections s ON s.id = document_sections_fts.rowid
+                JOIN documents d ON d.id = s.document_id
+                WHERE document_sections_fts MATCH ?
+                '''
+            params = [_FTS_MARKERS[0], _FTS_MARKERS[1], match]
+            
+            if ticker:
+                sql += " AND d.ticker = ?"
+                params.append(ticker)
+            
+            if doc_types:
+                placeholders = ', '.join(['?'] * len(doc_types))
+                sql += f" AND d.doc_type IN ({placeholders})"
+                params.extend(doc_types)
+            
+            sql += " ORDER BY bm25 LIMIT ?"
+            params.append(top_k)
+            
+            cursor.execute(sql, params)
+            
+            results = []
+            for row in cursor.fetchall():
+                result = dict(row)
+                snippet = parse_marked(result.pop('marked'), _FTS_MARKERS)
+                result['section_content'] = snippet['text']
+                result['snippet'] = snippet['text']
+                result['highlights'] = snippet['highlights']
+                result['highlight'] = mark_highlights(snippet, highlight)
+                results.append(result)
+            return results
+        finally:
+            conn.close()
+    
+    def _like_search(self, cursor, query, ticker, doc_types, top_k, highlight):
+        """
+        Phrase search with LIKE, for SQLite builds without FTS5 or databases that have
+        not run create_fulltext_index().
         
-        # Calculate snippet start and end positions
-        start = max(0, pos - max_length // 2)
-        end = min(len(content), pos + max_length // 2)
+        Vectorized sections are searched so snippets are cut from a section rather than
+        a whole filing; a database that has not been vectorized yet searches the
+        filings themselves.
         
-        # Adjust to avoid cutting words
-        while start > 0 and content[start] != ' ':
-            start -= 1
+        Args:
+            cursor (sqlite3.Cursor): Database cursor with a Row factory
+            query (str): Search query
+            ticker (str, optional): Limit search to specific company
+            doc_types (list, optional): Limit search to specific document types
+            top_k (int): Number of results to return
+            highlight (tuple): Opening and closing markers around matched terms in 'highlight'
+            
+        Returns:
+            list: Matching sections in the keyword search format, newest first
+        """
+        cursor.execute('SELECT 1 FROM document_embeddings LIMIT 1')
+        if cursor.fetchone():
+            sql = '''
+            SELECT e.id, d.id AS doc_id, d.ticker, d.doc_type, d.title, d.filing_date, e.section_title,
+                   e.section_content
+            FROM document_embeddings e
+            JOIN documents d ON d.id = e.doc_id
+            WHERE e.section_content LIKE ?
+            '''
+        else:
+            sql = '''
+            SELECT NULL AS id, d.id AS doc_id, d.ticker, d.doc_type, d.title, d.filing_date,
+                   'Keyword Match' AS section_title, d.content AS section_content
+            FROM documents d
+            WHERE d.content LIKE ?
+            '''
+        params = [f"%{query}%"]
         
-        while end < len(content) and content[end] != ' ':
-            end += 1
+        if ticker:
+            sql += " AND d.ticker = ?"
+            params.append(ticker)
         
-        # Create the snippet
-        snippet = content[start:end].strip()
+        if doc_types:
+            placeholders = ', '.join(['?'] * len(doc_types))
+            sql += f" AND d.doc_type IN ({placeholders})"
+            params.extend(doc_types)
         
-        # Add ellipsis if needed
-        if start > 0:
-            snippet = "..." + snippet
+        sql += " ORDER BY d.filing_date DESC LIMIT ?"
+        params.append(top_k)
         
-        if end < len(content):
-            snippet = snippet + "..."
+        cursor.execute(sql, params)
         
-        return snippet
+        results = []
+        for row in cursor.fetchall():
+            # Snippets are cut from the section, so their cost does not grow with the filing
+            # once it has been vectorized
+            snippet = generate_snippet(row['section_content'], query)
+            results.append({
+                'id': row['id'],
+                'doc_id': row['doc_id'],
+                'ticker': row['ticker'],
+                'doc_type': row['doc_type'],
+                'doc_title': row['title'],
+                'filing_date': row['filing_date'],
+                'section_title': row['section_title'],
+                'section_content': snippet['text'],
+                'snippet': snippet['text'],
+                'highlights': snippet['highlights'],
+                'highlight': mark_highlights(snippet, highlight),
+                'bm25': None
+            })
+        return results
+    
+def _embedding_text(table, row):
+    """Rebuild the text an embedding row's vector was computed from."""
+    return _EMBEDDING_TEXT_TEMPLATES[table].format(**row)
+
+
+def _encoder_spec(encoder, model_name):
+    """
+    Return the configuration string that recreates an encoder, or None for an instance.
+    
+    Transformer strings without a model name are completed with model_name.
+    """
+    if not isinstance(encoder, str):
+        return None
+    kind, _, argument = encoder.partition(':')
+    if kind in ('transformer', 'transformer-int8') and not argument:
+        return f'{kind}:{model_name}'
+    return encoder
+
+
+# Per-process state for parallel vectorization workers
+_worker_kb = None
+
+
+def _init_vectorize_worker(db_path, encoder, model_name, section_tokens, section_overlap):
+    """Create the encoder once per worker process; its model loads on first encode."""
+    global _worker_kb
+    
+    # Each worker encodes its own shard, so keep the encoder to one thread
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    
+    _worker_kb = VectorKnowledgeBase(db_path, initialize_db=False, model_name=model_name, encoder=encoder,
+                                     section_tokens=section_tokens, section_overlap=section_overlap)
+
+
+def _vectorize_document_chunk(documents, known_hashes, batch_size):
+    """
+    Split a chunk of documents and encode its new or changed sections.
+    
+    Args:
+        documents (list): (id, ticker, doc_type, title, content) rows
+        known_hashes (dict): Stored content hash per (doc_id, section_id) key
+        batch_size (int): Encoder batch size
+        
+    Returns:
+        list: (key, values, text, content hash, embedding bytes) items; unchanged
+            sections are reported with values and embedding set to None
+    """
+    items = []
+    to_encode = []
+    for key, values, text in _worker_kb._iter_document_sections(documents):
+        key = tuple(str(value) for value in key)
+        content_hash = _worker_kb._content_hash(values)
+        if known_hashes.get(key) == content_hash:
+            # Keep the text: near-duplicate detection needs it even for unchanged sections
+            items.append((key, None, text, content_hash, None))
+        else:
+            to_encode.append(len(items))
+            items.append((key, values, text, content_hash, None))
+    
+    embeddings = _worker_kb._encode_batch([items[position][2] for position in to_encode], batch_size) if to_encode else []
+    for position, embedding in zip(to_encode, embeddings):
+        items[position] = items[position][:4] + (embedding,)
+    
+    return items
+
 
 # Example usage
 if __name__ == "__main__":
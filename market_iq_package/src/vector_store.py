@@ -0,0 +1,274 @@
+"""
+Memory-mapped document vector store for the Financial Knowledge Base.
+This module writes the document embeddings to a versioned binary file that search processes map read-only,
+so they start without decoding SQLite BLOBs and share one copy of the matrix through the OS page cache.
+
+File layout (little-endian):
+    magic (8 bytes) | format version (uint32) | header length (uint32) | header CRC32 (uint32)
+    JSON header | arrays, each starting on a 64-byte boundary
+
+The header records each array's dtype, shape, offset and CRC32, the ticker and doc_type
+vocabularies, and the state of document_embeddings the file was exported from. SQLite
+remains the source of truth; regenerate the file with:
+    
+    python -m src.vector_store --db src/financial_kb.db --out src/document_vectors.miqv
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import argparse
+import numpy as np
+
+MAGIC = b'MIQVECS\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# magic, format version, header length, header checksum
+_PREAMBLE = struct.Struct('<8sIII')
+
+# Arrays stored in every file, all parallel to the matrix rows
+_ARRAY_DTYPES = {
+    'vectors': '<f4',
+    'ids': '<i8',
+    'doc_ids': '<i8',
+    'ticker_codes': '<i4',
+    'doc_type_codes': '<i4',
+}
+
+
+def _aligned(offset):
+    """Round an offset up to the next array boundary."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _as_bytes(array):
+    """View an array's data as a flat uint8 array without copying it."""
+    return np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+
+
+def _checksum(array):
+    """CRC32 of an array's bytes."""
+    return zlib.crc32(_as_bytes(array)) & 0xffffffff
+
+
+def _encode_categories(values):
+    """Map values to int32 codes and return (codes, vocabulary)."""
+    codes_by_value = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for position, value in enumerate(values):
+        codes[position] = codes_by_value.setdefault(value, len(codes_by_value))
+    return codes, list(codes_by_value)
+
+
+def write_vector_store(path, ids, doc_ids, tickers, doc_types, vectors, source_state):
+    """
+    Write a vector store file, replacing any existing one atomically.
+    
+    Processes that already mapped the old file keep reading it until they reopen.
+    
+    Args:
+        path (str): Destination file path
+        ids (array-like): document_embeddings row id of each vector
+        doc_ids (array-like): Document id of each vector
+        tickers (list): Ticker of each vector
+        doc_types (list): Document type of each vector
+        vectors (array-like): Normalized embedding matrix, one row per id
+        source_state (tuple): (max row id, mutation count) of document_embeddings at export
+        
+    Returns:
+        dict: The file header
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    ticker_codes, ticker_vocabulary = _encode_categories(tickers)
+    doc_type_codes, doc_type_vocabulary = _encode_categories(doc_types)
+    
+    arrays = {
+        'vectors': vectors,
+        'ids': np.asarray(ids, dtype=np.int64),
+        'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+        'ticker_codes': ticker_codes,
+        'doc_type_codes': doc_type_codes,
+    }
+    arrays = {name: np.ascontiguousarray(array, dtype=_ARRAY_DTYPES[name]) for name, array in arrays.items()}
+    
+    header = {
+        'count': len(arrays['ids']),
+        'dim': arrays['vectors'].shape[1],
+        'source_state': [int(value) for value in source_state],
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'vocabularies': {'ticker': ticker_vocabulary, 'doc_type': doc_type_vocabulary},
+        'arrays': {},
+    }
+    
+    # Offsets depend on the header length, which depends on the offsets; reserve room
+    # for the largest offsets first and lay the arrays out after that
+    data_start = 0
+    while True:
+        offset = data_start
+        for name, array in arrays.items():
+            offset = _aligned(offset)
+            header['arrays'][name] = {
+                'dtype': _ARRAY_DTYPES[name],
+                'shape': list(array.shape),
+                'offset': offset,
+                'crc32': _checksum(array),
+            }
+            offset += array.nbytes
+        header_bytes = json.dumps(header).encode('utf-8')
+        required = _aligned(_PREAMBLE.size + len(header_bytes))
+        if required <= data_start:
+            break
+        data_start = required
+    
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes), zlib.crc32(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(_as_bytes(array))
+        # Seeking past the end writes nothing, so extend the file to the end of the
+        # layout; a store exported from an empty table is then still complete
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    
+    return header
+
+
+def read_header(path):
+    """
+    Read and validate the header of a vector store file.
+    
+    Args:
+        path (str): Vector store file path
+        
+    Returns:
+        dict: The file header
+        
+    Raises:
+        ValueError: If the file is not a vector store, has an unsupported format version
+            or a corrupt header
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise ValueError(f"{path} is not a vector store file")
+        
+        magic, version, header_length, header_crc = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a vector store file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format version {version} in {path}")
+        
+        header_bytes = f.read(header_length)
+    
+    if len(header_bytes) != header_length or zlib.crc32(header_bytes) != header_crc:
+        raise ValueError(f"Corrupt vector store header in {path}")
+    return json.loads(header_bytes.decode('utf-8'))
+
+
+class VectorStore:
+    """
+    Read-only, memory-mapped view of a vector store file.
+    
+    The arrays are np.memmap views, so opening the file costs no more than reading
+    its header and pages are loaded on demand and shared between processes.
+    """
+    
+    def __init__(self, path, verify=False):
+        """
+        Open a vector store file.
+        
+        Args:
+            path (str): Vector store file path
+            verify (bool): Check every array against its CRC32, which reads the whole file
+            
+        Raises:
+            ValueError: If the file is invalid, truncated or, with verify, corrupt
+        """
+        self.path = path
+        self.header = read_header(path)
+        
+        file_size = os.path.getsize(path)
+        self.arrays = {}
+        for name in _ARRAY_DTYPES:
+            spec = self.header['arrays'][name]
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            if spec['offset'] + dtype.itemsize * int(np.prod(shape)) > file_size:
+                raise ValueError(f"Truncated vector store {path}: array '{name}' is incomplete")
+            
+            if self.header['count'] == 0:
+                array = np.empty(shape, dtype=dtype)
+            else:
+                array = np.memmap(path, dtype=dtype, mode='r', offset=spec['offset'], shape=shape)
+            
+            if verify and _checksum(array) != spec['crc32']:
+                raise ValueError(f"Checksum mismatch for array '{name}' in {path}")
+            self.arrays[name] = array
+    
+    def __len__(self):
+        return self.header['count']
+    
+    @property
+    def dim(self):
+        """int: Embedding dimension."""
+        return self.header['dim']
+    
+    @property
+    def source_state(self):
+        """tuple: (max row id, mutation count) of document_embeddings at export."""
+        return tuple(self.header['source_state'])
+    
+    @property
+    def vectors(self):
+        """numpy.ndarray: Memory-mapped normalized embedding matrix."""
+        return self.arrays['vectors']
+    
+    @property
+    def ids(self):
+        """numpy.ndarray: document_embeddings row id of each vector."""
+        return self.arrays['ids']
+    
+    @property
+    def doc_ids(self):
+        """numpy.ndarray: Document id of each vector."""
+        return self.arrays['doc_ids']
+    
+    def categories(self, name):
+        """
+        Return the codes and vocabulary of a categorical column.
+        
+        Args:
+            name (str): 'ticker' or 'doc_type'
+            
+        Returns:
+            tuple: (codes, vocabulary) where codes index into vocabulary
+        """
+        return self.arrays[f'{name}_codes'], self.header['vocabularies'][name]
+
+
+def main():
+    """Regenerate the vector store file from the SQLite embedding tables."""
+    parser = argparse.ArgumentParser(description='Export document embeddings to a memory-mapped vector store')
+    parser.add_argument('--db', required=True, help='Path to the SQLite database')
+    parser.add_argument('--out', required=True, help='Vector store file to write')
+    parser.add_argument('--verify', action='store_true', help='Reopen the file and check every checksum')
+    args = parser.parse_args()
+    
+    from src.vector_kb import VectorKnowledgeBase
+    
+    vector_kb = VectorKnowledgeBase(args.db)
+    header = vector_kb.export_vector_store(args.out)
+    if args.verify:
+        VectorStore(args.out, verify=True)
+    print(f"Wrote {header['count']} vectors ({header['dim']} dimensions) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Shared fixtures for the vector search tests.
+The knowledge base fixtures use the hashing encoder, so no embedding model is downloaded.
+"""
+
+import os
+import sys
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.vector_kb import VectorKnowledgeBase
+
+TICKERS = ['ADP', 'PAYX', 'TNET', 'WDAY']
+DOC_TYPES = ['10-K', '10-Q', '8-K']
+WORDS = ('revenue growth risk margin payroll client employee benefits insurance market competition '
+         'regulation tax cash debt liquidity guidance headcount retention pricing').split()
+HEADINGS = ['RISK FACTORS', 'Results of operations:', 'OVERVIEW', 'LIQUIDITY AND CAPITAL RESOURCES']
+
+SCHEMA = '''
+CREATE TABLE companies (
+    ticker TEXT PRIMARY KEY,
+    name TEXT,
+    industry TEXT,
+    sector TEXT,
+    description TEXT
+);
+CREATE TABLE documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT,
+    doc_type TEXT,
+    filing_date TEXT,
+    title TEXT,
+    content TEXT,
+    url TEXT,
+    file_path TEXT
+);
+CREATE TABLE document_sections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id INTEGER,
+    section_title TEXT,
+    section_content TEXT
+);
+'''
+
+
+def make_filing(rng, paragraphs=8):
+    """Return the text of a synthetic filing with a few headed sections."""
+    parts = []
+    for paragraph in range(paragraphs):
+        if paragraph % 3 == 0:
+            parts.append(rng.choice(HEADINGS))
+        parts.append(' '.join(rng.choice(WORDS) for _ in range(60)))
+    return '\n\n'.join(parts)
+
+
+def add_documents(db_path, count, seed=0):
+    """Insert synthetic filings spread over the test tickers, types and years."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    for number in range(count):
+        ticker = TICKERS[number % len(TICKERS)]
+        conn.execute(
+            'INSERT INTO documents (ticker, doc_type, filing_date, title, content) VALUES (?, ?, ?, ?, ?)',
+            (ticker, rng.choice(DOC_TYPES), f'{2019 + number % 5}-0{1 + number % 9}-15',
+             f'{ticker} filing {seed}-{number}', make_filing(rng))
+        )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path to a database of 40 synthetic filings."""
+    path = str(tmp_path / 'financial_kb.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO companies VALUES (?, ?, ?, ?, ?)',
+                     [(ticker, f'{ticker} Inc', 'HR Services', 'Industrials', f'Description of {ticker}')
+                      for ticker in TICKERS])
+    conn.commit()
+    conn.close()
+    add_documents(path, 40)
+    return path
+
+
+@pytest.fixture
+def vector_kb(db_path):
+    """Knowledge base over the synthetic filings with every document vectorized."""
+    kb = VectorKnowledgeBase(db_path, encoder='hashing')
+    kb.vectorize_documents()
+    return kb
+
+
+@pytest.fixture
+def clustered_vectors():
+    """(labels, vectors, queries): 1000 normalized vectors in 20 clusters and 25 queries."""
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(20, 32))
+    vectors = centers[rng.integers(0, 20, size=1000)] + 0.4 * rng.normal(size=(1000, 32))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = centers[rng.integers(0, 20, size=25)] + 0.4 * rng.normal(size=(25, 32))
+    labels = np.arange(1, 1001, dtype=np.int64) * 3
+    return labels, vectors.astype(np.float32), queries.astype(np.float32)
@@ -0,0 +1,67 @@
+"""
+Tests for batched multi-query semantic search and its API endpoint.
+"""
+
+import pytest
+
+from src.vector_kb import VectorKnowledgeBase
+
+QUERIES = ['revenue growth and margin', 'liquidity risk and debt', 'payroll client retention pricing',
+           'Revenue growth and margin', 'tax']
+
+
+def ranking(results):
+    """Section ids and rounded similarities of search results, in order."""
+    return [(result['id'], round(result['similarity'], 5)) for result in results]
+
+
+def without_similarity(results):
+    """Search results without their similarities, which batched products may round differently."""
+    return [{key: value for key, value in result.items() if key != 'similarity'} for result in results]
+
+
+@pytest.mark.parametrize('index', ['flat', 'scan', 'hnsw'])
+@pytest.mark.parametrize('filters', [{}, {'ticker': 'WDAY'}, {'doc_types': ['10-Q', '8-K']}])
+def test_many_matches_single_searches(vector_kb, index, filters):
+    if index == 'hnsw':
+        vector_kb.build_index(index)
+    batched = vector_kb.semantic_search_many(QUERIES, top_k=6, index=index, **filters)
+    
+    assert len(batched) == len(QUERIES)
+    for query, results in zip(QUERIES, batched):
+        expected = vector_kb.semantic_search(query, top_k=6, index=index, **filters)
+        assert ranking(results) == ranking(expected)
+        assert without_similarity(results) == without_similarity(expected)
+
+
+def test_many_with_compact_storage(vector_kb):
+    compact = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', storage='int8')
+    batched = compact.semantic_search_many(QUERIES, top_k=4, ticker='ADP')
+    for query, results in zip(QUERIES, batched):
+        assert ranking(results) == ranking(vector_kb.semantic_search(query, top_k=4, ticker='ADP'))
+
+
+def test_many_without_queries(vector_kb):
+    assert vector_kb.semantic_search_many([]) == []
+
+
+def test_batch_endpoint(vector_kb, monkeypatch):
+    pytest.importorskip('flask')
+    from src import main
+    
+    client = main.app.test_client()
+    monkeypatch.setattr(main, 'vector_kb', None)
+    assert client.post('/api/search/batch', json={'queries': QUERIES}).status_code == 503
+    
+    monkeypatch.setattr(main, 'vector_kb', vector_kb)
+    monkeypatch.setattr(main, 'vector_index', 'flat')
+    response = client.post('/api/search/batch', json={'queries': QUERIES[:2], 'top_k': 3, 'ticker': 'PAYX'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [entry['query'] for entry in body['results']] == QUERIES[:2]
+    for entry in body['results']:
+        expected = vector_kb.semantic_search(entry['query'], top_k=3, ticker='PAYX')
+        assert [result['id'] for result in entry['results']] == [result['id'] for result in expected]
+    
+    for payload in ({'queries': []}, {'queries': ['revenue', '']}, {'queries': 'revenue'}):
+        assert client.post('/api/search/batch', json=payload).status_code == 400
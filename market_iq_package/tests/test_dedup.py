@@ -0,0 +1,117 @@
+"""
+Tests for near-duplicate detection and the section references written by vectorization.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+from src.dedup import LSHIndex, MinHasher, NearDuplicateDetector, estimate_similarity
+from src.vector_kb import VectorKnowledgeBase
+
+from conftest import WORDS
+
+BOILERPLATE = ('FORWARD-LOOKING STATEMENTS\n\nThis report contains forward-looking statements about future '
+               'results that involve risks and uncertainties, and actual results could differ materially from '
+               'those anticipated because of factors discussed in our filings with the commission, which we '
+               'undertake no obligation to update except as required by applicable securities law.')
+
+
+def words(seed, count=120):
+    """A reproducible run of random filing words."""
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def test_minhash_estimates_jaccard_similarity():
+    hasher = MinHasher(num_perm=256, shingle_size=1)
+    first = ' '.join(f'w{number}' for number in range(0, 100))
+    second = ' '.join(f'w{number}' for number in range(50, 150))
+    
+    assert estimate_similarity(hasher.signature(first), hasher.signature(first)) == 1.0
+    assert estimate_similarity(hasher.signature(first), hasher.signature(second)) == pytest.approx(1 / 3, abs=0.08)
+
+
+def test_lsh_respects_threshold_and_scope():
+    hasher = MinHasher()
+    index = LSHIndex()
+    index.add('boilerplate', hasher.signature(BOILERPLATE), scope='ADP')
+    near = BOILERPLATE.replace('commission', 'SEC')
+    
+    assert index.query(hasher.signature(near), 0.7, scope='ADP')[0] == 'boilerplate'
+    assert index.query(hasher.signature(near), 0.7, scope='PAYX') is None
+    assert index.query(hasher.signature(words(1)), 0.7, scope='ADP') is None
+    with pytest.raises(ValueError):
+        LSHIndex(num_perm=128, bands=10)
+
+
+def test_detector_keeps_first_occurrence_canonical():
+    detector = NearDuplicateDetector(threshold=0.8)
+    assert detector.check('a', BOILERPLATE) is None
+    assert detector.check('b', words(2)) is None
+    key, similarity = detector.check('c', BOILERPLATE)
+    assert key == 'a' and similarity == 1.0
+
+
+@pytest.fixture
+def boilerplate_db(tmp_path):
+    """Three ADP filings sharing a boilerplate section; ids are not in filing-date order."""
+    path = str(tmp_path / 'boilerplate.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE documents (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT, doc_type TEXT, '
+                 'filing_date TEXT, title TEXT, content TEXT)')
+    for number, filing_date in enumerate(['2023-02-01', '2021-02-01', '2022-02-01']):
+        conn.execute('INSERT INTO documents (ticker, doc_type, filing_date, title, content) VALUES (?, ?, ?, ?, ?)',
+                     ('ADP', '10-K', filing_date, f'ADP 10-K {filing_date[:4]}',
+                      f'OVERVIEW\n\n{words(number)}\n\n{BOILERPLATE}'))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def boilerplate_rows(db_path):
+    """(doc_id, canonical doc_id) of every boilerplate reference, and the embedded boilerplate doc_ids."""
+    conn = sqlite3.connect(db_path)
+    refs = conn.execute('''
+        SELECT r.doc_id, e.doc_id FROM document_section_refs r JOIN document_embeddings e ON e.id = r.canonical_id
+        ORDER BY r.doc_id
+    ''').fetchall()
+    embedded = conn.execute("SELECT doc_id FROM document_embeddings WHERE section_content LIKE '%forward-looking%' "
+                            "ORDER BY doc_id").fetchall()
+    conn.close()
+    return [(int(doc_id), int(canonical)) for doc_id, canonical in refs], [int(row[0]) for row in embedded]
+
+
+def test_newest_filing_is_canonical(boilerplate_db):
+    conn = sqlite3.connect(boilerplate_db)
+    conn.execute("UPDATE documents SET filing_date = '2024-02-01' WHERE id = 2")
+    conn.commit()
+    conn.close()
+    vector_kb = VectorKnowledgeBase(boilerplate_db, encoder='hashing')
+    stats = vector_kb.vectorize_documents()
+    
+    assert stats['duplicates'] == 2
+    assert boilerplate_rows(boilerplate_db) == ([(1, 2), (3, 2)], [2])
+    
+    semantic = vector_kb.semantic_search(BOILERPLATE, top_k=1)[0]
+    assert semantic['filing_date'] == '2024-02-01'
+    assert [duplicate['filing_date'] for duplicate in semantic['duplicates']] == ['2023-02-01', '2022-02-01']
+
+
+def test_references_are_promoted_when_canonical_is_pruned(boilerplate_db):
+    vector_kb = VectorKnowledgeBase(boilerplate_db, encoder='hashing')
+    vector_kb.vectorize_documents()
+    
+    # The newest filing drops the boilerplate; a limited run only streams that filing
+    conn = sqlite3.connect(boilerplate_db)
+    conn.execute("UPDATE documents SET content = ? WHERE id = 1", (f'OVERVIEW\n\n{words(0)}',))
+    conn.commit()
+    conn.close()
+    stats = vector_kb.vectorize_documents(limit=1)
+    
+    assert stats['promoted'] == 1
+    assert boilerplate_rows(boilerplate_db) == ([(2, 3)], [3])
+    semantic = vector_kb.semantic_search(BOILERPLATE, top_k=1)[0]
+    assert semantic['doc_id'] == 3
+    assert [duplicate['doc_id'] for duplicate in semantic['duplicates']] == [2]
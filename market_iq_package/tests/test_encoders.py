@@ -0,0 +1,97 @@
+"""
+Tests for the lightweight encoders and the encoder configuration strings.
+"""
+
+import numpy as np
+import pytest
+
+from src.encoders import HashingEncoder, TfidfSvdEncoder, create_encoder
+
+from conftest import make_filing
+
+
+class Corpus:
+    """Re-iterable corpus that counts how often it has been read."""
+    
+    def __init__(self, texts):
+        self.texts = texts
+        self.reads = 0
+    
+    def __iter__(self):
+        self.reads += 1
+        return iter(self.texts)
+
+
+@pytest.fixture
+def corpus():
+    """Filing texts of a small synthetic corpus."""
+    rng = np.random.default_rng(11)
+    return [make_filing(rng, paragraphs=4) for _ in range(30)]
+
+
+def test_hashing_is_deterministic_and_normalized(corpus):
+    encoder = HashingEncoder(dim=64)
+    embeddings = encoder.encode(corpus[:5])
+    
+    assert embeddings.shape == (5, 64) and embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-5)
+    assert np.array_equal(HashingEncoder(dim=64).encode(corpus[0]), embeddings[0])
+
+
+def test_hashing_fit_streams_and_renames_space(corpus):
+    encoder = HashingEncoder(dim=64)
+    before = encoder.name
+    encoder.fit(text for text in corpus)
+    
+    assert encoder.idf.shape == (64,)
+    assert encoder.name.startswith(before) and encoder.name != before
+
+
+def test_tfidf_svd_fit_reads_corpus_twice_without_keeping_it(corpus):
+    texts = Corpus(corpus)
+    encoder = TfidfSvdEncoder(dim=8, n_features=512, oversample=4).fit(texts)
+    
+    assert texts.reads == 2
+    assert encoder.components.shape == (512, 8)
+    assert np.allclose(encoder.components.T @ encoder.components, np.eye(8), atol=1e-4)
+    
+    with pytest.raises(ValueError):
+        TfidfSvdEncoder(dim=8, n_features=512).fit(text for text in corpus)
+
+
+def test_tfidf_svd_matches_exact_decomposition(corpus):
+    # With as many projections as texts the sketch spans the whole row space
+    encoder = TfidfSvdEncoder(dim=6, n_features=512, oversample=len(corpus)).fit(corpus)
+    
+    matrix = np.zeros((len(corpus), 512))
+    for row, text in enumerate(corpus):
+        features, values = encoder._tfidf(text)
+        np.add.at(matrix[row], features, values)
+    _, _, vt = np.linalg.svd(matrix, full_matrices=False)
+    
+    overlap = np.linalg.svd(vt[:6] @ encoder.components, compute_uv=False)
+    assert np.allclose(overlap, 1.0, atol=1e-3)
+
+
+def test_tfidf_svd_save_and_create_encoder(corpus, tmp_path):
+    encoder = TfidfSvdEncoder(dim=8, n_features=512).fit(corpus)
+    path = str(tmp_path / 'lsa.npz')
+    encoder.save(path)
+    
+    loaded = create_encoder(f'tfidf-svd:{path}')
+    assert loaded.name == encoder.name
+    assert np.allclose(loaded.encode(corpus[:3]), encoder.encode(corpus[:3]))
+
+
+def test_create_encoder_specs():
+    assert create_encoder('hashing').dim == 384
+    assert create_encoder('hashing:96').dim == 96
+    encoder = HashingEncoder()
+    assert create_encoder(encoder) is encoder
+    
+    with pytest.raises(ValueError):
+        create_encoder('word2vec')
+    with pytest.raises(ValueError):
+        create_encoder('tfidf-svd')
+    with pytest.raises(ValueError):
+        TfidfSvdEncoder().encode('unfitted')
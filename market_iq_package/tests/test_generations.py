@@ -0,0 +1,78 @@
+"""
+Tests for embedding generations: re-embedding with another encoder and the swap to it.
+"""
+
+import sqlite3
+
+from src.vector_kb import VectorKnowledgeBase
+
+from conftest import add_documents
+
+
+def embedding_ids(db_path):
+    """Ids of the document embedding rows, ascending."""
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute('SELECT id FROM document_embeddings ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def test_reembed_swaps_generation_and_keeps_row_ids(vector_kb):
+    ids = embedding_ids(vector_kb.db_path)
+    before = vector_kb.generation
+    
+    vector_kb.reembed('hashing:128', background=False)
+    
+    active = [generation for generation in vector_kb.generation_status() if generation['status'] == 'active']
+    assert len(active) == 1 and active[0]['generation'] == vector_kb.generation != before
+    assert active[0]['dim'] == 128
+    assert vector_kb.encoder.name == vector_kb.target_encoder.name == active[0]['model']
+    assert embedding_ids(vector_kb.db_path) == ids
+    
+    results = vector_kb.semantic_search('liquidity risk', top_k=5)
+    assert len(results) == 5
+    assert len(vector_kb._doc_index.reconstruct(0)) == 128
+
+
+def test_reembed_keeps_autoincrement_high_water_mark(vector_kb):
+    ids = embedding_ids(vector_kb.db_path)
+    conn = sqlite3.connect(vector_kb.db_path)
+    conn.execute('DELETE FROM document_embeddings WHERE id >= ?', (ids[-3],))
+    conn.commit()
+    conn.close()
+    
+    vector_kb.reembed('hashing:128', background=False)
+    add_documents(vector_kb.db_path, 2, seed=4)
+    vector_kb.vectorize_documents()
+    
+    new_ids = set(embedding_ids(vector_kb.db_path)) - set(ids[:-3])
+    assert new_ids and min(new_ids) > ids[-1]
+
+
+def test_other_process_switches_after_check_interval(vector_kb):
+    watcher = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', generation_check_interval=3600)
+    eager = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', generation_check_interval=0)
+    watcher.semantic_search('revenue')
+    generation = watcher.generation
+    
+    vector_kb.reembed('hashing:128', background=False)
+    
+    # The cached check keeps serving the old generation until it expires
+    watcher.semantic_search('revenue')
+    assert watcher.generation == generation
+    
+    assert len(eager.semantic_search('revenue', top_k=3)) == 3
+    assert eager.generation == vector_kb.generation
+    assert eager.encoder.name == vector_kb.encoder.name
+
+
+def test_vectorize_after_switch_uses_new_encoder(vector_kb):
+    vector_kb.reembed('hashing:128', background=False)
+    writer = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing')
+    add_documents(vector_kb.db_path, 2, seed=5)
+    writer.vectorize_documents()
+    
+    conn = sqlite3.connect(vector_kb.db_path)
+    lengths = {row[0] for row in conn.execute('SELECT DISTINCT length(embedding) FROM document_embeddings')}
+    conn.close()
+    assert lengths == {128 * 4}
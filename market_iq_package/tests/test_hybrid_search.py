@@ -0,0 +1,80 @@
+"""
+Tests for hybrid search: fusion of the semantic and keyword legs and concurrent use.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.vector_kb import KEYWORD_ONLY_SIMILARITY
+
+QUERY = 'liquidity guidance'
+
+
+@pytest.fixture
+def hybrid_kb(vector_kb):
+    """Vectorized knowledge base with its full-text indexes created."""
+    assert vector_kb.create_fulltext_index()
+    return vector_kb
+
+
+def test_rrf_scores_add_reciprocal_ranks(hybrid_kb):
+    results = hybrid_kb.hybrid_search(QUERY, top_k=30, rrf_k=60)
+    
+    assert [result['score'] for result in results] == sorted((result['score'] for result in results), reverse=True)
+    for result in results:
+        expected = sum(1.0 / (60 + rank) for rank in (result['semantic_rank'], result['keyword_rank']) if rank)
+        assert result['score'] == pytest.approx(expected)
+    assert any(result['semantic_rank'] and result['keyword_rank'] for result in results)
+
+
+def test_keyword_only_hits_keep_numeric_similarity(hybrid_kb):
+    results = hybrid_kb.hybrid_search(QUERY, top_k=40)
+    keyword_only = [result for result in results if result['semantic_rank'] is None]
+    
+    assert keyword_only
+    for result in keyword_only:
+        assert result['similarity'] == KEYWORD_ONLY_SIMILARITY
+        assert result['section_title'] == 'Keyword Match'
+        assert result['keyword_rank'] is not None
+    assert all(isinstance(result['similarity'], float) for result in results)
+
+
+def test_semantic_leg_alone_keeps_semantic_order(hybrid_kb):
+    semantic = hybrid_kb.semantic_search(QUERY, top_k=5)
+    results = hybrid_kb.hybrid_search(QUERY, top_k=5, keyword_weight=0.0)
+    assert [result['id'] for result in results] == [result['id'] for result in semantic]
+
+
+def test_score_fusion_normalizes_each_leg(hybrid_kb):
+    results = hybrid_kb.hybrid_search(QUERY, top_k=30, fusion='score', semantic_weight=2.0)
+    assert all(0.0 <= result['score'] <= 3.0 + 1e-9 for result in results)
+    assert results[0]['score'] == max(result['score'] for result in results)
+    
+    with pytest.raises(ValueError):
+        hybrid_kb.hybrid_search(QUERY, fusion='max')
+
+
+def test_filters_apply_to_both_legs(hybrid_kb):
+    results = hybrid_kb.hybrid_search(QUERY, ticker='TNET', doc_types=['10-K', '10-Q'], top_k=20)
+    assert results
+    assert all(result['ticker'] == 'TNET' and result['doc_type'] in ('10-K', '10-Q') for result in results)
+
+
+@pytest.mark.parametrize('index', ['scan', 'hnsw'])
+def test_semantic_leg_index(hybrid_kb, index):
+    if index != 'scan':
+        hybrid_kb.build_index(index)
+    expected = hybrid_kb.hybrid_search(QUERY, top_k=8)
+    assert [result['doc_id'] for result in hybrid_kb.hybrid_search(QUERY, top_k=8, index=index)] == \
+        [result['doc_id'] for result in expected]
+
+
+def test_concurrent_searches_match_serial(hybrid_kb):
+    queries = ['revenue growth', 'payroll tax', QUERY, 'client retention', 'debt'] * 4
+    serial = [[(result['doc_id'], result['score']) for result in hybrid_kb.hybrid_search(query)]
+              for query in queries]
+    
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        concurrent = list(pool.map(hybrid_kb.hybrid_search, queries))
+    assert [[(result['doc_id'], result['score']) for result in results] for results in concurrent] == serial
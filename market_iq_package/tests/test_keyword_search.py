@@ -0,0 +1,109 @@
+"""
+Tests for BM25 keyword search over the FTS5 indexes and their migration.
+"""
+
+import sqlite3
+
+import pytest
+
+from src.vector_kb import VectorKnowledgeBase
+
+
+def has_fts5():
+    """Whether this SQLite build has the FTS5 extension."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+pytestmark = pytest.mark.skipif(not has_fts5(), reason='SQLite lacks FTS5')
+
+
+def insert_document(db_path, title, content, ticker='ADP', doc_type='10-K'):
+    """Insert a filing and return its id."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(
+        'INSERT INTO documents (ticker, doc_type, filing_date, title, content) VALUES (?, ?, ?, ?, ?)',
+        (ticker, doc_type, '2024-02-01', title, content)
+    )
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def keyword_kb(db_path):
+    """Knowledge base over the synthetic filings with its full-text indexes created."""
+    vector_kb = VectorKnowledgeBase(db_path, encoder='hashing')
+    assert vector_kb.create_fulltext_index()
+    return vector_kb
+
+
+def test_migration_is_seen_by_other_instances(db_path):
+    server = VectorKnowledgeBase(db_path, encoder='hashing')
+    assert not server.fts_enabled
+    assert server.keyword_search('liquidity', top_k=1)[0]['bm25'] is None
+    
+    assert VectorKnowledgeBase(db_path, encoder='hashing').create_fulltext_index()
+    results = VectorKnowledgeBase(db_path, encoder='hashing').keyword_search('liquidity', top_k=10)
+    assert len(results) == 10
+    assert [result['bm25'] for result in results] == sorted(result['bm25'] for result in results)
+    
+    # Instances started before the migration keep using LIKE until restarted
+    assert server.keyword_search('liquidity', top_k=1)[0]['bm25'] is None
+
+
+def test_bm25_prefers_frequent_terms_and_titles(keyword_kb):
+    filler = ' '.join(['quarterly'] * 200)
+    frequent = insert_document(keyword_kb.db_path, 'Annual report', 'zyxfund zyxfund zyxfund ' + filler)
+    rare = insert_document(keyword_kb.db_path, 'Annual report', 'zyxfund ' + filler)
+    titled = insert_document(keyword_kb.db_path, 'Zyxtitle overview', filler)
+    untitled = insert_document(keyword_kb.db_path, 'Annual report', 'zyxtitle overview ' + filler)
+    
+    assert [result['doc_id'] for result in keyword_kb.keyword_search('zyxfund')] == [frequent, rare]
+    assert [result['doc_id'] for result in keyword_kb.keyword_search('zyxtitle')] == [titled, untitled]
+
+
+def test_indexes_follow_updates_and_deletes(keyword_kb):
+    doc_id = insert_document(keyword_kb.db_path, 'Update', 'The zyxword appears here.')
+    assert [result['doc_id'] for result in keyword_kb.keyword_search('zyxword')] == [doc_id]
+    
+    conn = sqlite3.connect(keyword_kb.db_path)
+    conn.execute("UPDATE documents SET content = 'The zyxother appears here.' WHERE id = ?", (doc_id,))
+    conn.commit()
+    assert keyword_kb.keyword_search('zyxword') == []
+    assert [result['doc_id'] for result in keyword_kb.keyword_search('zyxother')] == [doc_id]
+    
+    conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+    conn.commit()
+    conn.close()
+    assert keyword_kb.keyword_search('zyxother') == []
+
+
+def test_query_operators_are_matched_literally(keyword_kb):
+    results = keyword_kb.keyword_search('revenue AND "growth OR (tax* NEAR', top_k=5)
+    assert len(results) == 5
+    assert keyword_kb.keyword_search('!! ()') == []
+
+
+def test_filters_and_section_scope(keyword_kb):
+    results = keyword_kb.keyword_search('liquidity', ticker='PAYX', doc_types=['10-K', '8-K'], top_k=50)
+    assert results
+    assert all(result['ticker'] == 'PAYX' and result['doc_type'] in ('10-K', '8-K') for result in results)
+    
+    conn = sqlite3.connect(keyword_kb.db_path)
+    conn.execute("INSERT INTO document_sections (document_id, section_title, section_content) "
+                 "VALUES (1, 'Outlook', 'Guidance mentions zyxsection twice: zyxsection.')")
+    conn.commit()
+    conn.close()
+    results = keyword_kb.keyword_search('zyxsection', scope='sections')
+    assert len(results) == 1 and results[0]['doc_id'] == 1 and results[0]['id'] is not None
+    assert results[0]['highlight'].count('<mark>') == 2
+    
+    with pytest.raises(ValueError):
+        keyword_kb.keyword_search('liquidity', scope='filings')
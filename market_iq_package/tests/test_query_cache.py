@@ -0,0 +1,53 @@
+"""
+Tests for the query embedding cache shared by the search methods.
+"""
+
+import numpy as np
+import pytest
+
+from src.vector_kb import QueryEmbeddingCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put('revenue', np.ones(4))
+    cache.put('debt', np.zeros(4))
+    assert cache.get('revenue') is not None
+    
+    cache.put('margin', np.ones(4))
+    assert cache.get('debt') is None
+    assert cache.get('revenue') is not None and cache.get('margin') is not None
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+
+
+def test_entries_expire_after_ttl():
+    expiring = QueryEmbeddingCache(ttl=0)
+    expiring.put('revenue', np.ones(4))
+    assert expiring.get('revenue') is None
+    assert expiring.stats()['size'] == 0
+    
+    lasting = QueryEmbeddingCache(ttl=None)
+    lasting.put('revenue', np.ones(4))
+    assert lasting.get('revenue') is not None
+
+
+def test_keys_ignore_case_and_whitespace():
+    cache = QueryEmbeddingCache()
+    stored = cache.put('  Revenue   Growth', [1, 2, 3])
+    assert cache.get('revenue growth') is stored
+    assert stored.dtype == np.float32
+    with pytest.raises(ValueError):
+        stored[0] = 0.0
+
+
+def test_searches_share_cached_embeddings(vector_kb, monkeypatch):
+    encoded = []
+    encode = vector_kb.encoder.encode
+    monkeypatch.setattr(vector_kb.encoder, 'encode', lambda texts, **kwargs: encoded.append(texts) or
+                        encode(texts, **kwargs))
+    
+    first = vector_kb.semantic_search('Liquidity risk', top_k=3)
+    assert vector_kb.semantic_search('liquidity  RISK', top_k=3) == first
+    vector_kb.hybrid_search('liquidity risk', top_k=3)
+    vector_kb.semantic_search_many(['liquidity risk', 'payroll'], top_k=3)
+    assert encoded == ['Liquidity risk', ['payroll']]
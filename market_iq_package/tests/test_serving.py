@@ -0,0 +1,104 @@
+"""
+Tests for serving from web workers: the pre-fork preload and the lazy, warmed-up encoder.
+"""
+
+import gc
+import json
+import os
+import threading
+
+import pytest
+
+from src.encoders import HashingEncoder
+from src.vector_kb import VectorKnowledgeBase
+
+
+class GatedEncoder(HashingEncoder):
+    """Hashing encoder whose encode() waits for a gate and counts its calls."""
+    
+    def __init__(self, fail=False):
+        super().__init__()
+        self.gate = threading.Event()
+        self.fail = fail
+        self.calls = 0
+    
+    def encode(self, texts, batch_size=32):
+        self.calls += 1
+        self.gate.wait(10)
+        if self.fail:
+            raise RuntimeError('model unavailable')
+        return super().encode(texts, batch_size=batch_size)
+
+
+@pytest.fixture
+def unfreeze():
+    """Return objects frozen by preload() to the garbage collector afterwards."""
+    yield
+    gc.unfreeze()
+
+
+def test_preload_loads_index_and_freezes_heap(vector_kb, unfreeze):
+    vector_kb.preload()
+    assert vector_kb._doc_index is not None and len(vector_kb._doc_index) > 0
+    assert gc.get_freeze_count() > 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_worker_searches_preloaded_index(vector_kb, unfreeze):
+    vector_kb.preload()
+    expected = [result['id'] for result in vector_kb.semantic_search('liquidity risk', top_k=5)]
+    parent_lock = id(vector_kb._index_lock)
+    
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            # Loading the embeddings again would give the worker a private copy
+            vector_kb._load_document_rows = None
+            results = vector_kb.semantic_search('liquidity risk', top_k=5)
+            os.write(write_fd, json.dumps({'ids': [result['id'] for result in results],
+                                           'lock': id(vector_kb._index_lock)}).encode())
+            status = 0
+        finally:
+            os._exit(status)
+    
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        output = pipe.read()
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    
+    child = json.loads(output)
+    assert child['ids'] == expected
+    assert child['lock'] != parent_lock
+
+
+def test_transformer_is_not_loaded_by_constructor(db_path):
+    vector_kb = VectorKnowledgeBase(db_path)
+    assert vector_kb.encoder._model is None
+    assert not vector_kb.is_ready
+
+
+def test_background_warm_up_sets_readiness(db_path):
+    encoder = GatedEncoder()
+    vector_kb = VectorKnowledgeBase(db_path, encoder=encoder)
+    
+    thread = vector_kb.warm_up()
+    assert vector_kb.warm_up() is thread
+    assert not vector_kb.is_ready
+    
+    encoder.gate.set()
+    thread.join()
+    assert vector_kb.is_ready
+    assert encoder.calls == 1
+
+
+def test_failed_warm_up_stays_not_ready(db_path):
+    encoder = GatedEncoder(fail=True)
+    encoder.gate.set()
+    vector_kb = VectorKnowledgeBase(db_path, encoder=encoder)
+    
+    assert vector_kb.warm_up(background=False) is None
+    assert not vector_kb.is_ready
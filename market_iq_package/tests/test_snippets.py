@@ -0,0 +1,74 @@
+"""
+Tests for the snippet and highlight engine.
+"""
+
+from src.snippets import TermMatcher, generate_snippet, highlight, parse_marked, query_terms
+from src.vector_kb import VectorKnowledgeBase
+
+
+def highlighted_words(snippet):
+    """Text of every highlighted range of a snippet or search result, lowercased."""
+    text = snippet.get('text', snippet.get('snippet'))
+    return [text[start:end].lower() for start, end in snippet['highlights']]
+
+
+def test_query_terms_put_phrase_first():
+    assert query_terms('Revenue growth') == ['revenue growth', 'revenue', 'growth']
+    assert query_terms('Tax') == ['tax']
+    assert query_terms('a !!') == []
+
+
+def test_matcher_respects_word_starts():
+    matcher = TermMatcher(['tax', 'ax'])
+    matches = matcher.find('Syntax: Taxes and TAX credits')
+    assert [(start, end) for start, end, _ in matches] == [(8, 11), (18, 21)]
+
+
+def test_highlight_offsets_point_at_terms():
+    text = ('The company discussed many topics. ' * 10 + 'Payroll revenue rose while payroll costs fell. '
+            + 'Unrelated closing remarks follow here. ' * 10)
+    snippet = generate_snippet(text, 'payroll revenue', max_length=120)
+    
+    assert len(snippet['text']) <= 120 + 6
+    assert snippet['text'].startswith('...') and snippet['text'].endswith('...')
+    assert highlighted_words(snippet) == ['payroll revenue', 'payroll']
+    assert highlight(snippet, ('[', ']')).count('[') == 2
+
+
+def test_snippet_prefers_window_with_most_terms():
+    text = 'margin ' + 'filler ' * 60 + 'cash and debt grew while cash fell ' + 'filler ' * 60
+    snippet = generate_snippet(text, 'cash debt', max_length=60)
+    assert set(highlighted_words(snippet)) == {'cash', 'debt'}
+
+
+def test_snippet_without_matches_starts_at_text():
+    snippet = generate_snippet('short text without the term', 'liquidity')
+    assert snippet == {'text': 'short text without the term', 'highlights': []}
+
+
+def test_parse_marked_round_trips_with_highlight():
+    parsed = parse_marked('...the \x02revenue\x03 and \x02growth\x03 rose', ('\x02', '\x03'))
+    assert parsed['text'] == '...the revenue and growth rose'
+    assert highlighted_words(parsed) == ['revenue', 'growth']
+    assert highlight(parsed, ('\x02', '\x03')) == '...the \x02revenue\x03 and \x02growth\x03 rose'
+
+
+def test_like_search_highlights_sections(vector_kb):
+    vector_kb.fts_enabled = False
+    results = vector_kb.keyword_search('liquidity', top_k=3)
+    
+    assert len(results) == 3
+    for result in results:
+        assert result['id'] is not None
+        assert 'liquidity' in highlighted_words(result)
+        assert result['highlight'].count('<mark>') == len(result['highlights'])
+
+
+def test_like_search_reads_filings_before_vectorization(db_path):
+    vector_kb = VectorKnowledgeBase(db_path, encoder='hashing')
+    assert not vector_kb.fts_enabled
+    results = vector_kb.keyword_search('liquidity', ticker='PAYX', top_k=4)
+    
+    assert len(results) == 4
+    assert all(result['ticker'] == 'PAYX' and result['id'] is None for result in results)
+    assert all('liquidity' in highlighted_words(result) for result in results)
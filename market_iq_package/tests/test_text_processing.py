@@ -0,0 +1,68 @@
+"""
+Tests for the streaming, token-budgeted section splitter.
+"""
+
+import random
+import types
+
+from src.text_processing import approximate_token_spans, iter_paragraphs, split_sections
+
+from conftest import make_filing
+
+
+def tokens(text):
+    """Tokens of a text, as strings."""
+    return [text[start:end] for start, end in approximate_token_spans(text)]
+
+
+def test_sections_fit_the_budget_and_keep_every_paragraph():
+    content = make_filing(random.Random(3), paragraphs=12)
+    sections = split_sections(content, 'Annual report', max_tokens=150, overlap_tokens=10)
+    assert isinstance(sections, types.GeneratorType)
+    sections = list(sections)
+    
+    assert len(sections) > 4
+    assert all(len(tokens(section['content'])) <= 150 for section in sections)
+    covered = ' '.join(section['content'] for section in sections)
+    assert all(paragraph in covered for paragraph in iter_paragraphs(content)
+               if not paragraph.isupper() and not paragraph.endswith(':'))
+
+
+def test_headings_start_sections():
+    content = 'Intro text here.\n\nRISK FACTORS\n\nRisks are many.\n\nResults of operations:\n\nRevenue grew.'
+    sections = list(split_sections(content, 'Filing'))
+    assert sections == [
+        {'title': 'Filing', 'content': 'Intro text here.'},
+        {'title': 'RISK FACTORS', 'content': 'Risks are many.'},
+        {'title': 'Results of operations:', 'content': 'Revenue grew.'},
+    ]
+
+
+def test_continued_sections_repeat_the_overlap():
+    paragraphs = [' '.join(f'w{number}x{word}' for word in range(8)) for number in range(6)]
+    sections = list(split_sections('\n\n'.join(paragraphs), 'Filing', max_tokens=20, overlap_tokens=4))
+    
+    assert len(sections) > 2
+    assert [section['title'] for section in sections[1:]] == ['Filing (continued)'] * (len(sections) - 1)
+    for previous, section in zip(sections, sections[1:]):
+        assert tokens(section['content'])[:4] == tokens(previous['content'])[-4:]
+
+
+def test_long_paragraph_is_cut_into_overlapping_windows():
+    words = [f'word{number}' for number in range(100)]
+    sections = list(split_sections(' '.join(words), 'Filing', max_tokens=30, overlap_tokens=5))
+    
+    windows = [tokens(section['content']) for section in sections]
+    assert all(len(window) <= 30 for window in windows)
+    assert windows[0][0] == 'word0' and windows[-1][-1] == 'word99'
+    for previous, window in zip(windows, windows[1:]):
+        assert window[:5] == previous[-5:]
+
+
+def test_chunked_input_matches_whole_text():
+    content = make_filing(random.Random(8), paragraphs=9)
+    chunks = [content[offset:offset + 37] for offset in range(0, len(content), 37)]
+    
+    assert list(iter_paragraphs(chunks)) == list(iter_paragraphs(content))
+    assert list(split_sections(iter(chunks), 'Filing', max_tokens=40)) == \
+        list(split_sections(content, 'Filing', max_tokens=40))
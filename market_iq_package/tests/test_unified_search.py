@@ -0,0 +1,79 @@
+"""
+Tests for unified search across document, company and metric embeddings.
+"""
+
+import sqlite3
+
+import pytest
+
+from conftest import TICKERS
+
+QUERY = 'revenue growth'
+
+
+@pytest.fixture
+def unified_kb(vector_kb):
+    """Vectorized knowledge base with company overviews and metrics embedded as well."""
+    conn = sqlite3.connect(vector_kb.db_path)
+    conn.execute('CREATE TABLE metrics (ticker TEXT, metric_name TEXT, period TEXT, value TEXT)')
+    conn.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?)', [
+        (ticker, metric_name, period, f'{value}%')
+        for number, ticker in enumerate(TICKERS)
+        for value, (metric_name, period) in enumerate([('revenue growth', '2023'), ('revenue growth', '2024'),
+                                                       ('operating margin', '2024'), ('client retention', '2024')],
+                                                      start=number)
+    ])
+    conn.commit()
+    conn.close()
+    vector_kb.vectorize_company_info()
+    return vector_kb
+
+
+def keys(results):
+    """(type, id, rounded similarity) of each result, in order."""
+    return [(result['type'], result['id'], round(result['similarity'], 5)) for result in results]
+
+
+def test_merges_collections_by_similarity(unified_kb):
+    expected = []
+    for collection, results in (('document', unified_kb.semantic_search(QUERY, top_k=20)),
+                                ('company', unified_kb.company_semantic_search(QUERY, top_k=20)),
+                                ('metric', unified_kb.metric_semantic_search(QUERY, top_k=20))):
+        expected.extend(dict(result, type=collection) for result in results)
+    expected.sort(key=lambda result: result['similarity'], reverse=True)
+    
+    results = unified_kb.unified_search(QUERY, top_k=20)
+    assert keys(results) == keys(expected[:20])
+    assert {result['type'] for result in results} >= {'document', 'metric'}
+    assert all(result['score'] == result['similarity'] for result in results)
+
+
+def test_query_is_encoded_once(unified_kb, monkeypatch):
+    calls = []
+    encode = unified_kb.encoder.encode
+    monkeypatch.setattr(unified_kb.encoder, 'encode', lambda texts, **kwargs: calls.append(texts) or
+                        encode(texts, **kwargs))
+    unified_kb.unified_search('client retention pricing')
+    assert calls == ['client retention pricing']
+
+
+def test_weights_and_quotas(unified_kb):
+    results = unified_kb.unified_search(QUERY, top_k=10, weights={'document': 0, 'company': 2.0})
+    assert results and all(result['type'] != 'document' for result in results)
+    assert all(result['score'] == pytest.approx(2.0 * result['similarity'])
+               for result in results if result['type'] == 'company')
+    
+    results = unified_kb.unified_search(QUERY, top_k=200, quotas={'metric': 2, 'company': 1})
+    counts = {collection: sum(result['type'] == collection for result in results)
+              for collection in ('document', 'company', 'metric')}
+    assert counts == {'document': 120, 'company': 1, 'metric': 2}
+    
+    with pytest.raises(ValueError):
+        unified_kb.unified_search(QUERY, weights={'filing': 1.0})
+
+
+def test_ticker_filters_every_collection(unified_kb):
+    results = unified_kb.unified_search(QUERY, top_k=30, ticker='TNET', doc_types=['10-K'])
+    assert {result['type'] for result in results} == {'document', 'company', 'metric'}
+    assert all(result['ticker'] == 'TNET' for result in results)
+    assert all(result['doc_type'] == '10-K' for result in results if result['type'] == 'document')
@@ -0,0 +1,281 @@
+"""
+Tests for the vector index structures: exactness or recall against a brute-force scan,
+save/load round trips and sharding.
+"""
+
+import numpy as np
+import pytest
+
+from src.vector_index import (
+    INDEX_TYPES, FlatIndex, IVFIndex, PQIndex, HNSWIndex, RunningTopK, ScalarQuantizedIndex, ShardedIndex,
+    load_index, merge_top_k, save_index_arrays
+)
+
+
+def brute_force(labels, vectors, query, top_k):
+    """Exact top-k labels and scores by cosine similarity."""
+    scores = vectors @ (query / np.linalg.norm(query))
+    best = np.argsort(-scores, kind='stable')[:top_k]
+    return labels[best], scores[best]
+
+
+def recall(index, labels, vectors, queries, top_k=10, **search_params):
+    """Mean fraction of the exact top-k that an index returns."""
+    found = 0
+    for query in queries:
+        expected, _ = brute_force(labels, vectors, query, top_k)
+        result, _ = index.search(query, top_k, **search_params)
+        found += len(np.intersect1d(expected, result))
+    return found / (top_k * len(queries))
+
+
+def build(kind, labels, vectors, **params):
+    """Build an approximate index of a kind over the given vectors."""
+    index = INDEX_TYPES[kind](vectors.shape[1], **params)
+    index.add(labels, vectors)
+    return index
+
+
+def test_flat_index_is_exact(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    index = FlatIndex(vectors.shape[1])
+    index.add(labels, vectors)
+    
+    for query in queries:
+        expected_labels, expected_scores = brute_force(labels, vectors, query, 10)
+        result_labels, result_scores = index.search(query, 10)
+        assert np.array_equal(result_labels, expected_labels)
+        assert np.allclose(result_scores, expected_scores, atol=1e-5)
+    
+    batch_labels, _ = index.search_batch(queries, 10)
+    for query, result_labels in zip(queries, batch_labels):
+        assert np.array_equal(result_labels, brute_force(labels, vectors, query, 10)[0])
+
+
+def test_flat_index_row_filter(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    index = FlatIndex(vectors.shape[1])
+    index.add(labels, vectors)
+    
+    # Selective and broad filters take different code paths
+    for rows in (np.arange(0, len(labels), 50), np.arange(0, len(labels), 2)):
+        result_labels, _ = index.search(queries[0], 10, rows=rows)
+        assert np.array_equal(result_labels, brute_force(labels[rows], vectors[rows], queries[0], 10)[0])
+
+
+@pytest.mark.parametrize('codec', ['int8', 'float16'])
+def test_scalar_quantized_recall(clustered_vectors, codec):
+    labels, vectors, queries = clustered_vectors
+    index = ScalarQuantizedIndex(vectors.shape[1], codec=codec)
+    index.add(labels, vectors)
+    assert recall(index, labels, vectors, queries) >= 0.9
+
+
+@pytest.mark.parametrize('min_train_rows', [1, 4096])
+@pytest.mark.parametrize('first_batch', [1, 20])
+def test_scalar_quantized_recall_after_small_first_batch(clustered_vectors, first_batch, min_train_rows):
+    labels, vectors, queries = clustered_vectors
+    index = ScalarQuantizedIndex(vectors.shape[1], min_train_rows=min_train_rows)
+    index.add(labels[:first_batch], vectors[:first_batch])
+    before = index.view(0, first_batch)
+    for start in range(first_batch, len(labels), 300):
+        index.add(labels[start:start + 300], vectors[start:start + 300])
+    
+    assert recall(index, labels, vectors, queries) >= 0.9
+    assert np.allclose(index.reconstruct(), vectors, atol=0.05)
+    # Views taken before the range was retrained keep decoding their own codes
+    assert np.allclose(before.reconstruct(), vectors[:first_batch], atol=0.05)
+
+
+def test_hnsw_recall(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    index = build('hnsw', labels, vectors, M=8, ef_construction=64)
+    assert recall(index, labels, vectors, queries, ef_search=64) >= 0.9
+
+
+def test_ivf_is_exact_when_probing_every_list(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    index = build('ivf', labels, vectors, nlist=16)
+    
+    for query in queries:
+        expected_labels, expected_scores = brute_force(labels, vectors, query, 10)
+        result_labels, result_scores = index.search(query, 10, nprobe=16)
+        assert np.array_equal(result_labels, expected_labels)
+        assert np.allclose(result_scores, expected_scores, atol=1e-5)
+    
+    assert recall(index, labels, vectors, queries, nprobe=4) >= 0.8
+
+
+def test_pq_recall_with_candidates(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    index = build('pq', labels, vectors, m=8)
+    
+    # PQ scores are approximate; the exact top 10 should be among its top 100
+    found = 0
+    for query in queries:
+        expected, _ = brute_force(labels, vectors, query, 10)
+        found += len(np.intersect1d(expected, index.search(query, 100)[0]))
+    assert found / (10 * len(queries)) >= 0.9
+
+
+@pytest.mark.parametrize('kind', sorted(INDEX_TYPES))
+def test_removed_labels_are_not_returned(clustered_vectors, kind):
+    labels, vectors, queries = clustered_vectors
+    index = build(kind, labels, vectors)
+    removed = labels[::3]
+    index.remove(removed)
+    
+    result_labels, _ = index.search(queries[0], 50)
+    assert len(result_labels) == 50
+    assert not np.isin(result_labels, removed).any()
+
+
+def test_hnsw_compact_drops_tombstones(clustered_vectors, tmp_path):
+    labels, vectors, queries = clustered_vectors
+    index = build('hnsw', labels, vectors, M=8, ef_construction=64)
+    original = index.copy()
+    before = original.search(queries[0], 10)[0]
+    
+    # Updated rows are tombstoned and re-inserted as new nodes
+    index.remove(labels[::3])
+    index.add(labels[::3][:50], vectors[::3][:50])
+    index.remove(labels[1::3][:100])
+    index.compact()
+    
+    kept = np.setdiff1d(labels, np.concatenate([labels[::3][50:], labels[1::3][:100]]))
+    assert index.tombstones == 0 and len(index) == len(kept)
+    assert np.array_equal(np.sort(index.labels), kept)
+    live = np.isin(labels, index.labels)
+    assert recall(index, labels[live], vectors[live], queries, ef_search=64) >= 0.9
+    assert np.array_equal(original.search(queries[0], 10)[0], before)
+    
+    path = str(tmp_path / 'hnsw.npz')
+    index.save(path)
+    assert np.array_equal(load_index(path).search(queries[1], 10)[0], index.search(queries[1], 10)[0])
+    
+    index.remove(index.labels)
+    index.compact()
+    assert len(index) == 0 and index.search(queries[0], 10)[0].size == 0
+
+
+@pytest.mark.parametrize('kind', sorted(INDEX_TYPES))
+def test_save_load_round_trip(clustered_vectors, tmp_path, kind):
+    labels, vectors, queries = clustered_vectors
+    index = build(kind, labels, vectors)
+    index.remove(labels[:5])
+    index.last_change, index.generation, index.model = 12, 3, 'hashing:384'
+    path = str(tmp_path / f'{kind}.npz')
+    index.save(path)
+    
+    loaded = load_index(path)
+    assert isinstance(loaded, INDEX_TYPES[kind])
+    assert loaded.params == index.params
+    assert (loaded.max_label, loaded.last_change, loaded.generation, loaded.model) == (
+        index.max_label, 12, 3, 'hashing:384'
+    )
+    for query in queries:
+        expected_labels, expected_scores = index.search(query, 10)
+        result_labels, result_scores = loaded.search(query, 10)
+        assert np.array_equal(result_labels, expected_labels)
+        assert np.allclose(result_scores, expected_scores)
+    
+    # A loaded index keeps accepting rows
+    loaded.add(labels[:5], vectors[:5])
+    assert labels[0] in loaded.search(vectors[0], 5)[0]
+
+
+def test_load_rejects_unknown_kind(tmp_path):
+    path = str(tmp_path / 'unknown.npz')
+    save_index_arrays(path, {'kind': 'lsh'})
+    with pytest.raises(ValueError):
+        load_index(path)
+
+
+def test_copy_leaves_original_unchanged(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    for kind in (HNSWIndex, IVFIndex, PQIndex):
+        index = kind(vectors.shape[1])
+        index.add(labels[:500], vectors[:500])
+        before = index.search(queries[0], 10)[0]
+        
+        updated = index.copy()
+        updated.remove(before[:3])
+        updated.add(labels[500:], vectors[500:])
+        assert np.array_equal(index.search(queries[0], 10)[0], before)
+        assert not np.isin(updated.search(queries[0], 10)[0], before[:3]).any()
+
+
+@pytest.mark.parametrize('storage', ['float32', 'int8'])
+def test_sharded_index_matches_unsharded(clustered_vectors, storage):
+    labels, vectors, queries = clustered_vectors
+    keys = np.sort(np.random.default_rng(0).integers(0, 7, size=len(labels)))
+    index = FlatIndex(vectors.shape[1]) if storage == 'float32' else ScalarQuantizedIndex(vectors.shape[1])
+    index.add(labels, vectors)
+    sharded = ShardedIndex(index, keys, shard_size=120)
+    
+    assert len(sharded) == len(index)
+    assert len(sharded.shards) > 7
+    for query in queries:
+        expected_labels, expected_scores = index.search(query, 10)
+        result_labels, result_scores = sharded.search(query, 10)
+        assert np.array_equal(result_labels, expected_labels)
+        assert np.allclose(result_scores, expected_scores, atol=1e-5)
+        
+        rows = np.flatnonzero(keys == 3)
+        assert np.array_equal(sharded.search(query, 10, rows=rows)[0], index.search(query, 10, rows=rows)[0])
+
+
+def test_sharded_index_extended_with_appended_rows(clustered_vectors):
+    labels, vectors, queries = clustered_vectors
+    keys = np.sort(np.random.default_rng(1).integers(0, 5, size=len(labels)))
+    index = FlatIndex(vectors.shape[1])
+    index.add(labels[:800], vectors[:800])
+    sharded = ShardedIndex(index, keys[:800], shard_size=100)
+    
+    extended_index = FlatIndex.wrap(index.labels, index.vectors)
+    extended_index.add(labels[800:], vectors[800:])
+    extended = sharded.extended(extended_index, keys[800:])
+    
+    for query in queries:
+        assert np.array_equal(extended.search(query, 10)[0], extended_index.search(query, 10)[0])
+    # The original shards still cover only the original rows
+    assert len(sharded) == 800
+
+
+def test_flat_index_keeps_memory_map_on_append(clustered_vectors, tmp_path):
+    labels, vectors, queries = clustered_vectors
+    path = str(tmp_path / 'vectors.f32')
+    vectors[:600].tofile(path)
+    mapped = np.memmap(path, dtype=np.float32, mode='r', shape=(600, vectors.shape[1]))
+    
+    index = FlatIndex.wrap(labels[:600], mapped)
+    index.add(labels[600:], vectors[600:])
+    reference = FlatIndex(vectors.shape[1])
+    reference.add(labels, vectors)
+    
+    assert index._data[0] is mapped
+    rows = np.array([3, 599, 600, 999])
+    assert np.allclose(index.reconstruct(rows), vectors[rows], atol=1e-6)
+    assert np.allclose(index.view(550, 650).reconstruct(), vectors[550:650], atol=1e-6)
+    for query in queries:
+        assert np.array_equal(index.search(query, 10)[0], reference.search(query, 10)[0])
+        assert np.array_equal(index.search(query, 5, rows=rows)[0], reference.search(query, 5, rows=rows)[0])
+    assert np.array_equal(index.search_batch(queries, 10)[0], reference.search_batch(queries, 10)[0])
+
+
+def test_merge_and_running_top_k_match_full_sort():
+    rng = np.random.default_rng(3)
+    scores = rng.normal(size=1000).astype(np.float32)
+    labels = np.arange(1000, dtype=np.int64)
+    expected = labels[np.argsort(-scores)[:20]]
+    
+    parts = []
+    running = RunningTopK(20)
+    for start in range(0, 1000, 128):
+        block_labels, block_scores = labels[start:start + 128], scores[start:start + 128]
+        order = np.argsort(-block_scores)
+        parts.append((block_labels[order], block_scores[order]))
+        running.push(block_labels, block_scores)
+    
+    assert np.array_equal(merge_top_k(parts, 20)[0], expected)
+    assert np.array_equal(running.result()[0], expected)
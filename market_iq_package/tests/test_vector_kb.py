@@ -0,0 +1,359 @@
+"""
+Tests for semantic search in VectorKnowledgeBase: filtered results, approximate indexes,
+sharding and the vector store all agree with an exact scan of the embeddings.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from src.vector_index import load_index
+from src.vector_kb import VectorKnowledgeBase
+
+from conftest import TICKERS, add_documents
+
+QUERIES = ['revenue growth and margin', 'liquidity risk and debt', 'payroll client retention pricing']
+
+
+def ranking(results):
+    """Section ids and rounded similarities of search results, in order."""
+    return [(result['id'], round(result['similarity'], 5)) for result in results]
+
+
+def count_sections(db_path, ticker=None, doc_types=None):
+    """Number of embedded document sections matching the filters."""
+    sql = 'SELECT COUNT(*) FROM document_embeddings e JOIN documents d ON d.id = e.doc_id WHERE 1 = 1'
+    params = []
+    if ticker:
+        sql += ' AND d.ticker = ?'
+        params.append(ticker)
+    if doc_types:
+        sql += f" AND d.doc_type IN ({', '.join('?' * len(doc_types))})"
+        params.extend(doc_types)
+    conn = sqlite3.connect(db_path)
+    count = conn.execute(sql, params).fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_flat_search_matches_brute_force(vector_kb):
+    conn = sqlite3.connect(vector_kb.db_path)
+    rows = conn.execute('SELECT id, embedding FROM document_embeddings').fetchall()
+    conn.close()
+    ids = np.array([row[0] for row in rows])
+    vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    for query in QUERIES:
+        embedding = vector_kb.encoder.encode(query)
+        scores = vectors @ (embedding / np.linalg.norm(embedding))
+        expected = ids[np.argsort(-scores, kind='stable')[:8]]
+        assert [result['id'] for result in vector_kb.semantic_search(query, top_k=8)] == expected.tolist()
+
+
+@pytest.mark.parametrize('index', ['flat', 'scan', 'hnsw', 'ivf', 'pq'])
+@pytest.mark.parametrize('filters', [
+    {'ticker': 'PAYX'}, {'doc_types': ['8-K']}, {'ticker': 'ADP', 'doc_types': ['10-Q']}
+])
+def test_filtered_search_returns_top_k(vector_kb, index, filters):
+    if index not in ('flat', 'scan'):
+        vector_kb.build_index(index)
+    available = count_sections(vector_kb.db_path, **filters)
+    assert available > 0
+    
+    for top_k in (5, available + 5):
+        results = vector_kb.semantic_search(QUERIES[0], top_k=top_k, index=index, **filters)
+        assert len(results) == min(top_k, available)
+        assert len({result['id'] for result in results}) == len(results)
+        if 'ticker' in filters:
+            assert all(result['ticker'] == filters['ticker'] for result in results)
+        if 'doc_types' in filters:
+            assert all(result['doc_type'] in filters['doc_types'] for result in results)
+
+
+def test_filtered_exact_search_matches_unfiltered_ranking(vector_kb):
+    everything = vector_kb.semantic_search(QUERIES[1], top_k=count_sections(vector_kb.db_path))
+    for ticker in TICKERS:
+        expected = [result for result in everything if result['ticker'] == ticker][:6]
+        assert ranking(vector_kb.semantic_search(QUERIES[1], top_k=6, ticker=ticker)) == ranking(expected)
+
+
+@pytest.mark.parametrize('kind', ['hnsw', 'ivf', 'pq'])
+def test_approximate_index_covers_rows_added_after_build(vector_kb, kind):
+    params = {'nlist': 4, 'nprobe': 4} if kind == 'ivf' else {}
+    vector_kb.build_index(kind, **params)
+    add_documents(vector_kb.db_path, 8, seed=1)
+    vector_kb.vectorize_documents()
+    
+    flat = vector_kb.semantic_search(QUERIES[2], top_k=5)
+    search_params = {'rerank': 20} if kind == 'pq' else {}
+    approximate = vector_kb.semantic_search(QUERIES[2], top_k=5, index=kind, **search_params)
+    thread = vector_kb._refresh_threads.get(kind)
+    if thread is not None:
+        thread.join()
+    assert ranking(approximate) == ranking(flat)
+    assert len(vector_kb.indexes[kind]) == count_sections(vector_kb.db_path)
+
+
+def embedding_ids(db_path):
+    """Ids of the document embedding rows, ascending."""
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute('SELECT id FROM document_embeddings ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def touch_embeddings(db_path, ids):
+    """Rewrite embedding rows in place, logging them as changed."""
+    conn = sqlite3.connect(db_path)
+    conn.executemany('UPDATE document_embeddings SET embedding = embedding WHERE id = ?', [(id,) for id in ids])
+    conn.commit()
+    conn.close()
+
+
+def change_log_size(db_path):
+    """Number of rows in the embedding change log."""
+    conn = sqlite3.connect(db_path)
+    count = conn.execute('SELECT COUNT(*) FROM embedding_changes').fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_change_log_kept_for_indexes_of_other_processes(vector_kb):
+    other = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing')
+    vector_kb.build_index('hnsw')
+    other.build_index('hnsw')
+    ids = embedding_ids(vector_kb.db_path)[:5]
+    touch_embeddings(vector_kb.db_path, ids)
+    
+    vector_kb.refresh_index('hnsw')
+    conn = sqlite3.connect(vector_kb.db_path)
+    changed = other._get_index_changes(conn.cursor(), other.indexes['hnsw'])
+    conn.close()
+    assert changed is not None and sorted(changed.tolist()) == sorted(ids)
+    
+    other.refresh_index('hnsw')
+    assert change_log_size(vector_kb.db_path) == 0
+
+
+def test_change_log_pruned_without_indexes(vector_kb):
+    conn = sqlite3.connect(vector_kb.db_path)
+    conn.execute("UPDATE documents SET content = content || ' Revised outlook.' WHERE id <= 3")
+    conn.commit()
+    conn.close()
+    
+    assert vector_kb.vectorize_documents()['updated']
+    assert change_log_size(vector_kb.db_path) == 0
+    
+    # A consumer that stopped catching up is forgotten after the retention period
+    vector_kb.build_index('hnsw')
+    touch_embeddings(vector_kb.db_path, embedding_ids(vector_kb.db_path)[:3])
+    vector_kb.change_log_retention = -1
+    vector_kb.vectorize_documents()
+    assert change_log_size(vector_kb.db_path) == 0
+
+
+def test_pending_rows_read_once_per_change(vector_kb, monkeypatch):
+    vector_kb.build_index('hnsw')
+    calls = []
+    get_index_changes = vector_kb._get_index_changes
+    monkeypatch.setattr(vector_kb, '_get_index_changes', lambda *args: calls.append(1) or get_index_changes(*args))
+    
+    for query in QUERIES * 3:
+        vector_kb.semantic_search(query, index='hnsw')
+    assert len(calls) == 1
+    
+    # New rows, then the refreshed index, each need one more read
+    add_documents(vector_kb.db_path, 2, seed=6)
+    vector_kb.vectorize_documents()
+    vector_kb.semantic_search(QUERIES[0], index='hnsw')
+    vector_kb._refresh_threads['hnsw'].join()
+    refreshed = len(calls)
+    for query in QUERIES * 3:
+        vector_kb.semantic_search(query, index='hnsw')
+    assert len(calls) == refreshed + 1
+
+
+def test_refresh_compacts_hnsw_tombstones(vector_kb):
+    vector_kb.build_index('hnsw')
+    labels = embedding_ids(vector_kb.db_path)
+    for round in range(3):
+        touch_embeddings(vector_kb.db_path, labels[round::3])
+        vector_kb.semantic_search(QUERIES[0])
+        vector_kb.refresh_index('hnsw')
+        index = vector_kb.indexes['hnsw']
+        assert index.tombstones <= 0.2 * len(index)
+        assert len(index.labels) < 1.5 * len(labels)
+    
+    for query in QUERIES:
+        assert ranking(vector_kb.semantic_search(query, top_k=5, index='hnsw')) == \
+            ranking(vector_kb.semantic_search(query, top_k=5))
+
+
+@pytest.mark.parametrize('kind', ['hnsw', 'ivf'])
+def test_approximate_search_leaves_matrix_unloaded(vector_kb, kind):
+    searcher = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing')
+    searcher.build_index(kind, **({'nlist': 4, 'nprobe': 4} if kind == 'ivf' else {}))
+    add_documents(vector_kb.db_path, 4, seed=7)
+    vector_kb.vectorize_documents()
+    touch_embeddings(vector_kb.db_path, embedding_ids(vector_kb.db_path)[:4])
+    
+    for query in QUERIES:
+        for filters in ({}, {'ticker': 'PAYX'}, {'doc_types': ['10-K', '8-K']}):
+            expected = ranking(vector_kb.semantic_search(query, top_k=5, **filters))
+            assert ranking(searcher.semantic_search(query, top_k=5, index=kind, **filters)) == expected
+            assert ranking(searcher.semantic_search(query, top_k=5, index=kind, rerank=4, **filters)) == expected
+    searcher._refresh_threads[kind].join()
+    assert searcher._doc_index is None
+    assert len(searcher.indexes[kind]) == count_sections(vector_kb.db_path)
+
+
+def test_rerank_is_opt_in(vector_kb, monkeypatch):
+    vector_kb.build_index('pq')
+    calls = []
+    rescore = vector_kb._rescore
+    monkeypatch.setattr(vector_kb, '_rescore', lambda *args: calls.append(1) or rescore(*args))
+    
+    assert len(vector_kb.semantic_search(QUERIES[0], top_k=5, index='pq')) == 5
+    assert not calls
+    reranked = vector_kb.semantic_search(QUERIES[0], top_k=5, index='pq', rerank=24)
+    assert calls and ranking(reranked) == ranking(vector_kb.semantic_search(QUERIES[0], top_k=5))
+
+
+@pytest.mark.parametrize('kind', ['hnsw', 'ivf', 'pq'])
+def test_index_save_load_round_trip(vector_kb, tmp_path, kind):
+    path = str(tmp_path / f'{kind}.npz')
+    vector_kb.build_index(kind, path=path)
+    expected = [ranking(vector_kb.semantic_search(query, top_k=5, index=kind)) for query in QUERIES]
+    
+    reloaded = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing')
+    index = reloaded.load_index(path)
+    assert index.generation == reloaded.generation
+    assert [ranking(reloaded.semantic_search(query, top_k=5, index=kind)) for query in QUERIES] == expected
+
+
+def test_load_index_rebuilds_other_generation(vector_kb, tmp_path):
+    path = str(tmp_path / 'hnsw.npz')
+    index = vector_kb.build_index('hnsw', path=path)
+    index.generation = vector_kb.generation + 1
+    index.save(path)
+    
+    loaded = vector_kb.load_index(path)
+    assert loaded is not index
+    assert loaded.generation == vector_kb.generation
+    assert load_index(path).generation == vector_kb.generation
+
+
+@pytest.mark.parametrize('shard_by', ['ticker', 'year'])
+@pytest.mark.parametrize('storage', ['float32', 'int8'])
+def test_sharded_search_matches_unsharded(vector_kb, shard_by, storage):
+    unsharded = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', storage=storage)
+    sharded = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', storage=storage, shard_by=shard_by,
+                                  shard_size=20)
+    
+    def compare():
+        for query in QUERIES:
+            for filters in ({}, {'ticker': 'TNET'}, {'doc_types': ['10-K']}):
+                assert ranking(sharded.semantic_search(query, top_k=7, **filters)) == \
+                    ranking(unsharded.semantic_search(query, top_k=7, **filters))
+    
+    compare()
+    assert len(sharded._sharded_index[1].shards) > 1
+    
+    # Rows appended later are packed into shards of their own
+    add_documents(vector_kb.db_path, 6, seed=2)
+    vector_kb.vectorize_documents()
+    compare()
+
+
+def test_int8_storage_after_one_document_first_load(db_path):
+    vector_kb = VectorKnowledgeBase(db_path, encoder='hashing', storage='int8')
+    exact = VectorKnowledgeBase(db_path, encoder='hashing')
+    vector_kb.vectorize_documents(limit=1)
+    assert vector_kb.semantic_search(QUERIES[0], top_k=3)
+    
+    vector_kb.vectorize_documents()
+    for query in QUERIES:
+        assert [result['id'] for result in vector_kb.semantic_search(query, top_k=10)] == \
+            [result['id'] for result in exact.semantic_search(query, top_k=10)]
+
+
+@pytest.mark.parametrize('shard_by', [None, 'ticker'])
+def test_vector_store_matches_sqlite(vector_kb, tmp_path, shard_by):
+    path = str(tmp_path / 'vectors.miqv')
+    header = vector_kb.export_vector_store(path)
+    assert header['count'] == count_sections(vector_kb.db_path)
+    
+    from_store = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', vector_store=path, shard_by=shard_by)
+    from_sqlite = VectorKnowledgeBase(vector_kb.db_path, encoder='hashing', shard_by=shard_by)
+    for query in QUERIES:
+        assert ranking(from_store.semantic_search(query, top_k=6)) == \
+            ranking(from_sqlite.semantic_search(query, top_k=6))
+    if shard_by is None:
+        assert isinstance(from_store._doc_index.vectors, np.memmap)
+    
+    # Rows embedded after the export are appended without copying the mapped matrix
+    add_documents(vector_kb.db_path, 5, seed=3)
+    vector_kb.vectorize_documents()
+    for query in QUERIES:
+        assert ranking(from_store.semantic_search(query, top_k=6, ticker='ADP')) == \
+            ranking(from_sqlite.semantic_search(query, top_k=6, ticker='ADP'))
+    if shard_by is None:
+        assert isinstance(from_store._doc_index._data[0], np.memmap)
+
+
+def test_vector_store_exported_from_empty_table(db_path, tmp_path):
+    path = str(tmp_path / 'vectors.miqv')
+    vector_kb = VectorKnowledgeBase(db_path, encoder='hashing')
+    assert vector_kb.export_vector_store(path)['count'] == 0
+    
+    from_store = VectorKnowledgeBase(db_path, encoder='hashing', vector_store=path)
+    assert from_store.semantic_search(QUERIES[0]) == []
+    vector_kb.vectorize_documents(limit=5)
+    assert len(from_store.semantic_search(QUERIES[0], top_k=3)) == 3
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 4096])
+def test_blocked_scan_matches_resident_search(vector_kb, block_size):
+    for filters in ({}, {'ticker': 'WDAY'}, {'ticker': 'ADP', 'doc_types': ['10-K']}):
+        for query in QUERIES:
+            assert ranking(vector_kb.semantic_search(query, top_k=6, index='scan', block_size=block_size,
+                                                     **filters)) == \
+                ranking(vector_kb.semantic_search(query, top_k=6, **filters))
+        
+        many = vector_kb.semantic_search_many(QUERIES, top_k=6, index='scan', block_size=block_size, **filters)
+        assert [ranking(results) for results in many] == \
+            [ranking(vector_kb.semantic_search(query, top_k=6, **filters)) for query in QUERIES]
+
+
+class DeletingCursor:
+    """Cursor that deletes every embedding row once the scan has read its last block."""
+    
+    def __init__(self, cursor):
+        self.cursor = cursor
+    
+    def execute(self, *args):
+        return self.cursor.execute(*args)
+    
+    def fetchall(self):
+        return self.cursor.fetchall()
+    
+    def fetchmany(self, size):
+        rows = self.cursor.fetchmany(size)
+        if not rows:
+            self.cursor.connection.execute('DELETE FROM document_embeddings')
+        return rows
+
+
+def test_blocked_scan_survives_rows_deleted_during_scan(vector_kb):
+    conn = sqlite3.connect(vector_kb.db_path)
+    query_embedding = vector_kb.encoder.encode(QUERIES[0])
+    ids, doc_ids, _ = vector_kb._stream_document_scan(DeletingCursor(conn.cursor()), np.atleast_2d(query_embedding),
+                                                      5, block_size=16)[0]
+    conn.rollback()
+    
+    expected = conn.execute(f"SELECT id, doc_id FROM document_embeddings WHERE id IN ({', '.join('?' * len(ids))})",
+                            ids.tolist()).fetchall()
+    conn.close()
+    assert dict(zip(ids.tolist(), doc_ids.tolist())) == {id: int(doc_id) for id, doc_id in expected}
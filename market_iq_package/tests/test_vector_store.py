@@ -0,0 +1,98 @@
+"""
+Tests for the memory-mapped vector store file format.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from src.vector_store import VectorStore, read_header, write_vector_store
+
+
+@pytest.fixture
+def store_rows():
+    """Columns of a small store: ids, doc_ids, tickers, doc_types and vectors."""
+    rng = np.random.default_rng(5)
+    vectors = rng.normal(size=(50, 24)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    tickers = [['ADP', 'PAYX', 'TNET'][row % 3] for row in range(50)]
+    doc_types = [['10-K', '10-Q'][row % 2] for row in range(50)]
+    return np.arange(1, 51) * 2, np.arange(50) // 4 + 1, tickers, doc_types, vectors
+
+
+def test_round_trip(tmp_path, store_rows):
+    ids, doc_ids, tickers, doc_types, vectors = store_rows
+    path = str(tmp_path / 'vectors.miqv')
+    header = write_vector_store(path, ids, doc_ids, tickers, doc_types, vectors, (100, 7))
+    
+    store = VectorStore(path, verify=True)
+    assert len(store) == 50 and store.dim == 24
+    assert store.source_state == (100, 7)
+    assert read_header(path) == header
+    assert isinstance(store.vectors, np.memmap)
+    assert np.array_equal(store.vectors, vectors)
+    assert np.array_equal(store.ids, ids)
+    assert np.array_equal(store.doc_ids, doc_ids)
+    
+    codes, vocabulary = store.categories('ticker')
+    assert [vocabulary[code] for code in codes] == tickers
+    codes, vocabulary = store.categories('doc_type')
+    assert [vocabulary[code] for code in codes] == doc_types
+
+
+def test_arrays_are_aligned(tmp_path, store_rows):
+    path = str(tmp_path / 'vectors.miqv')
+    header = write_vector_store(path, *store_rows, (100, 7))
+    assert all(spec['offset'] % 64 == 0 for spec in header['arrays'].values())
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / 'empty.miqv')
+    header = write_vector_store(path, [], [], [], [], np.empty((0, 24), dtype=np.float32), (0, 0))
+    
+    store = VectorStore(path, verify=True)
+    assert header['count'] == 0 and len(store) == 0
+    assert store.vectors.shape == (0, 24)
+
+
+def test_rewrite_replaces_file(tmp_path, store_rows):
+    ids, doc_ids, tickers, doc_types, vectors = store_rows
+    path = str(tmp_path / 'vectors.miqv')
+    write_vector_store(path, ids, doc_ids, tickers, doc_types, vectors, (100, 7))
+    write_vector_store(path, ids[:10], doc_ids[:10], tickers[:10], doc_types[:10], vectors[:10], (120, 9))
+    
+    store = VectorStore(path, verify=True)
+    assert len(store) == 10 and store.source_state == (120, 9)
+    assert not os.path.exists(f'{path}.tmp')
+
+
+def test_rejects_other_files(tmp_path):
+    path = str(tmp_path / 'other.bin')
+    with open(path, 'wb') as f:
+        f.write(b'not a vector store at all')
+    with pytest.raises(ValueError):
+        VectorStore(path)
+
+
+def test_rejects_truncated_file(tmp_path, store_rows):
+    path = str(tmp_path / 'vectors.miqv')
+    write_vector_store(path, *store_rows, (100, 7))
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 100)
+    with pytest.raises(ValueError, match='Truncated'):
+        VectorStore(path)
+
+
+def test_verify_detects_corrupt_array(tmp_path, store_rows):
+    path = str(tmp_path / 'vectors.miqv')
+    header = write_vector_store(path, *store_rows, (100, 7))
+    with open(path, 'r+b') as f:
+        f.seek(header['arrays']['vectors']['offset'] + 10)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+    
+    VectorStore(path)
+    with pytest.raises(ValueError, match='Checksum'):
+        VectorStore(path, verify=True)
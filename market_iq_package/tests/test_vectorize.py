@@ -0,0 +1,109 @@
+"""
+Tests for document vectorization: batched encoding and writes, incremental re-runs and
+worker processes.
+"""
+
+import shutil
+import sqlite3
+
+import pytest
+
+from src.vector_kb import VectorKnowledgeBase
+
+
+def embedding_rows(db_path):
+    """(doc_id, section_id) -> (row id, content hash) of every embedded section."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT doc_id, section_id, id, content_hash FROM document_embeddings').fetchall()
+    conn.close()
+    return {(row[0], row[1]): row[2:] for row in rows}
+
+
+def stored_sections(db_path):
+    """(doc_id, section_id) -> (section_title, section_content, embedding) of every embedded section."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''
+        SELECT doc_id, section_id, section_title, section_content, embedding FROM document_embeddings
+    ''').fetchall()
+    conn.close()
+    return {(row[0], row[1]): row[2:] for row in rows}
+
+
+def edit_document(db_path, doc_id):
+    """Append a sentence to a document's content."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE documents SET content = content || ' Revised outlook for margins.' WHERE id = ?", (doc_id,))
+    conn.commit()
+    conn.close()
+
+
+def test_batch_sizes_do_not_change_stored_sections(db_path, tmp_path):
+    copy = str(tmp_path / 'copy.db')
+    shutil.copy(db_path, copy)
+    
+    VectorKnowledgeBase(db_path, encoder='hashing').vectorize_documents()
+    VectorKnowledgeBase(copy, encoder='hashing').vectorize_documents(batch_size=5, commit_every=7, fetch_size=3)
+    assert stored_sections(copy) == stored_sections(db_path)
+
+
+def test_sections_are_encoded_one_batch_per_call(db_path, monkeypatch):
+    vector_kb = VectorKnowledgeBase(db_path, encoder='hashing')
+    sizes = []
+    encode = vector_kb.encoder.encode
+    monkeypatch.setattr(vector_kb.encoder, 'encode',
+                        lambda texts, **kwargs: sizes.append(len(texts)) or encode(texts, **kwargs))
+    
+    stats = vector_kb.vectorize_documents(batch_size=16)
+    assert stats['inserted'] > 16
+    assert sum(sizes) == stats['inserted']
+    assert len(sizes) == -(-stats['inserted'] // 16)
+
+
+def test_rerun_without_changes_embeds_nothing(vector_kb, monkeypatch):
+    before = embedding_rows(vector_kb.db_path)
+    monkeypatch.setattr(vector_kb.encoder, 'encode', lambda *args, **kwargs: pytest.fail('encoded a section'))
+    
+    stats = vector_kb.vectorize_documents()
+    assert stats['inserted'] == stats['updated'] == stats['deleted'] == 0
+    assert stats['unchanged'] == len(before)
+    assert embedding_rows(vector_kb.db_path) == before
+
+
+def test_rerun_updates_only_changed_documents(vector_kb):
+    before = embedding_rows(vector_kb.db_path)
+    edit_document(vector_kb.db_path, 3)
+    conn = sqlite3.connect(vector_kb.db_path)
+    conn.execute('DELETE FROM documents WHERE id = 5')
+    conn.commit()
+    conn.close()
+    
+    stats = vector_kb.vectorize_documents()
+    after = embedding_rows(vector_kb.db_path)
+    assert stats['updated'] >= 1 and stats['inserted'] == 0
+    assert stats['deleted'] == sum(1 for key in before if key[0] == '5')
+    
+    for key, (row_id, content_hash) in before.items():
+        if key[0] == '5':
+            assert key not in after
+        elif key[0] != '3':
+            assert after[key] == (row_id, content_hash)
+    changed = [key for key in before if key[0] == '3' and after[key][1] != before[key][1]]
+    assert changed and all(after[key][0] == before[key][0] for key in changed)
+
+
+def test_workers_store_the_same_sections(db_path, tmp_path):
+    copy = str(tmp_path / 'copy.db')
+    shutil.copy(db_path, copy)
+    serial = VectorKnowledgeBase(db_path, encoder='hashing')
+    parallel = VectorKnowledgeBase(copy, encoder='hashing')
+    
+    assert parallel.vectorize_documents(workers=2, fetch_size=4) == serial.vectorize_documents()
+    assert stored_sections(copy) == stored_sections(db_path)
+    
+    # Re-runs stay incremental when the workers hash and encode
+    edit_document(db_path, 7)
+    edit_document(copy, 7)
+    stats = parallel.vectorize_documents(workers=2, fetch_size=4)
+    assert stats == serial.vectorize_documents()
+    assert stats['updated'] >= 1 and stats['inserted'] == 0
+    assert stored_sections(copy) == stored_sections(db_path)